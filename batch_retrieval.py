@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+批量检索：把整批查询分给多个进程并行处理
+
+索引和模型只在父进程构建一次，worker 用 fork 继承（写时复制，不做 pickle 拷贝）；
+mmap 的倒排 buffer 在所有进程间真正共享。结果按输入顺序返回，
+与 worker 完成先后无关，写出的 run 文件是确定的。
+"""
+
+import os
+
+# fork 前设置，worker 继承
+_search = None
+_tokenize = None
+_topk = None
+
+# WandSearcher / ImpactSearcher 的累计计数；worker 里的增量带回父进程汇总
+COUNTERS = ('num_queries', 'num_scored', 'num_complete')
+
+def _owner(search):
+    # search 若是 WandSearcher.query 这类绑定方法，返回其对象以便汇总计数
+    return getattr(search, '__self__', None)
+
+def _counters(owner):
+    return {c: getattr(owner, c) for c in COUNTERS if hasattr(owner, c)}
+
+def _run_chunk(chunk):
+    owner = _owner(_search)
+    before = _counters(owner)
+    out = []
+    for qid, text in chunk:
+        out.append((qid, _search(_tokenize(text), topk=_topk)))
+    return out, {c: v - before[c] for c, v in _counters(owner).items()}
+
+def iter_retrieve(search, tokenize, queries, topk=1000, workers=None, chunk_size=4):
+    """
+    queries: [(qid, text)]；search(q_tokens, topk) -> [(idx, score)]
+    逐个产出 (qid, hits)，顺序与 queries 相同；下游可以边检索边评测/写文件
+    workers=None 用全部 CPU；workers<=1 或平台不支持 fork 时在本进程串行执行
+    """
+    global _search, _tokenize, _topk
+    import multiprocessing      # 串行时不必导入
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(queries))
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        for qid, text in queries:
+            yield qid, search(tokenize(text), topk=topk)
+        return
+
+    # 先在父进程分一次词，让 jieba 等词典在 fork 前加载好，worker 直接继承
+    tokenize(queries[0][1])
+    _search, _tokenize, _topk = search, tokenize, topk
+    chunks = [queries[i:i + chunk_size] for i in range(0, len(queries), chunk_size)]
+    totals = {}
+    try:
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for part, counts in pool.imap(_run_chunk, chunks):
+                for c, v in counts.items():
+                    totals[c] = totals.get(c, 0) + v
+                yield from part
+    finally:
+        _search = _tokenize = _topk = None
+
+    owner = _owner(search)
+    for c, v in totals.items():
+        setattr(owner, c, getattr(owner, c) + v)
+
+def batch_retrieve(search, tokenize, queries, topk=1000, workers=None, chunk_size=4):
+    """
+    返回 [(qid, hits)]，顺序与 queries 相同
+    """
+    return list(iter_retrieve(search, tokenize, queries, topk, workers, chunk_size))
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+检索与评测性能基准（合成数据，不需要 STARD）
+
+    python benchmark.py --docs 5000 --queries 200 --out bench.json
+    python benchmark.py --docs 5000 --queries 200 --baseline bench.json
+
+合成语料：词频服从 Zipf 分布的 token 列表；每个查询从一篇目标文档里抽几个词，
+qrels 为目标文档（外加几篇随机文档）。同样的参数 + seed 生成的数据完全相同。
+测量：
+  index        CorpusIndex.build 耗时（倒排 + 分词语料）
+  models       每个模型的构建耗时、单查询延迟 p50/p95/p99、QPS、进程峰值 RSS
+  eval         evaluate_metrics 评测 run 文件的吞吐（行/秒），python / stream / numpy 引擎
+  startup      新解释器里 import evaluate_metrics / make_run 的耗时（python_s 为空解释器）
+每个模型在 fork 出的子进程里构建和检索，峰值 RSS 不受前一个模型影响（会包含 fork 时
+继承的语料与索引，见 base_rss_mb）。缺依赖的模型记为 skipped。
+以上全部测量轮流跑 --repeat 轮（默认 3），每项取各轮中最好的一次，延迟按查询逐个取最快；
+机器一时变慢只影响其中一轮。
+结果写成 JSON；给了 --baseline 时逐项对比，耗时/内存变大或吞吐变小超过 --tolerance、
+且绝对变化也超过 --min-delta-ms（总耗时与吞吐项还要超过同组基线总耗时的 --min-share）
+或 --min-delta-mb 才记为回归，亚毫秒级的数字和启动耗时的抖动不会触发；有回归时退出码为 1。
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import accumulate
+from common import write_run
+from evaluate_metrics import evaluate_run, load_relevance, load_run
+from index_store import CorpusIndex
+from make_run import K_VALUES
+from profiling import peak_rss_mb
+from retrieval_models import MODELS
+
+FORMAT_VERSION = 1
+
+# ———— 合成数据 ————
+def make_corpus(n_docs, doc_len=120, vocab=20000, zipf=1.1, seed=0):
+    """
+    返回 (doc_ids, docs)；docs 为 token 列表，词频服从 Zipf 分布，文档长度在 doc_len 的 0.5~1.5 倍之间
+    """
+    rng = random.Random(seed)
+    terms = [f"t{i}" for i in range(vocab)]
+    cum = list(accumulate(1 / (r + 1) ** zipf for r in range(vocab)))
+    docs = [rng.choices(terms, cum_weights=cum, k=rng.randint(doc_len // 2, doc_len * 3 // 2))
+            for _ in range(n_docs)]
+    doc_ids = [f"d{i}" for i in range(n_docs)]
+    return doc_ids, docs
+
+def make_queries(doc_ids, docs, n_queries, q_len=(2, 6), extra_rel=2, seed=0):
+    """
+    返回 (queries, qrels)：queries 为 [(qid, q_tokens)]，qrels 格式同 evaluate_metrics.load_relevance
+    """
+    rng = random.Random(seed + 1)
+    queries, qrels = [], {}
+    for i in range(n_queries):
+        qid = f"q{i}"
+        target = rng.randrange(len(docs))
+        d = docs[target]
+        queries.append((qid, rng.sample(d, min(len(d), rng.randint(*q_len)))))
+        rel = {doc_ids[target]: 1}
+        for _ in range(rng.randint(0, extra_rel)):
+            rel[doc_ids[rng.randrange(len(docs))]] = 1
+        qrels[qid] = rel
+    return queries, qrels
+
+# ———— 测量工具 ————
+def percentile(sorted_xs, p):
+    """
+    最近秩法（nearest-rank）分位数
+    """
+    if not sorted_xs:
+        return 0.0
+    k = max(0, min(len(sorted_xs) - 1, -(-len(sorted_xs) * p // 100) - 1))
+    return sorted_xs[int(k)]
+
+# fork 前设置，子进程继承
+_corpus = None
+_queries = None
+_opts = None
+
+def _bench_model(name, want_hits):
+    """
+    一轮：构建、prepare、整个查询集跑一遍；返回 (原始计时, hits 或 None)，lat 为每个查询的秒数
+    """
+    cls = MODELS[name]
+    raw = {'base_rss_mb': peak_rss_mb()}
+    t0 = time.perf_counter()
+    try:
+        model = cls(_corpus, **_opts['model'])
+    except ImportError as e:
+        return {'skipped': f"missing dependency: {e.name or e}"}, None
+    t1 = time.perf_counter()
+    model.prepare(q for _, q in _queries)
+    t2 = time.perf_counter()
+    lat, hits = [], {}
+    for qid, q in _queries:
+        s = time.perf_counter()
+        hits[qid] = model.search(q, topk=_opts['topk'])
+        lat.append(time.perf_counter() - s)
+    raw.update({'build_s': t1 - t0, 'prepare_s': t2 - t1, 'lat': lat, 'peak_rss_mb': peak_rss_mb()})
+    return raw, hits if want_hits else None
+
+def bench_model(name, want_hits=False):
+    """
+    支持 fork 时在子进程里跑，峰值 RSS 只反映这一个模型
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return _bench_model(name, want_hits)
+    with multiprocessing.get_context('fork').Pool(1) as pool:
+        return pool.apply(_bench_model, (name, want_hits))
+
+def merge_rounds(best, raw):
+    """
+    多轮取最快：各项取最小值，lat 逐个查询取最小值
+    """
+    if best is None:
+        return raw
+    out = {k: min(v, raw[k]) for k, v in best.items() if k != 'lat'}
+    out['lat'] = [min(a, b) for a, b in zip(best['lat'], raw['lat'])]
+    return out
+
+def summarize(raw):
+    """
+    原始计时 -> 报告里的 models.<name> 项
+    """
+    lat = sorted(raw['lat'])
+    total = sum(lat)
+    return {
+        'base_rss_mb': raw['base_rss_mb'],
+        'build_s': raw['build_s'],
+        'prepare_s': raw['prepare_s'],
+        'query_total_s': total,
+        'latency_ms': {p: 1000 * percentile(lat, q)
+                       for p, q in (('p50', 50), ('p95', 95), ('p99', 99))},
+        'latency_mean_ms': 1000 * total / len(lat) if lat else 0.0,
+        'qps': len(lat) / total if total else 0.0,
+        'peak_rss_mb': raw['peak_rss_mb'],
+    }
+
+def bench_eval(qrels_path, run_path, repeat=3):
+    """
+    评测吞吐：各方式轮流跑 repeat 轮，每种方式取最快的一次
+    """
+    with open(run_path, encoding='utf-8') as f:
+        lines = sum(1 for _ in f)
+    qrels = load_relevance(qrels_path)
+    ways = {
+        'python': lambda: evaluate_run(qrels, run_path, K_VALUES),
+        'stream': lambda: evaluate_run(qrels, run_path, K_VALUES, stream=True),
+    }
+    try:
+        from vector_metrics import evaluator_np
+        ways['numpy'] = lambda: evaluator_np(qrels, load_run(run_path), K_VALUES)
+    except ImportError:
+        pass
+    best = {}
+    for _ in range(repeat):
+        for name, fn in ways.items():
+            t = _timed(fn)
+            best[name] = min(best.get(name, t), t)
+    out = {'run_lines': lines}
+    for name, t in best.items():
+        out[name] = {'seconds': t, 'lines_per_s': lines / t if t else 0.0}
+    return out
+
+def _timed(fn):
+    t = time.perf_counter()
+    fn().results()
+    return time.perf_counter() - t
+
+def bench_startup(repeat=5):
+    """
+    启动耗时：每项起 repeat 个新解释器，取最快的一次
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = {}
+    for name, code in (('python', 'pass'), ('evaluate_metrics', 'import evaluate_metrics'),
+                       ('make_run', 'import make_run')):
+        best = None
+        for _ in range(repeat):
+            t = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=here, check=True)
+            t = time.perf_counter() - t
+            best = t if best is None else min(best, t)
+        out[name + '_s'] = best
+    return out
+
+def keep_best(best, new, prefix=''):
+    """
+    多轮结果逐项取最好的一次：耗时/内存取最小，吞吐取最大，规模信息取最新
+    """
+    if best is None:
+        return new
+    out = {}
+    for k, v in new.items():
+        key = prefix + k
+        if isinstance(v, dict):
+            out[k] = keep_best(best.get(k), v, key + '.')
+        elif k in best and isinstance(v, (int, float)) and not isinstance(v, bool):
+            sign = direction(key)
+            out[k] = max(best[k], v) if sign > 0 else min(best[k], v) if sign < 0 else v
+        else:
+            out[k] = v
+    return out
+
+def run_benchmark(args):
+    global _corpus, _queries, _opts
+    doc_ids, docs = make_corpus(args.docs, args.doc_len, args.vocab, args.zipf, args.seed)
+    queries, qrels = make_queries(doc_ids, docs, args.queries, seed=args.seed)
+    del docs
+    opts = {'backend': args.backend, 'pruning': args.pruning}
+    results, raws, corpus, run_hits = None, {name: None for name in args.models}, None, None
+    with tempfile.TemporaryDirectory() as tmp:
+        qrels_path = os.path.join(tmp, 'qrels')
+        with open(qrels_path, 'w', encoding='utf-8') as f:
+            for qid, rel in qrels.items():
+                for docid, r in rel.items():
+                    f.write(f"{qid} 0 {docid} {r}\n")
+        run_path = os.path.join(tmp, 'run')
+        # 全部测量轮流跑 repeat 轮：机器一时变慢只影响其中一轮，每项、每个查询取各轮中最好的
+        for _ in range(args.repeat):
+            part = {'startup': bench_startup(args.startup_repeat)}
+            # 语料每轮重新生成（数据相同），建完索引即释放，不计入模型子进程的 RSS
+            docs = make_corpus(args.docs, args.doc_len, args.vocab, args.zipf, args.seed)[1]
+            t = time.perf_counter()
+            index = CorpusIndex.build(doc_ids, docs)
+            part['index'] = {'build_s': time.perf_counter() - t,
+                             'N': index.N, 'V': len(index.index.terms),
+                             'num_postings': len(index.index.post_ids)}
+            del docs
+            if corpus is None:
+                corpus = index
+            del index
+
+            _corpus, _queries, _opts = corpus, queries, {'model': opts, 'topk': args.topk}
+            try:
+                for name in args.models:
+                    if raws[name] is not None and 'skipped' in raws[name]:
+                        continue
+                    raw, hits = bench_model(name, want_hits=run_hits is None)
+                    raws[name] = raw if 'skipped' in raw else merge_rounds(raws[name], raw)
+                    if hits is not None:
+                        # 第一个跑成功的模型的结果写成 run 文件，测评测吞吐
+                        run_hits = hits
+                        write_run(run_path, list(run_hits.items()), doc_ids, 'BENCH')
+            finally:
+                _corpus = _queries = _opts = None
+            if run_hits is not None:
+                part['eval'] = bench_eval(qrels_path, run_path, args.eval_repeat)
+            results = keep_best(results, part)
+
+    results['models'] = {}
+    for name in args.models:
+        res = raws[name] if 'skipped' in raws[name] else summarize(raws[name])
+        results['models'][name] = res
+        print(f"  {name}: " + (res['skipped'] if 'skipped' in res else
+              f"build {res['build_s']:.2f}s, p50 {res['latency_ms']['p50']:.2f}ms, "
+              f"{res['qps']:.1f} qps, peak RSS {res['peak_rss_mb']:.0f} MB"), file=sys.stderr)
+    return results
+
+# ———— 与基线对比 ————
+def flatten(d, prefix=''):
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(flatten(v, key + '.'))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+def direction(key):
+    """
+    1: 越大越好；-1: 越小越好；0: 不比较（规模信息）
+    """
+    parts = key.split('.')
+    if parts[-1] in ('qps', 'lines_per_s'):
+        return 1
+    if parts[-1].endswith(('_s', '_ms')) or parts[-1] in ('seconds', 'peak_rss_mb') \
+            or 'latency_ms' in parts:
+        return -1
+    return 0
+
+# 吞吐项对应的总耗时项，吞吐的绝对变化按它算
+RATE_TIME = {'qps': 'query_total_s', 'lines_per_s': 'seconds'}
+
+def is_total_time(last):
+    return last not in RATE_TIME and (last.endswith('_s') or last == 'seconds')
+
+def section(key):
+    """
+    models.<name>.* 以模型为一组，其余按第一级分组
+    """
+    parts = key.split('.')
+    return '.'.join(parts[:2]) if parts[0] == 'models' else parts[0]
+
+def compare(current, baseline, tolerance=0.2, min_delta_ms=1.0, min_share=0.05, min_delta_mb=2.0):
+    """
+    返回 [(key, 基线值, 当前值, 相对变化, 是否回归)]；相对变化为正表示变差。
+    相对变化超过 tolerance 且绝对变化也够大才算回归：延迟项至少 min_delta_ms 毫秒；
+    总耗时项（及对应的吞吐项）至少 min_delta_ms 毫秒、且至少为同组基线总耗时的 min_share；
+    内存项至少 min_delta_mb
+    """
+    cur, base = flatten(current), flatten(baseline)
+    totals = {}
+    for key, v in base.items():
+        if is_total_time(key.rpartition('.')[2]):
+            totals[section(key)] = totals.get(section(key), 0.0) + 1000 * v
+    rows = []
+    for key, new in cur.items():
+        sign = direction(key)
+        old = base.get(key)
+        if not sign or old is None or old == 0:
+            continue
+        worse = (old - new) / old if sign > 0 else (new - old) / old
+        prefix, _, last = key.rpartition('.')
+        if last in RATE_TIME:
+            time_key = f"{prefix}.{RATE_TIME[last]}"
+            delta = 1000 * (cur.get(time_key, 0.0) - base.get(time_key, 0.0))
+            floor = max(min_delta_ms, min_share * totals.get(section(key), 0.0))
+        elif last.endswith('_mb'):
+            delta, floor = new - old, min_delta_mb
+        elif is_total_time(last):
+            delta = 1000 * (new - old)
+            floor = max(min_delta_ms, min_share * totals.get(section(key), 0.0))
+        else:
+            delta, floor = new - old, min_delta_ms
+        rows.append((key, old, new, worse, worse > tolerance and delta > floor))
+    return rows
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="benchmark retrieval models and evaluation on synthetic data")
+    p.add_argument("--docs", type=int, default=5000)
+    p.add_argument("--doc-len", type=int, default=120, help="mean document length in tokens")
+    p.add_argument("--vocab", type=int, default=20000)
+    p.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of term frequencies")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--topk", type=int, default=1000)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--models", default="bm25p,bm25,tfidf,ql",
+                   help=f"comma-separated, any of: {','.join(MODELS)}")
+    p.add_argument("--backend", choices=["python", "numpy"], default="python")
+    p.add_argument("--pruning", action="store_true", help="WAND instead of exhaustive scoring")
+    p.add_argument("--repeat", type=int, default=3, help="rounds of all measurements, the best figure of each is kept (default 3)")
+    p.add_argument("--eval-repeat", type=int, default=3)
+    p.add_argument("--startup-repeat", type=int, default=5)
+    p.add_argument("--out", default="bench.json", help="where to write the JSON results")
+    p.add_argument("--baseline", help="earlier JSON results to compare against")
+    p.add_argument("--tolerance", type=float, default=0.2,
+                   help="relative slowdown counted as a regression (default 0.2 = 20%%)")
+    p.add_argument("--min-delta-ms", type=float, default=1.0,
+                   help="ignore slowdowns smaller than this many milliseconds (default 1)")
+    p.add_argument("--min-share", type=float, default=0.05,
+                   help="ignore changes of a total time smaller than this share of its group's "
+                        "baseline total, e.g. a model's build+prepare+query time (default 0.05)")
+    p.add_argument("--min-delta-mb", type=float, default=2.0,
+                   help="ignore memory growth smaller than this many MB (default 2)")
+    args = p.parse_args(argv)
+    args.models = [m for m in args.models.split(',') if m]
+    if args.repeat < 1:
+        p.error("--repeat must be at least 1")
+    for m in args.models:
+        if m not in MODELS:
+            p.error(f"unknown model {m}")
+
+    config = {k: getattr(args, k) for k in ('docs', 'doc_len', 'vocab', 'zipf', 'queries', 'topk',
+                                            'seed', 'models', 'backend', 'pruning', 'repeat')}
+    print(f"benchmark: {args.docs} docs, {args.queries} queries", file=sys.stderr)
+    report = {
+        'version': FORMAT_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': config,
+        'results': run_benchmark(args),
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(json.dumps(report['results'], indent=1))
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print("warning: baseline was run with a different configuration", file=sys.stderr)
+        rows = compare(report['results'], baseline['results'], args.tolerance,
+                       args.min_delta_ms, args.min_share, args.min_delta_mb)
+        print(f"\n{'metric':<40}{'baseline':>12}{'current':>12}{'change':>9}")
+        for key, old, new, worse, bad in rows:
+            print(f"{key:<40}{old:>12.4g}{new:>12.4g}{(new - old) / old:>+9.1%}"
+                  + ("  REGRESSION" if bad else ""))
+        n_bad = sum(bad for *_, bad in rows)
+        print(f"\n{n_bad} regression(s) beyond {args.tolerance:.0%} "
+              f"(and {args.min_delta_ms:g} ms / {args.min_share:.0%} of the group total / "
+              f"{args.min_delta_mb:g} MB)")
+        if n_bad:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
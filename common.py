@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+各 make_*_run 脚本共用的分词、语料/查询/qrels 读取与当场评测
+"""
+
+import json
+import queue
+import threading
+from collections import defaultdict
+from index_store import CHUNK_SIZE, load_jieba, load_or_build, tokenizer_config
+from profiling import profiled, stage
+from run_format import write_run_bin
+
+# 停用词（如有需要可扩充）
+STOPWORDS = set(['\n',' ','\t','，','。','（','）','：','“','”'])
+
+# jieba 到第一次真正分词时才导入（语料与查询都命中缓存时完全不需要）
+_lcut = None
+
+def _jieba_lcut(text):
+    global _lcut
+    if _lcut is None:
+        _lcut = load_jieba().lcut
+    return _lcut(text)
+
+def tokenize_raw(text):
+    # 即 jieba.lcut；包成模块级函数以便传给分词进程
+    return _jieba_lcut(text)
+
+def filter_tokens(tokens):
+    return [w for w in tokens if w.strip() and w not in STOPWORDS]
+
+def tokenize(text):
+    return filter_tokens(_jieba_lcut(text))
+
+# 分词方式 -> (分词函数, 配置名)
+TOKENIZERS = {
+    'raw':   (tokenize_raw, 'jieba.lcut'),
+    'strip': (tokenize, 'jieba.lcut+strip'),
+}
+
+def config_of(tokenizer):
+    """
+    分词方式 -> 缓存用的分词配置（见 index_store.tokenizer_config）
+    """
+    return tokenizer_config(TOKENIZERS[tokenizer][1], STOPWORDS if tokenizer == 'strip' else None)
+
+def load_corpus(path, tokenizer='strip', workers=None, chunk_size=CHUNK_SIZE, raw=None, ram_mb=None):
+    """
+    返回 index_store.CorpusIndex（doc_ids / index / docs()），结果缓存在 .index_cache
+    未命中缓存时用 workers 个进程并行分词（None 为全部 CPU）；
+    'strip' 可由已载入的 'raw' 语料（参数 raw）过滤得到，不必再跑一遍 jieba
+    ram_mb 给出时不经 raw 派生，改用 spimi_index 流式建索引，内存约不超过 ram_mb
+    """
+    fn = TOKENIZERS[tokenizer][0]
+    config = config_of(tokenizer)
+    builder = None
+    if tokenizer == 'strip' and raw is not None and ram_mb is None:
+        builder = lambda: (raw.doc_ids, [filter_tokens(raw.tokens(i)) for i in range(raw.N)])
+    with stage(f'load_corpus[{tokenizer}]'):
+        return load_or_build(path, fn, config, workers=workers, chunk_size=chunk_size,
+                             builder=builder, ram_mb=ram_mb)
+
+@profiled('load_queries')
+def load_queries(dev_txt, queries_json):
+    dev_ids = set()
+    with open(dev_txt, encoding='utf-8') as f:
+        for L in f:
+            qid,_ = L.strip().split('\t',1)
+            dev_ids.add(str(qid))
+    qs = []
+    with open(queries_json, encoding='utf-8') as f:
+        for obj in json.load(f):
+            qid = str(obj.get('query_id'))
+            if qid in dev_ids:
+                qs.append((qid, obj['问题']))
+    return qs
+
+def load_qrels(path):
+    """
+    读取 qrels 文件 (<qid> 0 <docid> <rel>)，只保留 rel>0
+    返回 dict: qid -> set(docid)
+    """
+    qrels = defaultdict(set)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) != 4:
+                continue
+            qid, _, docid, rel = parts
+            if int(rel) > 0:
+                qrels[qid].add(docid)
+    return qrels
+
+def micro_recall_at_K(qrels, runs, K):
+    """
+    micro‑recall@K = (∑_q |retrieved∩relevant|) / (∑_q |relevant|)
+    """
+    total_rel = sum(len(rset) for rset in qrels.values())
+    total_ret = 0
+    for qid, rel_docs in qrels.items():
+        retrieved = [d for d,_ in runs.get(qid, [])[:K]]
+        total_ret += sum(1 for d in retrieved if d in rel_docs)
+    return total_ret / total_rel if total_rel else 0.0
+
+def write_run(path, results, doc_ids, tag, fmt='trec'):
+    """
+    results: [(qid, [(doc 下标, score)])]，按给定顺序写 run 文件
+    fmt: 'trec' 文本；'bin' 为 run_format 的二进制列式格式
+    返回 runs: qid -> [(docid, score)]，供当场评测
+    """
+    runs = {}
+    if fmt == 'bin':
+        write_run_bin(path, results, doc_ids, tag)
+        for qid, hits in results:
+            runs[qid] = [(doc_ids[idx], score) for idx, score in hits]
+        return runs
+    with open(path, 'w', encoding='utf-8') as out:
+        for qid, hits in results:
+            runs[qid] = [(doc_ids[idx], score) for idx, score in hits]
+            for rank, (idx, score) in enumerate(hits, start=1):
+                out.write(f"{qid} Q0 {doc_ids[idx]} {rank} {score:.6f} {tag}\n")
+    return runs
+
+class RunWriter:
+    """
+    异步写 run 文件：put() 只是入队，由后台线程写盘，检索不必等磁盘
+    fmt='trec' 时逐 query 写出；'bin' 是列式格式，收齐后在后台线程一次写出
+    close() 等写完；后台线程出错时在 close() 里重新抛出
+    """
+    def __init__(self, path, doc_ids, tag, fmt='trec'):
+        self.path, self.doc_ids, self.tag, self.fmt = path, doc_ids, tag, fmt
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._drain, name='run-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, qid, hits):
+        self._queue.put((qid, hits))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _items(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            yield item
+
+    def _drain(self):
+        try:
+            if self.fmt == 'bin':
+                write_run_bin(self.path, list(self._items()), self.doc_ids, self.tag)
+                return
+            doc_ids, tag = self.doc_ids, self.tag
+            with open(self.path, 'w', encoding='utf-8') as out:
+                for qid, hits in self._items():
+                    out.write(''.join(f"{qid} Q0 {doc_ids[idx]} {rank} {score:.6f} {tag}\n"
+                                      for rank, (idx, score) in enumerate(hits, start=1)))
+        except Exception as e:
+            self.error = e
+            # 把剩下的取完，put() 不会堆积
+            for _ in self._items():
+                pass
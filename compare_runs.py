@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多个 run 的对比评测与显著性检验
+
+qrels 只读取、索引一次，多个 run 分给进程池并行评测（fork 继承 qrels，不做 pickle 拷贝），
+输出各 run 的汇总指标对照表，以及每个 run 相对基线的配对检验：
+  t      配对 t 检验
+  rand   随机化（sign-flip permutation）检验
+  boot   bootstrap 检验（shift 法）
+随机化与 bootstrap 用 NumPy 一次生成整块随机矩阵，万次重采样在秒级完成。
+per-query 指标见 evaluate_metrics.Evaluator.per_query；对照表的汇总值就是它们的平均，
+检验与对照表用的是同一套定义（map 为标准 AP，与 trec_eval -q 相同）。
+检验把所有 run 对齐到 qrels 中有相关文档的 query，run 中缺失的 query 记为 0（同 trec_eval -c），
+所以只有 run 缺 query 时检验行的均值才会小于对照表。
+"""
+
+import multiprocessing
+import os
+from evaluate_metrics import Evaluator, PER_QUERY_METRICS, index_relevance, load_relevance, load_run
+
+TESTS = ('t', 'rand', 'boot')
+
+# fork 前设置，worker 继承
+_qrels = None
+_index = None
+_Ks = None
+
+def _evaluate(path):
+    ev = Evaluator(_qrels, _Ks, index=_index)
+    for qid, retrieved in load_run(path).items():
+        ev.add(qid, retrieved)
+    return ev.results(), ev.per_query
+
+def evaluate_runs(qrels, paths, Ks, workers=None):
+    """
+    返回 [(results, per_query)]，顺序与 paths 相同
+    workers=None 用全部 CPU；workers<=1 或平台不支持 fork 时串行
+    """
+    global _qrels, _index, _Ks
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(paths))
+    _qrels, _index, _Ks = qrels, index_relevance(qrels), Ks
+    try:
+        if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return [_evaluate(p) for p in paths]
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            return pool.map(_evaluate, paths, chunksize=1)
+    finally:
+        _qrels = _index = _Ks = None
+
+def expand_runs(args):
+    """
+    参数里的目录展开为其下的文件（按文件名排序），文件原样保留
+    """
+    paths = []
+    for a in args:
+        if os.path.isdir(a):
+            paths.extend(os.path.join(a, n) for n in sorted(os.listdir(a))
+                         if os.path.isfile(os.path.join(a, n)))
+        else:
+            paths.append(a)
+    return paths
+
+def paired_scores(per_query, qrels, metric):
+    """
+    所有 run 对齐到同一组 query（qrels 中有相关文档的 query），返回 (qids, (n_runs, n_q) 数组)
+    """
+    import numpy as np
+    qids = sorted(q for q, grades in qrels.items() if any(r > 0 for r in grades.values()))
+    X = np.array([[pq[q][metric] if q in pq else 0.0 for q in qids] for pq in per_query])
+    return qids, X
+
+# ———— 配对显著性检验，x/y 为同一组 query 上的得分 ————
+def t_test(x, y):
+    import numpy as np
+    from scipy import stats
+    d = np.asarray(y, dtype=np.float64) - np.asarray(x, dtype=np.float64)
+    n = len(d)
+    if n < 2:
+        return 1.0
+    sd = d.std(ddof=1)
+    if sd == 0:
+        return 1.0 if d.mean() == 0 else 0.0
+    t = d.mean() / (sd / np.sqrt(n))
+    return float(2 * stats.t.sf(abs(t), n - 1))
+
+def randomization_test(x, y, trials=10000, seed=0, block=1000):
+    """
+    双侧随机化检验：每次独立地随机交换每个 query 上两个 run 的得分（差值取反）
+    """
+    import numpy as np
+    d = np.asarray(y, dtype=np.float64) - np.asarray(x, dtype=np.float64)
+    n = len(d)
+    if n == 0:
+        return 1.0
+    rng = np.random.default_rng(seed)
+    observed = abs(d.mean())
+    eps = 1e-12 * max(1.0, observed)
+    count, done = 0, 0
+    while done < trials:
+        m = min(block, trials - done)
+        signs = rng.integers(0, 2, size=(m, n), dtype=np.int8) * 2 - 1
+        means = np.abs(signs @ d) / n
+        count += int(np.count_nonzero(means >= observed - eps))
+        done += m
+    return (count + 1) / (trials + 1)
+
+def bootstrap_test(x, y, trials=10000, seed=0, block=1000):
+    """
+    双侧 bootstrap 检验：差值平移到均值 0 后有放回重采样
+    """
+    import numpy as np
+    d = np.asarray(y, dtype=np.float64) - np.asarray(x, dtype=np.float64)
+    n = len(d)
+    if n == 0:
+        return 1.0
+    rng = np.random.default_rng(seed)
+    observed = abs(d.mean())
+    z = d - d.mean()
+    eps = 1e-12 * max(1.0, observed)
+    count, done = 0, 0
+    while done < trials:
+        m = min(block, trials - done)
+        means = np.abs(z[rng.integers(0, n, size=(m, n))].mean(axis=1))
+        count += int(np.count_nonzero(means >= observed - eps))
+        done += m
+    return (count + 1) / (trials + 1)
+
+def significance(x, y, tests=TESTS, trials=10000, seed=0):
+    out = {}
+    if 't' in tests:
+        out['t'] = t_test(x, y)
+    if 'rand' in tests:
+        out['rand'] = randomization_test(x, y, trials, seed)
+    if 'boot' in tests:
+        out['boot'] = bootstrap_test(x, y, trials, seed)
+    return out
+
+# ———— 输出 ————
+def print_table(names, results, Ks):
+    rows = [('num_q', 'num_q', 'd'), ('num_ret', 'num_ret', 'd'), ('num_rel', 'num_rel', 'd'),
+            ('num_rel_ret', 'num_rel_ret', 'd'), ('map', 'map', '.4f'), ('P_10', 'P_10', '.4f')]
+    rows += [(f'recall_{K}', f'recall@{K}', '.4f') for K in Ks]
+    rows += [('MRR', 'MRR', '.4f'), ('ndcg_cut_10', 'nDCG@10', '.4f')]
+    width = max(12, *(len(n) for n in names)) + 2
+    print(f"{'metric':<14}" + ''.join(f"{n:>{width}}" for n in names))
+    for label, key, fmt in rows:
+        print(f"{label:<14}" + ''.join(f"{format(r[key], fmt):>{width}}" for r in results))
+
+def write_per_query(path, names, per_query, qrels, metrics):
+    """
+    TSV：metric qid <各 run 的得分>
+    """
+    with open(path, 'w', encoding='utf-8') as out:
+        out.write('metric\tqid\t' + '\t'.join(names) + '\n')
+        for m in metrics:
+            qids, X = paired_scores(per_query, qrels, m)
+            for j, qid in enumerate(qids):
+                out.write(f"{m}\t{qid}\t" + '\t'.join(f"{v:.4f}" for v in X[:, j]) + '\n')
+
+if __name__ == "__main__":
+    import argparse
+    p = argparse.ArgumentParser(description="evaluate and compare several runs against one qrels")
+    p.add_argument("--relevance", required=True, help="relatedness file")
+    p.add_argument("--runs", nargs='+', required=True, help="run files or directories of run files")
+    p.add_argument("--baseline", help="run compared against (default: the first run)")
+    p.add_argument("--metrics", nargs='+', default=['map', 'ndcg_cut_10'],
+                   help=f"per-query metrics to test ({', '.join(PER_QUERY_METRICS)}, recall_K)")
+    p.add_argument("--tests", nargs='+', choices=TESTS, default=list(TESTS))
+    p.add_argument("--trials", type=int, default=10000,
+                   help="permutations / bootstrap samples")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--workers", type=int, default=None,
+                   help="evaluation processes (default: all CPUs)")
+    p.add_argument("--per-query", metavar="TSV", help="also write per-query scores to this file")
+    args = p.parse_args()
+
+    Ks = [5,10,15,20,30,100,200,500,1000]
+    paths = expand_runs(args.runs)
+    if not paths:
+        p.error("no run files given")
+    names = [os.path.basename(x) for x in paths]
+    base = 0
+    if args.baseline is not None:
+        if args.baseline in paths:
+            base = paths.index(args.baseline)
+        elif args.baseline in names:
+            base = names.index(args.baseline)
+        else:
+            p.error(f"baseline {args.baseline} is not among the runs")
+    valid = set(PER_QUERY_METRICS) | {f'recall_{K}' for K in Ks}
+    for m in args.metrics:
+        if m not in valid:
+            p.error(f"unknown per-query metric {m}")
+
+    qrels = load_relevance(args.relevance)
+    evaluated = evaluate_runs(qrels, paths, Ks, args.workers)
+    results = [r for r, _ in evaluated]
+    per_query = [pq for _, pq in evaluated]
+
+    print_table(names, results, Ks)
+    for m in args.metrics:
+        qids, X = paired_scores(per_query, qrels, m)
+        print()
+        print(f"{m}: paired tests vs {names[base]} over {len(qids)} queries "
+              f"(two-sided p; {args.trials} trials)")
+        for i, name in enumerate(names):
+            if i == base:
+                continue
+            sig = significance(X[base], X[i], args.tests, args.trials, args.seed)
+            diff = X[i].mean() - X[base].mean()
+            print(f"  {name:<28} {X[i].mean():.4f} ({diff:+.4f})  " +
+                  '  '.join(f"{t}={sig[t]:.4f}" for t in args.tests))
+        missing = [names[i] for i, pq in enumerate(per_query) if len(pq) < len(qids)]
+        if missing:
+            print(f"  (queries missing from {', '.join(missing)} count as 0 here, not in the table)")
+    if args.per_query:
+        write_per_query(args.per_query, names, per_query, qrels, args.metrics)
+        print(f"\nWrote per-query scores to {args.per_query}")
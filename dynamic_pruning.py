@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+安全的动态剪枝 top-k 检索（WAND / Block-Max WAND）
+
+文档得分统一看成  score(d) = base(d) + Σ_{t∈q∩d} c_t(d)：
+  - BM25: base(d) = 0
+  - QL  : base(d) = Σ_{w∈q} log(μ·p_bg(w) / (dl+μ))，c_t(d) = log(1 + tf/(μ·p_bg(t)))
+每个查询词用 posting 上 c_t 的最大值（以及每 BLOCK_SIZE 个 posting 的块内最大值）
+作为上界，上界达不到当前堆顶阈值的文档直接跳过。
+候选文档的最终得分仍由模型原本的 score 计算，所以 top-k 与穷举打分逐位一致。
+"""
+
+import heapq
+import math
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+BLOCK_SIZE = 64
+
+# 上界与阈值比较时的浮点余量：上界用分解式算，得分用原式算，末位可能不同
+def _margin(theta):
+    return 1e-9 * (1.0 + abs(theta))
+
+# ———— 各模型的打分适配 ————
+class BM25Bounds:
+    """
+    make_run_jewelstar.BM25 的适配
+    """
+    fill_order = None
+
+    def __init__(self, bm25):
+        self.m = bm25
+        self.index = bm25.index
+
+    def contribs(self, w):
+        ids, tfs = self.index.postings(w)
+        idf, k1p1, norm = self.m.idf[w], self.m.k1 + 1, self.m.norm
+        return [idf * f * k1p1 / (f + norm[i]) for i, f in zip(ids, tfs)]
+
+    def base_bound(self, q_tokens):
+        return 0.0
+
+    def base(self, q_tokens, idx):
+        return 0.0
+
+    def score(self, q_tokens, idx):
+        return self.m.score(q_tokens, idx)
+
+class OkapiBounds:
+    """
+    rank_bm25.BM25Okapi 的适配；index 为同一语料建的 InvertedIndex
+    逐篇得分与 BM25Okapi.get_scores 的 numpy 计算逐位一致
+    """
+    fill_order = None
+
+    def __init__(self, bm25, index):
+        self.m = bm25
+        self.index = index
+
+    def contribs(self, w):
+        ids, tfs = self.index.postings(w)
+        m = self.m
+        idf = m.idf.get(w) or 0
+        return [idf * (f * (m.k1 + 1) / (f + m.k1 * (1 - m.b + m.b * m.doc_len[i] / m.avgdl)))
+                for i, f in zip(ids, tfs)]
+
+    def base_bound(self, q_tokens):
+        return 0.0
+
+    def base(self, q_tokens, idx):
+        return 0.0
+
+    def score(self, q_tokens, idx):
+        m = self.m
+        freqs = m.doc_freqs[idx]
+        dl = m.doc_len[idx]
+        s = 0.0
+        for w in q_tokens:
+            f = freqs.get(w)
+            if not f:
+                continue
+            s += (m.idf.get(w) or 0) * (f * (m.k1 + 1) /
+                                        (f + m.k1 * (1 - m.b + m.b * dl / m.avgdl)))
+        return s
+
+class QLBounds:
+    """
+    make_ql_run.QueryLikelihood 的适配；index 为同一语料建的 InvertedIndex
+    未命中任何查询词的文档得分只取决于文档长度，越短越高
+    """
+    def __init__(self, ql, index):
+        self.m = ql
+        self.index = index
+        self._fill = None
+
+    @property
+    def fill_order(self):
+        # 按 base(d) 降序（即 dl 升序），同分按文档序
+        if self._fill is None:
+            dl = self.m.doc_len
+            self._fill = array('i', sorted(range(len(dl)), key=lambda i: (dl[i], i)))
+        return self._fill
+
+    def _p_bg(self, w):
+        return self.m.p_bg_of(w)
+
+    def contribs(self, w):
+        ids, tfs = self.index.postings(w)
+        mp = self.m.mu * self._p_bg(w)
+        return [math.log(1 + f / mp) for f in tfs]
+
+    def base(self, q_tokens, idx):
+        mu = self.m.mu
+        dl = self.m.doc_len[idx]
+        return sum(math.log(mu * pb / (dl + mu)) for pb in self.m.query_terms(q_tokens)[1])
+
+    def base_of(self, q_tokens):
+        """
+        返回 idx -> base(q, idx)；同一查询内 base 只取决于文档长度，按长度缓存
+        """
+        mu, dl, memo = self.m.mu, self.m.doc_len, {}
+        p_bg = [self._p_bg(w) for w in q_tokens]
+
+        def base(idx):
+            n = dl[idx]
+            if n not in memo:
+                memo[n] = sum(math.log(mu * pb / (n + mu)) for pb in p_bg)
+            return memo[n]
+        return base
+
+    def base_bound(self, q_tokens):
+        fill = self.fill_order
+        return self.base(q_tokens, fill[0]) if len(fill) else 0.0
+
+    def score(self, q_tokens, idx):
+        return self.m.score(q_tokens, idx)
+
+# ———— WAND 查询处理 ————
+class WandSearcher:
+    """
+    scorer 需提供: index, contribs(w), base(q, idx), base_bound(q), score(q, idx), fill_order
+    fill_order 为 None 表示 base 为常数 0（BM25）；否则为按 base 降序的文档序列（QL）
+    num_scored 累计被完整打分的文档数，last_scored 为最近一次查询的数目
+    """
+    def __init__(self, scorer, block_max=True):
+        self.scorer = scorer
+        self.block_max = block_max
+        self.num_queries = 0
+        self.num_scored = 0
+        self.last_scored = 0
+        self._bounds = {}    # term -> (ub, lo, 块内最大值 array)
+
+    def _term_bounds(self, w):
+        tb = self._bounds.get(w)
+        if tb is None:
+            cs = self.scorer.contribs(w)
+            blocks = array('d', (max(cs[j:j + BLOCK_SIZE])
+                                 for j in range(0, len(cs), BLOCK_SIZE)))
+            tb = (max(cs), min(cs), blocks)
+            self._bounds[w] = tb
+        return tb
+
+    def prepare(self, terms):
+        """
+        预先算好这些词的上界；多进程检索时在 fork 前调用，worker 不必各算一遍
+        """
+        for w in set(terms):
+            if w in self.scorer.index:
+                self._term_bounds(w)
+
+    def _exhaustive(self, q_tokens, topk):
+        sc = self.scorer
+        N = sc.index.N
+        self.last_scored = N
+        scores = [(i, sc.score(q_tokens, i)) for i in range(N)]
+        scores.sort(key=lambda x: x[1], reverse=True)
+        return scores[:topk]
+
+    def query(self, q_tokens, topk=1000):
+        sc = self.scorer
+        N = sc.index.N
+        topk = min(topk, N)
+        self.num_queries += 1
+        self.last_scored = 0
+        if topk <= 0:
+            return []
+        if not q_tokens:
+            # 空查询所有文档同为 0 分，与穷举一样按文档序；QL 的 fill_order 按文档长度，不能用
+            hits = self._exhaustive(q_tokens, topk)
+            self.num_scored += self.last_scored
+            return hits
+
+        # 游标: [当前 doc, 位置, doc ids, ub×出现次数, 块内最大值, 出现次数]
+        cursors = []
+        for w, m in Counter(q_tokens).items():
+            p = sc.index.postings(w)
+            if p is None:
+                continue
+            ub, lo, blocks = self._term_bounds(w)
+            if lo < 0:
+                # 负贡献破坏上界假设，退回穷举
+                hits = self._exhaustive(q_tokens, topk)
+                self.num_scored += self.last_scored
+                return hits
+            if ub == 0:
+                # 贡献全为 0（idf 恰为 0），命中与否得分都不变
+                continue
+            cursors.append([p[0][0], 0, p[0], ub * m, blocks, m])
+
+        heap, seen, scored = [], set(), 0
+        fill = sc.fill_order
+        if fill is not None:
+            # base 不为常数时先用 base 最高的 topk 篇文档垫底，得到初始阈值
+            for i in fill[:topk]:
+                heap.append((sc.score(q_tokens, i), -i))
+                seen.add(i)
+            scored += len(heap)
+            heapq.heapify(heap)
+        base_bound = sc.base_bound(q_tokens)
+
+        while cursors:
+            cursors.sort(key=lambda c: c[0])
+            full = len(heap) >= topk
+            if full:
+                theta = heap[0][0]
+                lim = theta - _margin(theta)
+                acc, pivot = base_bound, -1
+                for j, c in enumerate(cursors):
+                    acc += c[3]
+                    if acc >= lim:
+                        pivot = j
+                        break
+                if pivot < 0:
+                    break
+            else:
+                pivot = 0
+            d = cursors[pivot][0]
+
+            if cursors[0][0] != d:
+                # 跳过 pivot 之前的文档：它们的上界之和达不到阈值
+                alive = []
+                for j, c in enumerate(cursors):
+                    if j < pivot:
+                        c[1] = bisect_left(c[2], d, c[1])
+                        if c[1] >= len(c[2]):
+                            continue
+                        c[0] = c[2][c[1]]
+                    alive.append(c)
+                cursors = alive
+                continue
+
+            at = [c for c in cursors if c[0] == d]
+            skip = d in seen
+            if not skip and full and self.block_max:
+                bb = sc.base(q_tokens, d) if fill is not None else 0.0
+                for c in at:
+                    bb += c[4][c[1] // BLOCK_SIZE] * c[5]
+                skip = bb < lim
+            if not skip:
+                s = sc.score(q_tokens, d)
+                scored += 1
+                seen.add(d)
+                if len(heap) < topk:
+                    heapq.heappush(heap, (s, -d))
+                elif (s, -d) > heap[0]:
+                    heapq.heapreplace(heap, (s, -d))
+
+            alive = []
+            for c in cursors:
+                if c[0] == d:
+                    c[1] += 1
+                    if c[1] >= len(c[2]):
+                        continue
+                    c[0] = c[2][c[1]]
+                alive.append(c)
+            cursors = alive
+
+        self.last_scored = scored
+        self.num_scored += scored
+        heap.sort(reverse=True)
+        hits = [(-ni, s) for s, ni in heap]
+        if len(hits) < topk:
+            # 只会在 base 为常数时出现：堆未满说明所有命中文档都已打分，按文档序补 0 分
+            for i in range(N):
+                if i not in seen:
+                    hits.append((i, 0.0))
+                    if len(hits) == topk:
+                        break
+        return hits
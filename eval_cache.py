@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+评测结果缓存
+
+.eval_cache/<run sha1>-<qrels sha1>.json 保存某个 run 在某份 qrels 下已经算过的指标：
+  counts     num_q / num_ret / num_rel / num_rel_ret
+  per_query  指标名 -> {qid: 得分}，recall_K 按单个 K 缓存
+汇总的 map / P_10 / MRR / nDCG@10 / recall@K 是 per-query 得分的平均（evaluate_metrics.summarize），
+取用时由 per_query 算出，不单独缓存。
+run 和 qrels 都没变时只对两个文件求 sha1 再查表，不解析文件；只多了新的 K 时，
+只对相关命中补算 recall（evaluate_metrics.RecallEvaluator），其余指标不重算。
+"""
+
+import json
+import os
+import tempfile
+from evaluate_metrics import (PER_QUERY_METRICS, RecallEvaluator, evaluate_run, is_binary_run,
+                              load_relevance, load_run, summarize)
+from index_store import file_sha1
+
+EVAL_CACHE = '.eval_cache'
+FORMAT_VERSION = 3     # 2: per-query map 改为标准 AP；3: 汇总值改为 per-query 得分的平均
+COUNTS = ['num_q', 'num_ret', 'num_rel', 'num_rel_ret']
+
+def cache_path(run_path, qrels_path, cache_dir=EVAL_CACHE):
+    return os.path.join(cache_dir, f"{file_sha1(run_path)[:20]}-{file_sha1(qrels_path)[:20]}.json")
+
+def _load(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get('version') != FORMAT_VERSION:
+        return None
+    return entry
+
+def _save(path, entry):
+    # 先写临时文件再改名，并发评测同一个 run 时不会读到半个文件
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix='.json', dir=os.path.dirname(path) or '.')
+    with os.fdopen(fd, 'w', encoding='utf-8') as out:
+        json.dump(entry, out, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def _store_per_query(entry, per_query, names):
+    pq = entry['per_query']
+    # 没有一个 query 有相关文档时也记下这些指标已算过
+    for name in names:
+        pq.setdefault(name, {})
+    for qid, metrics in per_query.items():
+        for name, v in metrics.items():
+            pq.setdefault(name, {})[qid] = v
+
+def evaluate_cached(qrels_path, run_path, Ks, engine='python', stream=False,
+                    chunk_lines=1000000, cache_dir=EVAL_CACHE):
+    """
+    返回 (results, per_query)，与 evaluate_metrics 直接评测的结果相同
+    缺什么算什么：没有 counts 时完整评测一遍；只缺某些 K 时只补算 recall
+    """
+    path = cache_path(run_path, qrels_path, cache_dir)
+    entry = _load(path) or {'version': FORMAT_VERSION, 'counts': None, 'per_query': {}}
+    recall_names = [f'recall_{K}' for K in Ks]
+    need_base = entry['counts'] is None
+    need_recall = any(n not in entry['per_query'] for n in recall_names)
+
+    if need_base or need_recall:
+        qrels = load_relevance(qrels_path)
+        if need_base and engine == 'numpy':
+            from vector_metrics import evaluator_np
+            from run_format import BinaryRun
+            runs = BinaryRun(run_path) if is_binary_run(run_path) else load_run(run_path)
+            ev = evaluator_np(qrels, runs, Ks)
+        elif need_base:
+            ev = evaluate_run(qrels, run_path, Ks, stream, chunk_lines)
+        else:
+            ev = evaluate_run(qrels, run_path, Ks, stream, chunk_lines, evaluator=RecallEvaluator)
+        if need_base:
+            res = ev.results()
+            entry['counts'] = {k: res[k] for k in COUNTS}
+        _store_per_query(entry, ev.per_query, (PER_QUERY_METRICS if need_base else []) + recall_names)
+        _save(path, entry)
+
+    names = PER_QUERY_METRICS + recall_names
+    per_query = {}
+    for qid in entry['per_query']['map']:
+        per_query[qid] = {n: entry['per_query'][n][qid] for n in names}
+    results = dict(entry['counts'])
+    results.update(summarize(per_query, Ks))
+    return results, per_query
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+# 启动只依赖标准库：tempfile（外排序）、numpy 引擎、评测缓存都在用到时才导入
+import heapq
 import math
+import os
 from collections import defaultdict
+from profiling import profiled, stage
+from run_format import BinaryRun, is_binary_run
 
+@profiled('load_relevance')
 def load_relevance(path):
     qrels = defaultdict(dict)
     with open(path, encoding='utf-8') as f:
@@ -15,125 +21,267 @@ def load_relevance(path):
             qrels[qid][docid] = int(rel)
     return dict(qrels)
 
+def _parse_run_line(line):
+    # -> (qid, docid, score, rank)；不是合法 run 行时返回 None
+    parts = line.strip().split()
+    if len(parts) < 6 or parts[1] != 'Q0':
+        return None
+    return parts[0], ' '.join(parts[2:-3]), float(parts[-2]), int(parts[-3])
+
+def _ranked(lst):
+    lst.sort(key=lambda x: x[2])
+    return [(d,s) for d,s,_ in lst]
+
+@profiled('load_run')
 def load_run(path):
+    if is_binary_run(path):
+        return dict(BinaryRun(path).items())
     runs = defaultdict(list)
     with open(path, encoding='utf-8') as f:
         for line in f:
-            parts = line.strip().split()
-            if len(parts) < 6 or parts[1] != 'Q0':
+            rec = _parse_run_line(line)
+            if rec is None:
                 continue
-            qid = parts[0]
-            rank  = int(parts[-3])
-            score = float(parts[-2])
-            docid = ' '.join(parts[2:-3])
-            runs[qid].append((docid, score, rank))
-    out = {}
-    for q, lst in runs.items():
-        lst.sort(key=lambda x: x[2])
-        out[q] = [(d,s) for d,s,_ in lst]
-    return out
+            runs[rec[0]].append(rec[1:])
+    return {q: _ranked(lst) for q, lst in runs.items()}
 
-def compute_all(qrels, runs, Ks):
-    # 初始化
-    recall_at = {K: [] for K in Ks}
-    p_at_10 = []
-    rr_list = []
-    ap_list = []
-    ndcg_at_10 = []
-    num_rel, num_rel_ret, num_ret = 0, 0, 0
+# ———— 流式读取：按 qid 分组，内存只占一个 query ————
+class RunNotGrouped(Exception):
+    """
+    run 文件中同一 qid 的行不连续
+    """
 
-    for qid, retrieved in runs.items():
-        rel_docs = {d for d,r in qrels.get(qid,{}).items() if r>0}
-        total_rel = len(rel_docs)
-        if total_rel == 0:
-            continue
+def iter_run_groups(path):
+    """
+    逐组产出 (qid, [(docid, score)])，组内按 rank 排序
+    要求同一 qid 的行连续出现，否则在发现时抛出 RunNotGrouped
+    二进制 run 本身按 query 分段存放，直接逐段读取
+    """
+    if is_binary_run(path):
+        yield from BinaryRun(path).items()
+        return
+    seen = set()
+    cur, buf = None, []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            rec = _parse_run_line(line)
+            if rec is None:
+                continue
+            qid = rec[0]
+            if qid != cur:
+                if cur is not None:
+                    yield cur, _ranked(buf)
+                if qid in seen:
+                    raise RunNotGrouped(qid)
+                seen.add(qid)
+                cur, buf = qid, []
+            buf.append(rec[1:])
+    if cur is not None:
+        yield cur, _ranked(buf)
+
+def external_sort_run(path, chunk_lines=1000000, tmpdir=None):
+    """
+    外排序：把 run 文件按 qid 首次出现的顺序重排成分组连续的临时文件，返回其路径
+    每次只在内存里排序 chunk_lines 行；query 顺序与 load_run 的字典顺序一致
+    """
+    import tempfile
+    order = {}                # qid -> 首次出现序号
+    chunks = []
 
-        docs = [d for d,_ in retrieved]
-        num_ret += len(docs)
-        num_rel += total_rel
-        hit_rel = 0
+    def flush(buf):
+        buf.sort(key=lambda x: x[0])
+        fd, name = tempfile.mkstemp(suffix='.run', dir=tmpdir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as out:
+            for o, line in buf:
+                out.write(f"{o}\t{line}")
+        chunks.append(name)
 
-        # Recall@K, Precision@10, nDCG@10, RR, AP
-        precision_sums = 0.0
-        num_hits = 0
-        dcg, idcg = 0.0, 0.0
+    try:
+        with open(path, encoding='utf-8') as f:
+            buf = []
+            for line in f:
+                rec = _parse_run_line(line)
+                if rec is None:
+                    continue
+                o = order.setdefault(rec[0], len(order))
+                buf.append((o, line if line.endswith('\n') else line + '\n'))
+                if len(buf) >= chunk_lines:
+                    flush(buf)
+                    buf = []
+            if buf:
+                flush(buf)
 
-        # 预计算 ideal DCG for @10
-        ideal_rels = sorted(qrels[qid].values(), reverse=True)[:10]
+        # k 路归并；heapq.merge 对相同 key 保持输入顺序，归并结果稳定
+        fd, merged = tempfile.mkstemp(suffix='.run', dir=tmpdir)
+        files = [open(name, encoding='utf-8') for name in chunks]
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as out:
+                for line in heapq.merge(*files, key=lambda l: int(l.split('\t', 1)[0])):
+                    out.write(line.split('\t', 1)[1])
+        finally:
+            for fh in files:
+                fh.close()
+    finally:
+        for name in chunks:
+            os.remove(name)
+    return merged
+
+@profiled('evaluate_run')
+def evaluate_run(qrels, path, Ks, stream=False, chunk_lines=1000000, evaluator=None):
+    """
+    把 run 文件逐 query 喂给 evaluator（默认 Evaluator），返回喂完的 evaluator
+    stream=True 时按 qid 分组读取，每个 query 读完立即计入指标；
+    文件未按 qid 分组时先外排序再评测，结果与一次性载入相同
+    """
+    make = evaluator or Evaluator
+    if not stream:
+        ev = make(qrels, Ks)
+        for qid, retrieved in load_run(path).items():
+            ev.add(qid, retrieved)
+        return ev
+    try:
+        ev = make(qrels, Ks)
+        for qid, retrieved in iter_run_groups(path):
+            ev.add(qid, retrieved)
+        return ev
+    except RunNotGrouped:
+        pass
+    tmp = external_sort_run(path, chunk_lines)
+    try:
+        ev = make(qrels, Ks)
+        for qid, retrieved in iter_run_groups(tmp):
+            ev.add(qid, retrieved)
+        return ev
+    finally:
+        os.remove(tmp)
+
+def evaluate_run_stream(qrels, path, Ks, chunk_lines=1000000):
+    """
+    流式评测；结果与 compute_all(qrels, load_run(path), Ks) 相同
+    """
+    return evaluate_run(qrels, path, Ks, True, chunk_lines).results()
+
+def index_relevance(qrels):
+    """
+    qid -> (相关文档集合, ideal DCG@10)；多个 run 共用同一份 qrels 时只算一次
+    """
+    index = {}
+    for qid, grades in qrels.items():
+        rel_docs = {d for d,r in grades.items() if r>0}
+        idcg = 0.0
+        ideal_rels = sorted(grades.values(), reverse=True)[:10]
         for i, r in enumerate(ideal_rels, start=1):
             idcg += (2**r - 1)/math.log2(i+1)
+        index[qid] = (rel_docs, idcg)
+    return index
 
-        for idx, d in enumerate(docs, start=1):
-            is_rel = 1 if d in rel_docs else 0
+# per-query 指标名（trec_eval -q 的命名）
+PER_QUERY_METRICS = ['map', 'P_10', 'recip_rank', 'ndcg_cut_10']
+# 汇总行的名字 -> 对应的 per-query 指标
+SUMMARY_OF = {'map': 'map', 'P_10': 'P_10', 'MRR': 'recip_rank', 'nDCG@10': 'ndcg_cut_10'}
 
-            # num_rel_ret
-            if is_rel:
-                num_rel_ret += 1
+def average_precision(rel_ranks, total_rel):
+    """
+    trec_eval 的 AP：第 i 个相关命中（名次 r）贡献 i/r，除以相关文档数；所有相关命中都计入
+    """
+    return sum(i / r for i, r in enumerate(rel_ranks, start=1)) / total_rel
 
-            # Recall@K
-            for K in Ks:
-                if idx <= K and is_rel:
-                    hit_rel += 1
-                    recall_at[K].append(hit_rel/total_rel)
-
-            # Precision@10
-            if idx <= 10:
-                if is_rel:
-                    num_hits += 1
-                p = num_hits/idx
-            if idx == 10:
-                p_at_10.append(p)
-
-            # RR
-            if is_rel and rr_list is not None:
-                if idx == 1 or (len(rr_list) < len(ap_list)+1):
-                    rr_list.append(1/idx)
-
-            # AP
-            if is_rel:
-                precision_sums += num_hits/idx
-
-            # DCG@10
-            if idx <= 10:
-                rel = qrels[qid].get(d,0)
-                dcg += (2**rel - 1)/math.log2(idx+1)
-
-        # 完成一个 query
-        ap_list.append(precision_sums/total_rel)
-        ndcg_at_10.append(dcg/(idcg if idcg>0 else 1))
-
-    # 聚合
-    num_q = len(runs)
-    results = {
-        'num_q': num_q,
-        'num_ret': num_ret,
-        'num_rel': num_rel,
-        'num_rel_ret': num_rel_ret,
-        'map': sum(ap_list)/len(ap_list) if ap_list else 0.0,
-        'P_10': sum(p_at_10)/len(p_at_10) if p_at_10 else 0.0,
-        'MRR': sum(rr_list)/len(rr_list) if rr_list else 0.0,
-        'nDCG@10': sum(ndcg_at_10)/len(ndcg_at_10) if ndcg_at_10 else 0.0
-    }
-    # 各 recall@K
+def summarize(per_query, Ks):
+    """
+    汇总行的 map / P_10 / MRR / nDCG@10 / recall@K：per_query 各项按 qid 顺序求平均
+    """
+    n = len(per_query)
+    out = {}
+    for name, m in SUMMARY_OF.items():
+        out[name] = sum(pq[m] for pq in per_query.values())/n if n else 0.0
     for K in Ks:
-        results[f'recall@{K}'] = (sum(recall_at[K])/len(recall_at[K])) if recall_at[K] else 0.0
+        out[f'recall@{K}'] = sum(pq[f'recall_{K}'] for pq in per_query.values())/n if n else 0.0
+    return out
 
-    return results
+class Evaluator:
+    """
+    逐 query 累加指标：add(qid, retrieved) 依次喂入，results() 汇总
+    compute_all、流式评测与 numpy 评测（vector_metrics）共用同一套定义
 
-if __name__ == "__main__":
-    import argparse
-    p = argparse.ArgumentParser()
-    p.add_argument("--relevance", required=True, help="relatedness file")
-    p.add_argument("--run",       required=True, help="run file")
-    args = p.parse_args()
+    per_query[qid] 记录每个有相关文档的 query 的单项指标，按 trec_eval 的标准定义：
+    map = AP（average_precision，每个相关命中都计入）、P_10 = 前 10 命中数/10（不足 10 条也除以 10）、
+    recip_rank = 第一个相关文档名次的倒数、ndcg_cut_10、recall_K = 前 K 命中数/相关数。
+    汇总行就是这些值在所有有相关文档的 query 上的平均（summarize），与 -q 的逐 query 输出一致
+    """
+    def __init__(self, qrels, Ks, index=None):
+        self.qrels = qrels
+        self.Ks = Ks
+        self.index = index if index is not None else index_relevance(qrels)
+        self.per_query = {}
+        self.num_rel, self.num_rel_ret, self.num_ret = 0, 0, 0
+        self.num_q = 0
 
-    Ks = [5,10,15,20,30,100,200,500,1000]
-    qrels = load_relevance(args.relevance)
-    runs  = load_run(args.run)
-    res   = compute_all(qrels, runs, Ks)
+    def add(self, qid, retrieved):
+        self.num_q += 1
+        rel_docs, idcg = self.index.get(qid, (set(), 0.0))
+        total_rel = len(rel_docs)
+        if total_rel == 0:
+            return
 
-    # 打印
-    print(f"runid all run1")
+        self.num_ret += len(retrieved)
+        self.num_rel += total_rel
+        rel_ranks = [idx for idx, (d,_) in enumerate(retrieved, start=1) if d in rel_docs]
+        self.num_rel_ret += len(rel_ranks)
+
+        # DCG@10
+        grades = self.qrels[qid]
+        dcg = 0.0
+        for idx, (d,_) in enumerate(retrieved[:10], start=1):
+            rel = grades.get(d,0)
+            dcg += (2**rel - 1)/math.log2(idx+1)
+
+        pq = {
+            'map': average_precision(rel_ranks, total_rel),
+            'P_10': sum(1 for i in rel_ranks if i <= 10)/10,
+            'recip_rank': 1/rel_ranks[0] if rel_ranks else 0.0,
+            'ndcg_cut_10': dcg/(idcg if idcg>0 else 1),
+        }
+        for K in self.Ks:
+            pq[f'recall_{K}'] = sum(1 for i in rel_ranks if i <= K)/total_rel
+        self.per_query[qid] = pq
+
+    def results(self):
+        results = {
+            'num_q': self.num_q,
+            'num_ret': self.num_ret,
+            'num_rel': self.num_rel,
+            'num_rel_ret': self.num_rel_ret,
+        }
+        results.update(summarize(self.per_query, self.Ks))
+        return results
+
+class RecallEvaluator:
+    """
+    只算 per-query recall_K 及其平均 recall@K（与 Evaluator 相同），只遍历相关命中；
+    用于结果缓存里补算新加的 K
+    """
+    def __init__(self, qrels, Ks, index=None):
+        self.Ks = Ks
+        self.index = index if index is not None else index_relevance(qrels)
+        self.per_query = {}
+
+    def add(self, qid, retrieved):
+        rel_docs, _ = self.index.get(qid, (set(), 0.0))
+        total_rel = len(rel_docs)
+        if total_rel == 0:
+            return
+        rel_ranks = [idx for idx, (d,_) in enumerate(retrieved, start=1) if d in rel_docs]
+        self.per_query[qid] = {f'recall_{K}': sum(1 for i in rel_ranks if i <= K)/total_rel
+                               for K in self.Ks}
+
+    def results(self):
+        n = len(self.per_query)
+        return {f'recall@{K}': sum(pq[f'recall_{K}'] for pq in self.per_query.values())/n if n else 0.0
+                for K in self.Ks}
+
+def print_results(res, Ks, runid='run1'):
+    # trec_eval 风格的汇总行
+    print(f"runid all {runid}")
     print(f"num_q    all {res['num_q']}")
     print(f"num_ret  all {res['num_ret']}")
     print(f"num_rel  all {res['num_rel']}")
@@ -144,3 +292,64 @@ if __name__ == "__main__":
         print(f"recall_{K:<3d} all {res[f'recall@{K}']:.4f}")
     print(f"MRR      all {res['MRR']:.4f}")
     print(f"ndcg_cut_10 all {res['nDCG@10']:.4f}")
+
+@profiled('compute_all')
+def compute_all(qrels, runs, Ks):
+    ev = Evaluator(qrels, Ks)
+    for qid, retrieved in runs.items():
+        ev.add(qid, retrieved)
+    return ev.results()
+
+if __name__ == "__main__":
+    import argparse
+    p = argparse.ArgumentParser()
+    p.add_argument("--relevance", required=True, help="relatedness file")
+    p.add_argument("--run",       required=True, help="run file")
+    p.add_argument("--stream", action="store_true",
+                   help="evaluate query by query; memory bounded by the largest query")
+    p.add_argument("--sort-chunk", type=int, default=1000000,
+                   help="lines per in-memory chunk when a streamed run must be externally sorted")
+    p.add_argument("--engine", choices=["python", "numpy"], default="python",
+                   help="numpy: batched array evaluator (vector_metrics.py), same results")
+    p.add_argument("--Ks", type=int, nargs='+', default=[5,10,15,20,30,100,200,500,1000],
+                   help="cutoffs for recall@K")
+    p.add_argument("-q", dest="per_query", action="store_true",
+                   help="also print per-query metrics (like trec_eval -q)")
+    p.add_argument("--cache", action="store_true",
+                   help="reuse/store results in the evaluation cache (eval_cache.py)")
+    p.add_argument("--cache-dir", default=".eval_cache")
+    from profiling import add_arguments, from_args
+    add_arguments(p)
+    args = p.parse_args()
+    if args.stream and args.engine == "numpy":
+        p.error("--stream is only supported by the python engine")
+
+    Ks = args.Ks
+    with from_args(args):
+        if args.cache:
+            from eval_cache import evaluate_cached
+            with stage('evaluate_cached'):
+                res, per_query = evaluate_cached(args.relevance, args.run, Ks, args.engine,
+                                                 args.stream, args.sort_chunk, args.cache_dir)
+        else:
+            qrels = load_relevance(args.relevance)
+            if args.engine == "numpy":
+                from vector_metrics import evaluator_np
+                runs = BinaryRun(args.run) if is_binary_run(args.run) else load_run(args.run)
+                with stage('evaluate_np'):
+                    ev = evaluator_np(qrels, runs, Ks)
+            else:
+                ev = evaluate_run(qrels, args.run, Ks, args.stream, args.sort_chunk)
+            with stage('results'):
+                res, per_query = ev.results(), ev.per_query
+
+    # 打印
+    if args.per_query:
+        for qid, pq in per_query.items():
+            print(f"map      {qid} {pq['map']:.4f}")
+            print(f"P_10     {qid} {pq['P_10']:.4f}")
+            for K in Ks:
+                print(f"recall_{K:<3d} {qid} {pq[f'recall_{K}']:.4f}")
+            print(f"recip_rank {qid} {pq['recip_rank']:.4f}")
+            print(f"ndcg_cut_10 {qid} {pq['ndcg_cut_10']:.4f}")
+    print_results(res, Ks)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按 impact 排序的量化索引 + score-at-a-time 的随时可停（anytime）查询
+
+    python make_run.py --models bm25p,ql --backend impact --max-postings 20000
+    python impact_index.py --model bm25p --bits 8 --max-postings 2000 10000 50000 --time-budget-ms 1 5
+
+与 dynamic_pruning 相同，文档得分看成 score(d) = base(d) + Σ_{t∈q∩d} c_t(d)
+（BM25: base = 0；QL: base 只取决于文档长度，c_t = log(1 + tf/(μ·p_bg(t))) > 0）。
+建索引时每个 posting 的 c_t(d) 按全索引的最大值均匀量化成 1..2^bits-1 的整数 impact，
+每个 term 的 posting 按 impact 降序（同 impact 按 doc 序）分段。
+查询时把所有查询词的段按 impact 从大到小依次处理，把 impact 累加到按文档下标的整数累加器数组，
+posting 数（max_postings）或时间（time_budget_ms）预算用完就停；贡献大的 posting 先处理，
+提前停下时丢掉的是最小的那部分得分。
+最终得分 = base(d) + scale·累加值，命中不足 topk 时按 base 从高到低补未命中的文档。
+query_budgeted 随结果返回 complete：该查询的 posting 全部处理过、没有因预算提前停止。
+complete 只说明预算没用完，不保证排序与浮点打分相同——量化本身就会改变相近得分的先后，
+与精确结果的差距要用 recall（见 main）衡量。num_complete / num_queries 为累计值。
+时间预算只约束累加阶段，取 top-k 的代价与已处理的 posting 数成正比。
+"""
+
+import heapq
+import time
+from array import array
+from collections import Counter
+
+DEFAULT_BITS = 8
+CHECK_EVERY = 1024       # 每处理这么多个 posting 检查一次时间预算
+
+class ImpactSearcher:
+    """
+    scorer 为 dynamic_pruning 的 BM25Bounds / QLBounds：需提供 index、contribs(w)、fill_order
+    （None 表示 base 恒为 0），fill_order 不为 None 时还需 base_of(q) -> (idx -> base)
+    """
+    def __init__(self, scorer, bits=DEFAULT_BITS, max_postings=None, time_budget_ms=None):
+        self.scorer = scorer
+        self.bits = bits
+        self.max_postings = max_postings
+        self.time_budget_ms = time_budget_ms
+        index = scorer.index
+        levels = (1 << bits) - 1
+        contribs = [scorer.contribs(w) for w in index.terms]
+        top = max((max(cs) for cs in contribs if cs), default=0.0)
+        if min((min(cs) for cs in contribs if cs), default=0.0) < 0:
+            raise ValueError("impact ordering needs non-negative term contributions")
+        self.scale = top / levels if top > 0 else 1.0
+        # docs 为所有 posting 的 doc id，每个 term 内按 (impact 降序, doc 升序)；
+        # segments[tid] = [(impact, start, end)]，impact 降序
+        self.docs = array('i')
+        self.segments = []
+        off, ids = index.post_off, index.post_ids
+        for tid, cs in enumerate(contribs):
+            base = off[tid]
+            imps = [max(1, min(levels, int(c / self.scale + 0.5))) for c in cs]
+            order = sorted(range(len(cs)), key=lambda j: (-imps[j], j))
+            segs = []
+            for j in order:
+                if not segs or segs[-1][0] != imps[j]:
+                    segs.append([imps[j], len(self.docs), len(self.docs)])
+                self.docs.append(ids[base + j])
+                segs[-1][2] += 1
+            self.segments.append([tuple(s) for s in segs])
+        self.acc = array('q', bytes(8 * index.N))
+        # 累计计数，scored 为处理的 posting 数；fork 出的 worker 由 batch_retrieval 汇总
+        self.num_queries = 0
+        self.num_scored = 0
+        self.num_complete = 0
+
+    def query(self, q_tokens, topk=1000, max_postings=None, time_budget_ms=None):
+        """
+        返回 [(doc 下标, 近似得分)]，与 RetrievalModel.search 的接口相同
+        """
+        return self.query_budgeted(q_tokens, topk, max_postings, time_budget_ms)[0]
+
+    def query_budgeted(self, q_tokens, topk=1000, max_postings=None, time_budget_ms=None):
+        """
+        返回 (hits, complete, 处理的 posting 数)；预算默认取构造时给的值，None 表示不限
+        """
+        if max_postings is None:
+            max_postings = self.max_postings
+        if time_budget_ms is None:
+            time_budget_ms = self.time_budget_ms
+        deadline = None if time_budget_ms is None else time.perf_counter() + time_budget_ms / 1000
+        sc, vocab = self.scorer, self.scorer.index.vocab
+        segs = []
+        for w, m in Counter(q_tokens).items():
+            tid = vocab.get(w)
+            if tid is not None:
+                segs.extend((imp * m, a, b) for imp, a, b in self.segments[tid])
+        segs.sort(key=lambda s: -s[0])
+        total = sum(b - a for _, a, b in segs)
+
+        # ———— 按 impact 从大到小累加，预算用完即停 ————
+        acc, docs, touched = self.acc, self.docs, []
+        done, stop = 0, False
+        for imp, a, b in segs:
+            while a < b:
+                end = min(b, a + CHECK_EVERY)
+                if max_postings is not None:
+                    end = min(end, a + max_postings - done)
+                for d in docs[a:end]:
+                    if not acc[d]:
+                        touched.append(d)
+                    acc[d] += imp
+                done += end - a
+                a = end
+                if ((max_postings is not None and done >= max_postings)
+                        or (deadline is not None and time.perf_counter() >= deadline)):
+                    stop = True
+                    break
+            if stop:
+                break
+        complete = done == total
+
+        # ———— 取 top-k：命中的文档 + base 最高的未命中文档 ————
+        scale, fill = self.scale, sc.fill_order
+        if fill is None:
+            cand = [(d, scale * acc[d]) for d in touched]
+        else:
+            base = sc.base_of(q_tokens)
+            cand = [(d, base(d) + scale * acc[d]) for d in touched]
+        for d in touched:
+            acc[d] = 0
+        seen = set(touched)
+        if fill is not None:
+            extra = []
+            for d in fill:
+                if len(extra) == topk:
+                    break
+                if d not in seen:
+                    extra.append((d, base(d)))
+            cand += extra
+        hits = heapq.nlargest(topk, cand, key=lambda x: (x[1], -x[0]))
+        if fill is None and len(hits) < topk:
+            # base 恒为 0：未命中的文档按文档序补 0 分
+            for d in range(sc.index.N):
+                if d not in seen:
+                    hits.append((d, 0.0))
+                    if len(hits) == topk:
+                        break
+
+        self.num_queries += 1
+        self.num_complete += complete
+        self.num_scored += done
+        return hits, complete, done
+
+    def report(self):
+        return (f"impact-ordered ({self.bits} bits): {self.num_complete}/{self.num_queries} queries "
+                f"within budget, {self.num_scored} postings processed")
+
+# ———— 预算扫描：与穷举打分比较 recall@K ————
+def recall_at(hits, ref, K):
+    """
+    |近似 top-K ∩ 穷举 top-K| / |穷举 top-K|
+    """
+    want = {d for d, _ in ref[:K]}
+    return len(want & {d for d, _ in hits[:K]}) / len(want) if want else 1.0
+
+def main(argv=None):
+    import argparse
+    import json
+    from make_run import CORPUS, DEV_TXT, QUERIES_JSON, Session
+    from retrieval_models import MODELS
+    p = argparse.ArgumentParser(description="budgeted impact-ordered retrieval against exhaustive scoring")
+    p.add_argument("--model", choices=[n for n, c in MODELS.items() if c.impact_ordered], default="bm25p")
+    p.add_argument("--corpus", default=CORPUS)
+    p.add_argument("--dev", default=DEV_TXT)
+    p.add_argument("--queries", default=QUERIES_JSON)
+    p.add_argument("--bits", type=int, default=DEFAULT_BITS)
+    p.add_argument("--max-postings", type=int, nargs='*', default=[], help="postings budgets to try")
+    p.add_argument("--time-budget-ms", type=float, nargs='*', default=[], help="time budgets to try")
+    p.add_argument("--topk", type=int, default=1000)
+    p.add_argument("--k", type=int, nargs='+', default=[10, 100, 1000], help="recall@K cut-offs")
+    p.add_argument("--out", metavar="JSON", help="also write the table here")
+    args = p.parse_args(argv)
+
+    session = Session(args.corpus, args.dev, args.queries)
+    ref_model = session.build(args.model)            # 穷举打分
+    t = time.perf_counter()
+    model = session.build(args.model, backend='impact', impact_bits=args.bits)
+    build_s = time.perf_counter() - t
+    tokens = session.query_tokens(ref_model.tokenizer)
+    queries = [tokens[text] for _, text in session.queries]
+    refs = [ref_model.search(q, topk=args.topk) for q in queries]
+    searcher = model.impact
+    print(f"{args.model}: {len(searcher.docs)} postings in "
+          f"{sum(len(s) for s in searcher.segments)} impact segments, built in {build_s:.2f}s")
+
+    settings = [('none', None, None)]
+    settings += [(f"{n} postings", n, None) for n in args.max_postings]
+    settings += [(f"{ms:g} ms", None, ms) for ms in args.time_budget_ms]
+    rows = []
+    print(f"{'budget':<16}{'complete':>9}{'postings':>10}{'p50_ms':>9}{'p95_ms':>9}{'max_ms':>9}"
+          + ''.join(f"{'R@' + str(k):>9}" for k in args.k))
+    for label, n, ms in settings:
+        lat, complete, done, rec = [], 0, 0, {k: 0.0 for k in args.k}
+        for q, ref in zip(queries, refs):
+            t = time.perf_counter()
+            hits, ok, scored = searcher.query_budgeted(q, topk=args.topk, max_postings=n, time_budget_ms=ms)
+            lat.append(1000 * (time.perf_counter() - t))
+            complete += ok
+            done += scored
+            for k in args.k:
+                rec[k] += recall_at(hits, ref, k)
+        lat.sort()
+        nq = len(queries)
+        row = {
+            'budget': label,
+            'max_postings': n,
+            'time_budget_ms': ms,
+            'complete_fraction': complete / nq,
+            'mean_postings': done / nq,
+            'latency_ms': {'p50': lat[nq // 2], 'p95': lat[min(nq - 1, int(0.95 * nq))], 'max': lat[-1]},
+            'recall': {str(k): rec[k] / nq for k in args.k},
+        }
+        rows.append(row)
+        print(f"{label:<16}{row['complete_fraction']:>9.2f}{row['mean_postings']:>10.0f}"
+              f"{row['latency_ms']['p50']:>9.2f}{row['latency_ms']['p95']:>9.2f}{row['latency_ms']['max']:>9.2f}"
+              + ''.join(f"{row['recall'][str(k)]:>9.4f}" for k in args.k))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'model': args.model, 'bits': args.bits, 'rows': rows}, f, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+可增量更新的分段索引：追加文档、按 doc id 删除（墓碑），后台合并段
+
+目录布局：
+  manifest.json   版本、分词方式、段列表（名字 + 段内已删除的下标）
+  seg_000001/     一个段 = 一个 index_store.CorpusIndex（倒排 + 分词后的文档）
+                  + cf.bin（每个词的总词频）；meta.json 里记段的 N 与总长度
+段写好后不再修改，删除只记在 manifest 里；合并把相邻几个段里的存活文档重写成一个新段。
+
+集合统计量（N、总长度→avgdl、df、cf）在增删时增量维护，不随语料重算。
+每个段的统计量随段落盘（df 即 posting 表长度），打开索引时按段累加、再减去墓碑文档，
+代价与词表大小和已删除文档的长度成正比，不必扫描全部 posting 或转置倒排。
+检索结果与“用当前存活文档（按加入顺序）从头建 BM25 / QueryLikelihood”逐位一致：
+统计量都是整数，打分式与累加顺序与 make_run_jewelstar.BM25.query、
+make_ql_run.QueryLikelihood.query 相同，同分按文档在存活语料中的位置排序。
+"""
+
+import json
+import math
+import os
+import shutil
+import sys
+import threading
+from array import array
+from collections import Counter
+import heapq
+from index_store import CorpusIndex
+from inverted_index import map_array
+
+FORMAT_VERSION = 2
+MAX_SEGMENTS = 8      # 段数超过它就在后台合并
+MERGE_FACTOR = 4      # 一次合并的相邻段数
+
+class CollectionStats:
+    """
+    集合统计量：文档数、总长度、df、cf；只含存活文档
+    """
+    def __init__(self):
+        self.N = 0
+        self.total_len = 0
+        self.df = Counter()
+        self.cf = Counter()
+
+    def add(self, tf, dl):
+        self.N += 1
+        self.total_len += dl
+        for w, f in tf.items():
+            self.df[w] += 1
+            self.cf[w] += f
+
+    def add_counts(self, terms, df, cf, N, total_len):
+        """
+        一次计入一组文档的汇总统计量（段落盘的统计量）
+        """
+        self.N += N
+        self.total_len += total_len
+        for w, d, c in zip(terms, df, cf):
+            self.df[w] += d
+            self.cf[w] += c
+
+    def remove(self, tf, dl):
+        self.N -= 1
+        self.total_len -= dl
+        for w, f in tf.items():
+            self.df[w] -= 1
+            self.cf[w] -= f
+            if not self.df[w]:
+                del self.df[w]
+                del self.cf[w]
+
+    @property
+    def avgdl(self):
+        return self.total_len / self.N
+
+    @property
+    def V(self):
+        return len(self.cf)
+
+class Segment:
+    """
+    只读的一个段；deleted 为段内已删除文档的下标，每次删除换成新的 frozenset
+    cf 为段内每个 term id 的总词频，total_len 为段内全部文档（含已删除）的总长度
+    """
+    def __init__(self, name, ci, cf, total_len, deleted=frozenset()):
+        self.name = name
+        self.ci = ci
+        self.cf = cf
+        self.total_len = total_len
+        self.deleted = frozenset(deleted)
+
+    @classmethod
+    def load(cls, root, name, deleted=frozenset()):
+        path = os.path.join(root, name)
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        cf = memoryview(map_array(os.path.join(path, 'cf.bin'), 'q')).cast('B').cast('q')
+        return cls(name, CorpusIndex.load(path), cf, meta['total_len'], deleted)
+
+    @property
+    def live(self):
+        return self.ci.N - len(self.deleted)
+
+    def df(self):
+        off = self.ci.index.post_off
+        return (off[t + 1] - off[t] for t in range(len(off) - 1))
+
+    def tf(self, i):
+        # 取自段里保存的文档 term id 序列，代价 O(文档长度)，不必转置倒排
+        ci = self.ci
+        terms = ci.index.terms
+        return {terms[t]: f for t, f in Counter(ci.doc_terms[ci.doc_off[i]:ci.doc_off[i + 1]]).items()}
+
+class IncrementalIndex:
+    """
+    path 不存在时新建空索引；tokenizer 只记录在 manifest 里（common.TOKENIZERS 的 key），
+    add() 接收的已经是分词结果
+    background=False 时不起合并线程，段数超限时在 add() 里同步合并
+    """
+    def __init__(self, path, tokenizer='strip', max_segments=MAX_SEGMENTS,
+                 merge_factor=MERGE_FACTOR, background=True):
+        self.path = path
+        self.max_segments = max_segments
+        self.merge_factor = merge_factor
+        self.background = background
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()  # 同一时间只跑一个合并；先取它再取 _lock
+        self._merger = None      # 正在跑的合并线程；线程在锁内确认无事可做后才清掉
+        self._merge_error = None # 后台合并抛出的异常，由 wait() 抛出
+        self._view_cache = None
+        self.version = 0
+        self.segments = []
+        self.stats = CollectionStats()
+        self.where = {}          # 存活文档 doc id -> (Segment, 段内下标)
+
+        manifest = os.path.join(path, 'manifest.json')
+        if os.path.exists(manifest):
+            with open(manifest, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('version') != FORMAT_VERSION or meta.get('byteorder') != sys.byteorder:
+                raise ValueError(f"{path}: incompatible incremental index")
+            self.tokenizer = meta['tokenizer']
+            self.next_seg = meta['next_seg']
+            for s in meta['segments']:
+                seg = Segment.load(path, s['name'], s['deleted'])
+                self.segments.append(seg)
+                self._account(seg)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.tokenizer = tokenizer
+            self.next_seg = 1
+            self._write_manifest()
+
+    def _account(self, seg):
+        # 把段内存活文档计入 doc id 表与统计量：段的统计量整体计入，再减去段内已删除的文档
+        for i, doc_id in enumerate(seg.ci.doc_ids):
+            if i in seg.deleted:
+                continue
+            self._drop(doc_id)
+            self.where[doc_id] = (seg, i)
+        self.stats.add_counts(seg.ci.index.terms, seg.df(), seg.cf, seg.ci.N, seg.total_len)
+        dl = seg.ci.index.doc_len
+        for i in sorted(seg.deleted):
+            self.stats.remove(seg.tf(i), dl[i])
+
+    def _drop(self, doc_id):
+        # doc id 已存在时先删掉旧的（即“更新”）
+        loc = self.where.pop(doc_id, None)
+        if loc is None:
+            return False
+        seg, i = loc
+        self.stats.remove(seg.tf(i), seg.ci.index.doc_len[i])
+        seg.deleted = seg.deleted | {i}
+        return True
+
+    def _write_manifest(self):
+        meta = {
+            'version': FORMAT_VERSION,
+            'byteorder': sys.byteorder,
+            'tokenizer': self.tokenizer,
+            'next_seg': self.next_seg,
+            'segments': [{'name': s.name, 'N': s.ci.N, 'deleted': sorted(s.deleted)}
+                         for s in self.segments],
+        }
+        tmp = os.path.join(self.path, 'manifest.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.path, 'manifest.json'))
+
+    def _new_segment(self, doc_ids, docs):
+        # 段目录在锁外写好，提交时只改 manifest
+        with self._lock:
+            name = 'seg_%06d' % self.next_seg
+            self.next_seg += 1
+        ci = CorpusIndex.build(doc_ids, docs)
+        index = ci.index
+        off, tfs = index.post_off, index.post_tfs
+        cf = array('q', (sum(tfs[off[t]:off[t + 1]]) for t in range(len(index.terms))))
+        path = os.path.join(self.path, name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        with open(os.path.join(path, 'cf.bin'), 'wb') as f:
+            f.write(cf)
+        ci.save(path, {'version': FORMAT_VERSION, 'N': ci.N, 'total_len': sum(index.doc_len)})
+        return Segment.load(self.path, name)
+
+    # ———— 更新 ————
+    def add(self, doc_ids, docs):
+        """
+        追加一批文档（一个新段）；doc id 已存在的旧文档会被删除
+        """
+        if len(set(doc_ids)) != len(doc_ids):
+            raise ValueError("duplicate doc ids in one batch")
+        if not doc_ids:
+            return
+        seg = self._new_segment(doc_ids, docs)
+        with self._lock:
+            self.segments.append(seg)
+            self._account(seg)
+            self._commit()
+        self.maybe_merge()
+
+    def delete(self, doc_ids):
+        """
+        删除文档，返回实际删除的个数；不存在的 id 忽略
+        """
+        with self._lock:
+            n = sum(self._drop(d) for d in doc_ids)
+            if n:
+                self._commit()
+        return n
+
+    def _commit(self):
+        self._write_manifest()
+        self.version += 1
+
+    # ———— 合并 ————
+    def _pick_merge(self):
+        """
+        段数超限时选存活文档最少的 merge_factor 个相邻段；只合并相邻段，文档顺序不变
+        """
+        if len(self.segments) <= self.max_segments:
+            return None
+        k = min(self.merge_factor, len(self.segments))
+        sizes = [s.live for s in self.segments]
+        start = min(range(len(sizes) - k + 1), key=lambda i: sum(sizes[i:i + k]))
+        return self.segments[start:start + k]
+
+    def merge(self, segs=None):
+        """
+        把相邻的 segs（默认全部段）里的存活文档重写成一个段，去掉已删除文档
+        合并期间的新增、删除都可以并发进行；合并之间互斥，与后台合并排队执行
+        """
+        if segs is None:
+            self.wait()
+        with self._merge_lock:
+            with self._lock:
+                segs = list(self.segments if segs is None else segs)
+            self._merge(segs)
+
+    def _merge(self, segs):
+        # 调用方持有 _merge_lock：合并期间段列表只会在末尾追加，segs 仍是相邻的一段
+        with self._lock:
+            before = [s.deleted for s in segs]
+        if not segs:
+            return
+        doc_ids, docs, old = [], [], []
+        for seg, deleted in zip(segs, before):
+            for i in range(seg.ci.N):
+                if i not in deleted:
+                    doc_ids.append(seg.ci.doc_ids[i])
+                    docs.append(seg.ci.tokens(i))
+                    old.append((seg, i))
+        merged = self._new_segment(doc_ids, docs) if doc_ids else None
+
+        with self._lock:
+            start = self.segments.index(segs[0])
+            assert self.segments[start:start + len(segs)] == segs
+            if merged is not None:
+                # 合并期间又被删除的文档，换算成新段里的下标
+                new_of = {loc: j for j, loc in enumerate(old)}
+                late = [new_of[(seg, i)] for seg, d in zip(segs, before)
+                        for i in seg.deleted - d]
+                merged.deleted = frozenset(late)
+                for j, doc_id in enumerate(doc_ids):
+                    if j not in merged.deleted:
+                        self.where[doc_id] = (merged, j)
+            self.segments[start:start + len(segs)] = [merged] if merged is not None else []
+            self._commit()
+        for seg in segs:
+            shutil.rmtree(os.path.join(self.path, seg.name), ignore_errors=True)
+
+    def _merge_loop(self):
+        while True:
+            # 选段与合并在同一次 _merge_lock 里：选出的段不会先被显式 merge() 换掉
+            with self._merge_lock:
+                with self._lock:
+                    segs = self._pick_merge()
+                    if segs is None:
+                        # 与判断在同一次加锁里清掉 _merger：此后的 add() 不会因为线程还没退出而漏掉合并
+                        if self._merger is threading.current_thread():
+                            self._merger = None
+                        return
+                self._merge(segs)
+
+    def _merge_thread(self):
+        try:
+            self._merge_loop()
+        except BaseException as e:
+            with self._lock:
+                self._merge_error = e
+                self._merger = None
+
+    def maybe_merge(self):
+        if not self.background:
+            self._merge_loop()
+            return
+        with self._lock:
+            if self._merger is not None or self._pick_merge() is None:
+                return
+            self._merger = threading.Thread(target=self._merge_thread, name='segment-merge')
+            self._merger.start()
+
+    def wait(self):
+        """
+        等后台合并结束；后台合并出错时在这里抛出
+        """
+        while True:
+            with self._lock:
+                t = self._merger
+            if t is None:
+                break
+            t.join()
+        with self._lock:
+            err, self._merge_error = self._merge_error, None
+        if err is not None:
+            raise err
+
+    # ———— 检索 ————
+    def _view(self):
+        """
+        当前版本的 (段列表, 每段的全局位置表, 位置 -> doc id)；存活文档按段序、段内序编号，
+        与用 live_docs() 重建时的文档下标相同，删除的文档位置为 -1
+        """
+        if self._view_cache is None or self._view_cache[0] != self.version:
+            segs, positions, names = list(self.segments), [], []
+            for seg in segs:
+                pos = array('i', [-1]) * seg.ci.N
+                for i in range(seg.ci.N):
+                    if i not in seg.deleted:
+                        pos[i] = len(names)
+                        names.append(seg.ci.doc_ids[i])
+                positions.append(pos)
+            self._view_cache = (self.version, segs, positions, names)
+        return self._view_cache[1:]
+
+    def live_docs(self):
+        """
+        存活文档 (doc_ids, docs)，顺序即检索结果里的文档位置
+        """
+        with self._lock:
+            segs, positions, names = self._view()
+        docs = []
+        for seg, pos in zip(segs, positions):
+            for i in range(seg.ci.N):
+                if pos[i] >= 0:
+                    docs.append(seg.ci.tokens(i))
+        return list(names), docs
+
+    def bm25(self, q_tokens, topk=1000, k1=1.5, b=0.75):
+        """
+        返回 [(doc id, score)]，与 make_run_jewelstar.BM25(live docs).query 相同
+        """
+        with self._lock:
+            segs, positions, names = self._view()
+            N, df = self.stats.N, self.stats.df
+            if N == 0:
+                return []
+            avg = self.stats.avgdl
+            idf = {w: math.log(1 + (N - df[w] + 0.5) / (df[w] + 0.5))
+                   for w in set(q_tokens) if w in df}
+        acc = {}
+        k1p1 = k1 + 1
+        for w in q_tokens:
+            if w not in idf:
+                continue
+            for seg, pos in zip(segs, positions):
+                p = seg.ci.index.postings(w)
+                if p is None:
+                    continue
+                dl = seg.ci.index.doc_len
+                for i, f in zip(*p):
+                    j = pos[i]
+                    if j < 0:
+                        continue
+                    norm = k1 * (1 - b + b * dl[i] / avg)
+                    acc[j] = acc.get(j, 0.0) + idf[w] * f * k1p1 / (f + norm)
+        hits = heapq.nlargest(topk, acc.items(), key=lambda x: (x[1], -x[0]))
+        if len(hits) < topk:
+            for j in range(N):
+                if j not in acc:
+                    hits.append((j, 0.0))
+                    if len(hits) == topk:
+                        break
+        return [(names[j], s) for j, s in hits]
+
+    def ql(self, q_tokens, topk=1000, mu=2000):
+        """
+        返回 [(doc id, score)]，与 make_ql_run.QueryLikelihood(live docs).query 相同
+        """
+        with self._lock:
+            segs, positions, names = self._view()
+            if self.stats.N == 0:
+                return []
+            bg_len, V, cf = self.stats.total_len, self.stats.V, self.stats.cf
+            p_bg = [(cf.get(w, 0) + 1) / (bg_len + V) for w in q_tokens]
+        scores = []
+        for seg, pos in zip(segs, positions):
+            tfs = []
+            for w in q_tokens:
+                p = seg.ci.index.postings(w)
+                tfs.append(dict(zip(*p)) if p is not None else {})
+            dl = seg.ci.index.doc_len
+            for i in range(seg.ci.N):
+                if pos[i] < 0:
+                    continue
+                score = 0.0
+                for t, pb in zip(tfs, p_bg):
+                    score += math.log((t.get(i, 0) + mu * pb) / (dl[i] + mu))
+                scores.append((pos[i], score))
+        scores.sort(key=lambda x: x[1], reverse=True)
+        return [(names[j], s) for j, s in scores[:topk]]
+
+def _read_jsonl(path, tokenizer, workers):
+    from common import TOKENIZERS
+    from index_store import read_corpus
+    return read_corpus(path, TOKENIZERS[tokenizer][0], workers)
+
+if __name__ == "__main__":
+    import argparse
+    p = argparse.ArgumentParser(description="incrementally maintained segmented index")
+    p.add_argument("index", help="index directory (created on first add)")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    a = sub.add_parser("add", help="append documents from a corpus.jsonl-style file")
+    a.add_argument("jsonl")
+    a.add_argument("--tokenizer", choices=["raw", "strip"], default="strip",
+                   help="only used when the index is created")
+    a.add_argument("--workers", type=int, default=None)
+    d = sub.add_parser("delete", help="tombstone documents by doc id")
+    d.add_argument("doc_ids", nargs='+')
+    sub.add_parser("merge", help="merge all segments into one")
+    sub.add_parser("stats")
+    s = sub.add_parser("search")
+    s.add_argument("query")
+    s.add_argument("--model", choices=["bm25", "ql"], default="bm25")
+    s.add_argument("--topk", type=int, default=10)
+    s.add_argument("--check", action="store_true",
+                   help="also rebuild the model from the live documents and compare")
+    args = p.parse_args()
+
+    idx = IncrementalIndex(args.index, tokenizer=getattr(args, 'tokenizer', 'strip'))
+    if args.cmd == "add":
+        doc_ids, docs = _read_jsonl(args.jsonl, idx.tokenizer, args.workers)
+        idx.add(doc_ids, docs)
+        idx.wait()
+        print(f"Added {len(doc_ids)} docs")
+    elif args.cmd == "delete":
+        print(f"Deleted {idx.delete(args.doc_ids)} docs")
+    elif args.cmd == "merge":
+        idx.merge()
+    elif args.cmd == "search":
+        from common import TOKENIZERS
+        q = TOKENIZERS[idx.tokenizer][0](args.query)
+        if args.model == "bm25":
+            hits = idx.bm25(q, args.topk)
+        else:
+            hits = idx.ql(q, args.topk)
+        for rank, (doc_id, score) in enumerate(hits, start=1):
+            print(f"{rank}\t{doc_id}\t{score:.6f}")
+        if args.check:
+            doc_ids, docs = idx.live_docs()
+            if args.model == "bm25":
+                from make_run_jewelstar import BM25
+                ref = BM25(docs).query(q, args.topk)
+            else:
+                from make_ql_run import QueryLikelihood
+                ref = QueryLikelihood(docs).query(q, args.topk)
+            same = [(doc_ids[i], s) for i, s in ref] == hits
+            print("matches full rebuild" if same else "DIFFERS from full rebuild")
+    st = idx.stats
+    print(f"{len(idx.segments)} segments, N={st.N}, avgdl={st.avgdl if st.N else 0:.2f}, V={st.V}")
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+持久化索引 + 分词语料缓存，供各 make_*_run 脚本共用
+
+缓存目录 .index_cache/<key>/，key 由语料文件 sha1 与分词配置共同决定，
+任何一方变化都会自动重建。目录内容：
+  meta.json             版本、语料 hash、分词配置、规模
+  doc_ids.bin/.off      文档 id 表
+  terms.bin/.off        词表（term id 顺序）
+  doc_len.bin           int32 文档长度
+  post_off/ids/tfs.bin  倒排 posting（见 InvertedIndex）
+  doc_off.bin           int64 每篇文档在 doc_terms 中的起点
+  doc_terms.bin         int32 按原顺序的 token term id，即分词后的语料
+定长数组载入时直接 mmap。
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import shutil
+import sys
+from array import array
+from collections import deque
+from itertools import islice
+from inverted_index import InvertedIndex, map_array, read_strings, write_strings
+from profiling import enabled as profiling_enabled, stage
+
+INDEX_CACHE = '.index_cache'
+FORMAT_VERSION = 1
+CHUNK_SIZE = 256     # 并行分词时每个任务的文档数
+
+def tokenizer_config(name, stopwords=None):
+    """
+    分词配置：分词器名称、jieba 版本、停用词表
+    """
+    return {
+        'name': name,
+        'jieba': jieba_version(),
+        'stopwords': sorted(stopwords) if stopwords else [],
+    }
+
+def jieba_version():
+    """
+    直接读 jieba/__init__.py 里的 __version__，不导入 jieba（导入本身约 0.15s）；读不到时才导入
+    """
+    spec = importlib.util.find_spec('jieba')
+    if spec is not None and spec.origin:
+        with open(spec.origin, encoding='utf-8') as f:
+            m = re.search(r"^__version__\s*=\s*['\"]([^'\"]+)['\"]", f.read(), re.M)
+        if m:
+            return m.group(1)
+    import jieba
+    return jieba.__version__
+
+def load_jieba():
+    """
+    导入 jieba 并加载词典；前缀词典缓存在 .index_cache/jieba.cache（marshal，首次加载时生成），
+    之后直接读缓存，不再从词典文本构建，也不依赖系统临时目录
+    """
+    import jieba
+    if not jieba.dt.initialized:
+        os.makedirs(INDEX_CACHE, exist_ok=True)
+        jieba.dt.tmp_dir = INDEX_CACHE
+        jieba.setLogLevel(60)
+        jieba.initialize()
+    return jieba
+
+def file_sha1(path, bufsize=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(bufsize), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_key(corpus_path, config):
+    h = hashlib.sha1(file_sha1(corpus_path).encode('ascii'))
+    h.update(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    h.update(str(FORMAT_VERSION).encode('ascii'))
+    return h.hexdigest()[:20]
+
+def read_corpus(path, tokenize, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    逐行读 corpus.jsonl 并分词，返回 (doc_ids, docs)
+    workers > 1 时走多进程流水线，结果与串行完全相同；workers=None 表示用全部 CPU
+    tokenize 须可被 pickle（模块级函数）
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        if not profiling_enabled():
+            doc_ids, docs = [], []
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    obj = json.loads(line)
+                    doc_ids.append(obj['name'])
+                    docs.append(tokenize(obj['content']))
+            return doc_ids, docs
+        # 分阶段计时时才拆成两遍，read_json 与 tokenize 分开计；原文要在内存里多留一会
+        doc_ids, contents = [], []
+        with stage('read_json'), open(path, encoding='utf-8') as f:
+            for line in f:
+                obj = json.loads(line)
+                doc_ids.append(obj['name'])
+                contents.append(obj['content'])
+        with stage('tokenize'):
+            docs = [tokenize(c) for c in contents]
+        return doc_ids, docs
+    with stage('tokenize_parallel'):
+        return _read_corpus_parallel(path, tokenize, workers, chunk_size)
+
+# ———— 并行分词 ————
+_worker_tokenize = None
+
+def _init_worker(tokenize):
+    # 每个 worker 只加载一次 jieba 词典
+    global _worker_tokenize
+    load_jieba()
+    _worker_tokenize = tokenize
+
+def _tokenize_chunk(lines):
+    ids, docs = [], []
+    for line in lines:
+        obj = json.loads(line)
+        ids.append(obj['name'])
+        docs.append(_worker_tokenize(obj['content']))
+    return ids, docs
+
+def _iter_chunks_parallel(path, tokenize, workers, chunk_size):
+    """
+    按 chunk_size 行切块，最多 2×workers 个块在途（内存有界），按提交顺序产出 (ids, docs)
+    """
+    import multiprocessing      # 只有建索引缓存时才用到
+    pending = deque()
+    with open(path, encoding='utf-8') as f, \
+            multiprocessing.Pool(workers, _init_worker, (tokenize,)) as pool:
+        while True:
+            while len(pending) < 2 * workers:
+                lines = list(islice(f, chunk_size))
+                if not lines:
+                    break
+                pending.append(pool.apply_async(_tokenize_chunk, (lines,)))
+            if not pending:
+                break
+            yield pending.popleft().get()
+
+def _read_corpus_parallel(path, tokenize, workers, chunk_size):
+    doc_ids, docs = [], []
+    for ids, toks in _iter_chunks_parallel(path, tokenize, workers, chunk_size):
+        doc_ids.extend(ids)
+        docs.extend(toks)
+    return doc_ids, docs
+
+def iter_corpus(path, tokenize, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    流式读 corpus.jsonl 并分词，逐篇产出 (doc_id, tokens)，不把整个语料留在内存里
+    workers 的含义同 read_corpus，并行时顺序不变
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                obj = json.loads(line)
+                yield obj['name'], tokenize(obj['content'])
+        return
+    for ids, toks in _iter_chunks_parallel(path, tokenize, workers, chunk_size):
+        yield from zip(ids, toks)
+
+class CorpusIndex:
+    """
+    文档 id 表 + 倒排索引 + 分词后的语料（以 term id 序列保存）
+    """
+    def __init__(self, doc_ids, index, doc_off, doc_terms):
+        self.doc_ids = doc_ids
+        self.index = index
+        self.N = len(doc_ids)
+        self.doc_off = doc_off
+        self.doc_terms = doc_terms
+
+    @classmethod
+    def build(cls, doc_ids, docs):
+        index = InvertedIndex(docs)
+        vocab = index.vocab
+        off, terms = array('q', [0]), array('i')
+        for d in docs:
+            terms.extend(vocab[w] for w in d)
+            off.append(len(terms))
+        return cls(doc_ids, index, memoryview(off), memoryview(terms))
+
+    def tokens(self, i):
+        terms = self.index.terms
+        return [terms[t] for t in self.doc_terms[self.doc_off[i]:self.doc_off[i + 1]]]
+
+    def docs(self):
+        """
+        还原全部分词结果，与直接分词得到的 token 列表完全相同
+        """
+        return [self.tokens(i) for i in range(self.N)]
+
+    def save(self, path, meta):
+        os.makedirs(path, exist_ok=True)
+        self.index.save(path)
+        write_strings(os.path.join(path, 'doc_ids'), self.doc_ids)
+        for name in ('doc_off', 'doc_terms'):
+            with open(os.path.join(path, name + '.bin'), 'wb') as f:
+                f.write(getattr(self, name))
+        # meta 最后写，作为“写入完成”的标志
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        index = InvertedIndex.load(path)
+        doc_ids = read_strings(os.path.join(path, 'doc_ids'))
+        doc_off = memoryview(map_array(os.path.join(path, 'doc_off.bin'), 'q')).cast('B').cast('q')
+        doc_terms = memoryview(map_array(os.path.join(path, 'doc_terms.bin'), 'i')).cast('B').cast('i')
+        return cls(doc_ids, index, doc_off, doc_terms)
+
+def index_meta(corpus_path, config, counts):
+    """
+    缓存目录的 meta.json；counts 含 N、V、num_postings、num_tokens
+    """
+    return {
+        'version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'corpus': os.path.abspath(corpus_path),
+        'tokenizer': config,
+        'N': counts['N'],
+        'V': counts['V'],
+        'num_postings': counts['num_postings'],
+        'num_tokens': counts['num_tokens'],
+    }
+
+def load_or_build(corpus_path, tokenize, config, cache_dir=INDEX_CACHE,
+                  workers=None, chunk_size=CHUNK_SIZE, builder=None, ram_mb=None):
+    """
+    命中缓存则 mmap 打开，否则分词（workers 个进程）建索引并落盘
+    config 须完整描述 tokenize 的行为（见 tokenizer_config）
+    builder() -> (doc_ids, docs) 可替代分词，用于从已有的分词结果派生
+    ram_mb 给出且没有 builder 时用 spimi_index 流式建索引，内存不超过约 ram_mb，结果相同
+    """
+    key = cache_key(corpus_path, config)
+    path = os.path.join(cache_dir, key)
+    meta_path = os.path.join(path, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') == FORMAT_VERSION and meta.get('byteorder') == sys.byteorder:
+            with stage('index_load'):
+                return CorpusIndex.load(path)
+
+    # 先写临时目录再改名，中途中断不会留下半成品
+    tmp = path + '.tmp%d' % os.getpid()
+    shutil.rmtree(tmp, ignore_errors=True)
+    if ram_mb is not None and builder is None:
+        from spimi_index import build_index
+        with stage('index_build_spimi'):
+            report = build_index(corpus_path, tokenize, tmp, ram_mb, workers, chunk_size)
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(index_meta(corpus_path, config, report), f, ensure_ascii=False, indent=1)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        print(f"Built index cache {path} ({report['N']} docs, {report['blocks']} SPIMI blocks, "
+              f"{report['docs_per_s']:.0f} docs/s)")
+        return CorpusIndex.load(path)
+
+    if builder is not None:
+        doc_ids, docs = builder()
+    else:
+        doc_ids, docs = read_corpus(corpus_path, tokenize, workers, chunk_size)
+    with stage('index_build'):
+        ci = CorpusIndex.build(doc_ids, docs)
+    meta = index_meta(corpus_path, config, {
+        'N': ci.N,
+        'V': len(ci.index.terms),
+        'num_postings': len(ci.index.post_ids),
+        'num_tokens': len(ci.doc_terms),
+    })
+    with stage('index_save'):
+        ci.save(tmp, meta)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    print(f"Built index cache {path} ({ci.N} docs)")
+    return ci
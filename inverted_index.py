@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+# -------------- 倒排索引 --------------
+class InvertedIndex:
+    """
+    倒排索引：term -> (doc ids, tf)
+    posting 按 CSR 方式存成三段连续 buffer：post_off / post_ids / post_tfs，
+    doc id 在每个 term 内升序；postings() 返回的是零拷贝的 memoryview 切片
+    """
+    def __init__(self, docs):
+        self.N = len(docs)
+        self.vocab = {}       # term -> term id
+        self.terms = []       # term id -> term
+        ids_by_term, tfs_by_term = [], []
+        for idx, d in enumerate(docs):
+            for w, f in Counter(d).items():
+                tid = self.vocab.get(w)
+                if tid is None:
+                    tid = len(self.terms)
+                    self.vocab[w] = tid
+                    self.terms.append(w)
+                    ids_by_term.append(array('i'))
+                    tfs_by_term.append(array('i'))
+                ids_by_term[tid].append(idx)
+                tfs_by_term[tid].append(f)
+        off, ids, tfs = array('q', [0]), array('i'), array('i')
+        for a, t in zip(ids_by_term, tfs_by_term):
+            ids.extend(a)
+            tfs.extend(t)
+            off.append(len(ids))
+        self._set_buffers(array('i', (len(d) for d in docs)), off, ids, tfs)
+
+    def _set_buffers(self, doc_len, off, ids, tfs):
+        self.doc_len = memoryview(doc_len).cast('B').cast('i')
+        self.post_off = memoryview(off).cast('B').cast('q')
+        self.post_ids = memoryview(ids).cast('B').cast('i')
+        self.post_tfs = memoryview(tfs).cast('B').cast('i')
+
+    def __contains__(self, w):
+        return w in self.vocab
+
+    def df(self, w):
+        tid = self.vocab.get(w)
+        return 0 if tid is None else self.post_off[tid + 1] - self.post_off[tid]
+
+    def postings(self, w):
+        """
+        返回 (doc ids, tfs)；词不在词表中时返回 None
+        """
+        tid = self.vocab.get(w)
+        if tid is None:
+            return None
+        a, b = self.post_off[tid], self.post_off[tid + 1]
+        return self.post_ids[a:b], self.post_tfs[a:b]
+
+    def doc_freqs(self):
+        """
+        返回 dict: term -> df
+        """
+        off = self.post_off
+        return {w: off[tid + 1] - off[tid] for w, tid in self.vocab.items()}
+
+    def term_postings(self, q_tokens):
+        """
+        每个查询词的 posting（不在词表中为 None），逐篇打分时配合 posting_tf 按文档二分查找
+        """
+        return [self.postings(w) for w in q_tokens]
+
+    def forward(self):
+        """
+        对应的正排索引（ForwardIndex），首次调用时构建，之后各模型共用同一份
+        """
+        if getattr(self, '_forward', None) is None:
+            self._forward = ForwardIndex(self)
+        return self._forward
+
+    # ———— 落盘 / mmap 载入 ————
+    def save(self, path):
+        """
+        写入目录 path：terms.bin/terms.off 为词表，其余为原生字节序的定长数组
+        """
+        os.makedirs(path, exist_ok=True)
+        write_strings(os.path.join(path, 'terms'), self.terms)
+        for name in ('doc_len', 'post_off', 'post_ids', 'post_tfs'):
+            with open(os.path.join(path, name + '.bin'), 'wb') as f:
+                f.write(getattr(self, name))
+
+    @classmethod
+    def load(cls, path):
+        """
+        从 save() 写出的目录载入；定长数组直接 mmap，不做拷贝
+        """
+        self = cls.__new__(cls)
+        self.terms = read_strings(os.path.join(path, 'terms'))
+        self.vocab = {w: tid for tid, w in enumerate(self.terms)}
+        self._set_buffers(*(map_array(os.path.join(path, name + '.bin'), code)
+                            for name, code in (('doc_len', 'i'), ('post_off', 'q'),
+                                               ('post_ids', 'i'), ('post_tfs', 'i'))))
+        self.N = len(self.doc_len)
+        return self
+
+# -------------- 正排索引 --------------
+class ForwardIndex:
+    """
+    正排索引：doc -> (term id, tf)，与倒排共用同一个词表
+    CSR 三段 buffer：off (N+1) / terms / tfs，每篇文档内 term id 升序；
+    由倒排 posting 转置得到，不需要原始 token 列表，也不为每篇文档建 Counter
+    """
+    def __init__(self, index):
+        N = index.N
+        p_off, p_ids, p_tfs = index.post_off, index.post_ids, index.post_tfs
+        off = array('q', bytes(8 * (N + 1)))
+        for d in p_ids:
+            off[d + 1] += 1
+        for i in range(N):
+            off[i + 1] += off[i]
+        pos = array('q', off[:N])
+        terms = array('i', bytes(4 * len(p_ids)))
+        tfs = array('i', bytes(4 * len(p_ids)))
+        # 按 term id 顺序把 posting 分发到各文档，文档内自然按 term id 升序
+        for tid in range(len(index.terms)):
+            for k in range(p_off[tid], p_off[tid + 1]):
+                d = p_ids[k]
+                j = pos[d]
+                terms[j] = tid
+                tfs[j] = p_tfs[k]
+                pos[d] = j + 1
+        self.N = N
+        self.off, self.terms, self.tfs = off, terms, tfs
+
+    def tf(self, idx, tid):
+        """
+        文档 idx 中 term id 为 tid 的词频，没有则为 0
+        """
+        a, b = self.off[idx], self.off[idx + 1]
+        j = bisect_left(self.terms, tid, a, b)
+        return self.tfs[j] if j < b and self.terms[j] == tid else 0
+
+    def doc(self, idx):
+        """
+        文档 idx 的 (term ids, tfs)
+        """
+        a, b = self.off[idx], self.off[idx + 1]
+        return self.terms[a:b], self.tfs[a:b]
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.off, self.terms, self.tfs))
+
+def posting_tf(p, idx):
+    """
+    posting p = (doc ids, tfs) 中文档 idx 的词频，没有则为 0；doc id 升序，二分查找
+    """
+    ids = p[0]
+    j = bisect_left(ids, idx)
+    return p[1][j] if j < len(ids) and ids[j] == idx else 0
+
+# ———— 二进制读写工具 ————
+def map_array(path, code):
+    """
+    只读 mmap 一个定长数组文件，返回 memoryview；空文件返回空 array
+    """
+    if os.path.getsize(path) == 0:
+        return array(code)
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def write_strings(prefix, strings):
+    """
+    字符串表：<prefix>.bin 为 UTF-8 拼接，<prefix>.off 为 int64 偏移
+    """
+    off, blob = array('q', [0]), bytearray()
+    for s in strings:
+        blob += s.encode('utf-8')
+        off.append(len(blob))
+    with open(prefix + '.bin', 'wb') as f:
+        f.write(blob)
+    with open(prefix + '.off', 'wb') as f:
+        f.write(off)
+
+def read_strings(prefix):
+    off = array('q')
+    with open(prefix + '.off', 'rb') as f:
+        off.frombytes(f.read())
+    with open(prefix + '.bin', 'rb') as f:
+        blob = f.read()
+    return [blob[off[i]:off[i + 1]].decode('utf-8') for i in range(len(off) - 1)]
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+serve.py 的压测客户端（asyncio，只用标准库）
+
+    python load_client.py --model bm25p --concurrency 16 --requests 2000
+    python load_client.py --unix /tmp/jewelstar.sock --model tfidf --duration 30
+
+--concurrency 个协程各开一条 keep-alive 连接，轮流发送查询（默认取 dev 集的查询文本，
+也可以用 --queries-file 每行一个），直到发满 --requests 个或到 --duration 秒。
+结束时打印吞吐、客户端测得的延迟分位数、各状态码计数，以及服务端 /stats 里该模型的
+batch 大小与排队时间；--out 另存为 JSON。
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+
+class Connection:
+    """
+    一条 keep-alive 的 HTTP/1.1 连接
+    """
+    def __init__(self, host, port, unix=None):
+        self.host, self.port, self.unix = host, port, unix
+        self.reader = self.writer = None
+
+    async def open(self):
+        if self.unix:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.unix)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, obj=None):
+        """
+        返回 (状态码, 解析后的 JSON)
+        """
+        if self.writer is None:
+            await self.open()
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8') if obj is not None else b''
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+        self.writer.write(head.encode('latin-1') + body)
+        await self.writer.drain()
+        status_line = await self.reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readuntil(b'\r\n')).decode('latin-1').strip()
+            if not line:
+                break
+            k, v = line.split(':', 1)
+            headers[k.strip().lower()] = v.strip()
+        data = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, json.loads(data) if data else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+def percentile(sorted_xs, p):
+    if not sorted_xs:
+        return 0.0
+    k = max(0, min(len(sorted_xs) - 1, -(-len(sorted_xs) * p // 100) - 1))
+    return sorted_xs[int(k)]
+
+async def run_load(args, queries):
+    latencies, statuses, batch_sizes = [], {}, []
+    source = itertools.cycle(queries)
+    sent = 0
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def next_query():
+        nonlocal sent
+        if args.requests and sent >= args.requests:
+            return None
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+        sent += 1
+        return next(source)
+
+    async def worker():
+        conn = Connection(args.host, args.port, args.unix)
+        try:
+            while True:
+                q = next_query()
+                if q is None:
+                    break
+                t = time.perf_counter()
+                try:
+                    status, res = await conn.request(
+                        'POST', '/search', {'model': args.model, 'q': q, 'topk': args.topk})
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+                    conn.close()
+                    continue
+                latencies.append(1000 * (time.perf_counter() - t))
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    batch_sizes.append(res['batch_size'])
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    conn = Connection(args.host, args.port, args.unix)
+    try:
+        _, server_stats = await conn.request('GET', '/stats')
+    finally:
+        conn.close()
+
+    latencies.sort()
+    ok = statuses.get(200, 0)
+    return {
+        'model': args.model,
+        'concurrency': args.concurrency,
+        'topk': args.topk,
+        'requests': len(latencies),
+        'elapsed_s': elapsed,
+        'throughput_qps': ok / elapsed if elapsed else 0.0,
+        'status': {str(k): v for k, v in statuses.items()},
+        'latency_ms': {'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95),
+                       'p99': percentile(latencies, 99),
+                       'max': latencies[-1] if latencies else 0.0,
+                       'mean': sum(latencies) / len(latencies) if latencies else 0.0},
+        'mean_batch_size': sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0.0,
+        'server': server_stats['models'].get(args.model),
+    }
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="load generator for serve.py")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--unix", metavar="PATH", help="connect to a Unix socket instead of TCP")
+    p.add_argument("--model", default="bm25p")
+    p.add_argument("--topk", type=int, default=10)
+    p.add_argument("--concurrency", type=int, default=8, help="parallel connections")
+    p.add_argument("--requests", type=int, default=1000, help="total requests (0: no limit)")
+    p.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    p.add_argument("--queries-file", help="one query per line (default: the dev queries)")
+    p.add_argument("--out", metavar="JSON", help="also write the report here")
+    args = p.parse_args(argv)
+    if not args.requests and not args.duration:
+        p.error("give --requests or --duration")
+
+    if args.queries_file:
+        with open(args.queries_file, encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        from common import load_queries
+        from make_run import DEV_TXT, QUERIES_JSON
+        queries = [text for _, text in load_queries(DEV_TXT, QUERIES_JSON)]
+    if not queries:
+        p.error("no queries")
+
+    report = asyncio.run(run_load(args, queries))
+    lat = report['latency_ms']
+    print(f"{report['requests']} requests in {report['elapsed_s']:.2f}s, "
+          f"{report['throughput_qps']:.1f} ok/s, concurrency {args.concurrency}")
+    print(f"latency ms: p50 {lat['p50']:.2f}  p95 {lat['p95']:.2f}  p99 {lat['p99']:.2f}  "
+          f"max {lat['max']:.2f}")
+    print("status: " + ', '.join(f"{k}={v}" for k, v in report['status'].items()))
+    print(f"mean batch size {report['mean_batch_size']:.2f}")
+    srv = report['server']
+    if srv:
+        print(f"server: queue wait p50 <= {srv['queue_wait_ms']['p50']:g} ms, "
+              f"latency p95 <= {srv['latency_ms']['p95']:g} ms, rejected {srv['rejected']}")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"Wrote {args.out}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -1,130 +1,114 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json
-import jieba
 import math
-from collections import Counter, defaultdict
-
-# 停用词集
-STOPWORDS = set(['\n',' ','\t','，','。','（','）','：','“','”'])
-
-def tokenize(text):
-    return [w for w in jieba.lcut(text) if w.strip() and w not in STOPWORDS]
-
-def load_corpus(path):
-    doc_ids, docs = [], []
-    with open(path, encoding='utf-8') as f:
-        for line in f:
-            obj = json.loads(line)
-            doc_ids.append(obj['name'])
-            docs.append(tokenize(obj['content']))
-    return doc_ids, docs
-
-def load_queries(dev_txt, queries_json):
-    dev = set()
-    with open(dev_txt, encoding='utf-8') as f:
-        for L in f:
-            qid,_ = L.strip().split('\t',1)
-            dev.add(str(qid))
-    qs = []
-    with open(queries_json, encoding='utf-8') as f:
-        for obj in json.load(f):
-            qid = str(obj.get('query_id'))
-            if qid in dev:
-                qs.append((qid, obj['问题']))
-    return qs
+import sys
+from array import array
+from inverted_index import InvertedIndex, posting_tf
+# 兼容旧的导入路径
+from common import STOPWORDS, tokenize, load_queries, load_qrels, micro_recall_at_K
 
 class QueryLikelihood:
-    def __init__(self, docs_tokens, mu=2000):
+    """
+    docs_tokens 只在没有现成 index 时用来建倒排，之后不保留，也不为每篇文档建 Counter；
+    逐篇打分时的词频在查询词的 posting 里二分查找，背景统计按 term id 存成数组
+    stats 给出时（分片索引，见 sharded_index）背景模型取自全集合的 cf、总长度与词表大小，
+    index 只是其中一片
+    """
+    def __init__(self, docs_tokens=None, mu=2000, index=None, stats=None):
         self.mu = mu
-        self.model = [(Counter(d), len(d)) for d in docs_tokens]
-        self.bg_cf = Counter()
-        self.bg_len = 0
-        for tf, ln in self.model:
-            self.bg_cf.update(tf)
-            self.bg_len += ln
-        self.V = len(self.bg_cf)
-
-    def score(self, q_tokens, tf, dl):
+        self.index = index if index is not None else InvertedIndex(docs_tokens)
+        self.N = self.index.N
+        self.doc_len = self.index.doc_len
+        self.stats = stats
+        # 背景概率每个词只算一次，不在逐文档打分时重算；cf 即该词 posting 的 tf 之和
+        if stats is None:
+            self.bg_len = sum(self.doc_len)
+            self.V = len(self.index.terms)
+            off, tfs = self.index.post_off, self.index.post_tfs
+            cf = (sum(tfs[off[t]:off[t + 1]]) for t in range(self.V))
+        else:
+            self.bg_len, self.V = stats.total_len, stats.V
+            cf = (stats.cf[w] for w in self.index.terms)
+        self.p_bg = array('d', ((c + 1) / (self.bg_len + self.V) for c in cf))
+        self.p_unk = 1 / (self.bg_len + self.V)
+        self._last = (None, None, None)    # (q_tokens, term_postings, p_bg)，见 query_terms
+
+    def p_bg_of(self, w):
+        tid = self.index.vocab.get(w)
+        if tid is not None:
+            return self.p_bg[tid]
+        # 分片时本片没有的词在别的分片里仍可能出现
+        if self.stats is not None:
+            return (self.stats.cf.get(w, 0) + 1) / (self.bg_len + self.V)
+        return self.p_unk
+
+    def query_terms(self, q_tokens):
+        """
+        返回 (每个查询词的 posting，不在词表中为 None, 背景概率)；WAND 会用同一个查询
+        连续给很多文档打分，每个查询只取一次
+        """
+        if self._last[0] is not q_tokens:
+            self._last = (q_tokens, self.index.term_postings(q_tokens), [self.p_bg_of(w) for w in q_tokens])
+        return self._last[1], self._last[2]
+
+    def score(self, q_tokens, idx):
+        posts, p_bg = self.query_terms(q_tokens)
+        dl = self.doc_len[idx]
         score = 0.0
-        for w in q_tokens:
-            cf = self.bg_cf.get(w, 0)
-            p_bg = (cf + 1) / (self.bg_len + self.V)
-            p = (tf.get(w, 0) + self.mu * p_bg) / (dl + self.mu)
+        for post, pb in zip(posts, p_bg):
+            tf = posting_tf(post, idx) if post is not None else 0
+            p = (tf + self.mu * pb) / (dl + self.mu)
             score += math.log(p)
         return score
 
+    def score_docs(self, q_tokens, idxs):
+        """
+        只给 idxs 里的文档打分（两阶段重排），词频取自正排索引；得分与 score() 逐位一致
+        """
+        fwd, vocab = self.index.forward(), self.index.vocab
+        q = [(vocab.get(w), self.p_bg_of(w)) for w in q_tokens]
+        out = []
+        for idx in idxs:
+            dl = self.doc_len[idx]
+            score = 0.0
+            for tid, pb in q:
+                tf = fwd.tf(idx, tid) if tid is not None else 0
+                score += math.log((tf + self.mu * pb) / (dl + self.mu))
+            out.append(score)
+        return out
+
     def query(self, q_tokens, topk=None):
-        scores = [(idx, self.score(q_tokens, tf, dl))
-                  for idx,(tf, dl) in enumerate(self.model)]
+        # 按文档序逐篇打分，每个查询词一个游标顺着 posting 前进（doc id 升序），
+        # 不按文档查表；得分按查询词顺序累加，与 score() 逐位一致
+        posts, p_bg = self.query_terms(q_tokens)
+        mu, doc_len, N = self.mu, self.doc_len, self.N
+        # 游标: [下一个命中的 doc, 位置, doc ids, tfs, μ·p_bg]
+        cur = []
+        for p, pb in zip(posts, p_bg):
+            ids, tfs = p if p is not None else ((), ())
+            cur.append([ids[0] if len(ids) else N, 0, ids, tfs, mu * pb])
+        scores = []
+        for idx in range(N):
+            den = doc_len[idx] + mu
+            score = 0.0
+            for c in cur:
+                if c[0] == idx:
+                    j = c[1]
+                    score += math.log((c[3][j] + c[4]) / den)
+                    j += 1
+                    c[1] = j
+                    c[0] = c[2][j] if j < len(c[2]) else N
+                else:
+                    score += math.log(c[4] / den)
+            scores.append((idx, score))
         scores.sort(key=lambda x: x[1], reverse=True)
         return scores if topk is None else scores[:topk]
 
-# ———— 以下两个是评测所需 ————
-def load_qrels(path):
-    """
-    读取 relevance 文件 (<qid> 0 <docid> <rel>)，只保留 rel>0
-    返回 dict: qid -> set(docid)
-    """
-    qrels = defaultdict(set)
-    with open(path, encoding='utf-8') as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) != 4: 
-                continue
-            qid, _, docid, rel = parts
-            if int(rel) > 0:
-                qrels[qid].add(docid)
-    return qrels
-
-def micro_recall_at_K(qrels, runs, K):
-    """
-    计算 micro‑recall@K：∑_q |retrieved∩relevant|  / ∑_q |relevant|
-    """
-    total_rel = sum(len(rset) for rset in qrels.values())
-    total_ret = 0
-    for qid, rel_docs in qrels.items():
-        retrieved = [d for d,_ in runs.get(qid, [])[:K]]
-        total_ret += sum(1 for d in retrieved if d in rel_docs)
-    return total_ret / total_rel if total_rel else 0.0
-# ———————————————————————
-
-def main():
-    CORPUS       = 'STARD/data/corpus.jsonl'
-    DEV_TXT      = 'STARD/data/example/dev.query.txt'
-    QUERIES_JSON = 'STARD/data/queries.json'
-    OUTPUT       = 'ql.run.jewelstar'
-    TOPK         = 1000
-    MU           = 2000
-
-    # 1) 载入语料
-    doc_ids, docs_tokens = load_corpus(CORPUS)
-
-    # 2) 构建 QL 模型
-    ql = QueryLikelihood(docs_tokens, mu=MU)
-
-    # 3) 读取查询
-    queries = load_queries(DEV_TXT, QUERIES_JSON)
-
-    # 4) 检索、写 run，同时保留 runs
-    runs = {}
-    with open(OUTPUT, 'w', encoding='utf-8') as out:
-        for qid, text in queries:
-            q_tokens = tokenize(text)
-            hits = ql.query(q_tokens, topk=TOPK)
-            runs[qid] = [(doc_ids[idx], score) for idx, score in hits]
-            for rank, (idx, score) in enumerate(hits, start=1):
-                out.write(f"{qid} Q0 {doc_ids[idx]} {rank} {score:.6f} QL\n")
-
-    print(f"✅ Generated {OUTPUT}")
-
-    # 5) 当场评测 (micro recall@K)
-    qrels = load_qrels('relevance.jewelstar')
-    print("\n=== On-the-fly evaluation ===")
-    for K in [5,10,15,20,30,100,200,500,1000]:
-        r = micro_recall_at_K(qrels, runs, K)
-        print(f"recall@{K:<4d} all {r:.4f}")
+def main(argv=None):
+    # 等价于 python make_run.py --models ql；其余参数（如 --profile）原样传给 make_run
+    from make_run import main as make_run_main
+    make_run_main(['--models', 'ql'] + (sys.argv[1:] if argv is None else argv))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+通用 make_run：一次载入语料/索引/查询，依次跑多个检索模型并各自写出 run 文件
+
+    python make_run.py --models bm25p,bm25,tfidf,ql
+
+语料按分词方式（见 common.TOKENIZERS）只载入一次，所有模型共用；
+'strip' 语料直接由 'raw' 语料过滤得到，不重复分词。
+每个查询的 top-k 一产出就交给 evaluate_metrics.Evaluator 计入完整指标，
+run 文件由后台线程异步写出（也可以不写），评测不需要再读一遍 run 文件。
+"""
+
+import argparse
+import os
+from common import (TOKENIZERS, RunWriter, config_of, load_corpus, load_queries,
+                    micro_recall_at_K)
+from batch_retrieval import iter_retrieve
+from evaluate_metrics import Evaluator, index_relevance, load_relevance, print_results
+from profiling import add_arguments as add_profile_arguments, from_args as profile_from_args, stage
+from query_cache import QUERY_CACHE, QueryTokenCache
+from retrieval_models import MODELS
+
+CORPUS       = 'STARD/data/corpus.jsonl'
+DEV_TXT      = 'STARD/data/example/dev.query.txt'
+QUERIES_JSON = 'STARD/data/queries.json'
+QRELS        = 'relevance.jewelstar'
+TOPK         = 1000
+K_VALUES     = [5,10,15,20,30,100,200,500,1000]
+
+class Session:
+    """
+    共享的语料与查询：按分词方式懒加载，每种只载入一次
+    查询分词结果经 query_cache 持久化缓存（query_cache=None 时不用）；dev_txt=None 时不载入查询
+    index_ram_mb 给出时，未缓存的语料用 spimi_index 在约这么多内存内流式建索引
+    """
+    def __init__(self, corpus_path=CORPUS, dev_txt=DEV_TXT, queries_json=QUERIES_JSON,
+                 workers=None, query_cache=QUERY_CACHE, index_ram_mb=None):
+        self.corpus_path = corpus_path
+        self.workers = workers
+        self.index_ram_mb = index_ram_mb
+        self.query_cache = query_cache
+        self.queries = load_queries(dev_txt, queries_json) if dev_txt else []
+        self._corpora = {}
+        self._query_tokens = {}
+
+    def corpus(self, tokenizer):
+        if tokenizer not in self._corpora:
+            self._corpora[tokenizer] = load_corpus(self.corpus_path, tokenizer,
+                                                   workers=self.workers,
+                                                   raw=self._corpora.get('raw'),
+                                                   ram_mb=self.index_ram_mb)
+        return self._corpora[tokenizer]
+
+    def query_tokens(self, tokenizer):
+        """
+        dict: 查询文本 -> 分词结果
+        """
+        if tokenizer not in self._query_tokens:
+            fn = TOKENIZERS[tokenizer][0]
+            texts = [text for _, text in self.queries]
+            if self.query_cache:
+                with QueryTokenCache(self.query_cache) as cache:
+                    self._query_tokens[tokenizer] = cache.tokenize_all(fn, config_of(tokenizer), texts)
+            else:
+                self._query_tokens[tokenizer] = {t: fn(t) for t in texts}
+        return self._query_tokens[tokenizer]
+
+    def build(self, name, **opts):
+        cls = MODELS[name]
+        return cls(self.corpus(cls.tokenizer), **opts)
+
+def run_models(session, names, topk=TOPK, q_workers=None, out_dir=None, outputs=None,
+               fmt='trec', qrels=None, write=True, **opts):
+    """
+    依次构建并运行 names 中的模型；每个查询的结果一产出就计入评测（给了 qrels 时，
+    格式同 evaluate_metrics.load_relevance），并交给后台线程写 run 文件
+    （write=True 时；fmt='bin' 时文件名加 .bin）
+    返回 (runs, results)：name -> runs (qid -> [(docid, score)])，name -> 指标（无 qrels 时为空）
+    """
+    # 先载入 'raw'，这样 'strip' 可以由它派生
+    for tok in sorted({MODELS[n].tokenizer for n in names}, key=lambda t: t != 'raw'):
+        session.corpus(tok)
+    rel_index = index_relevance(qrels) if qrels is not None else None
+    all_runs, all_results = {}, {}
+    for name in names:
+        with stage(f'{name}/build'):
+            model = session.build(name, **opts)
+        doc_ids = session.corpus(model.tokenizer).doc_ids
+        with stage('query_tokens'):
+            tokens = session.query_tokens(model.tokenizer)
+        tokenize = tokens.__getitem__
+        # 查询词的得分上界等在 fork 前算好，各 worker 直接继承
+        with stage(f'{name}/prepare'):
+            model.prepare(tokens.values())
+        writer = None
+        if write:
+            output = (outputs or {}).get(name)
+            if not output:
+                output = os.path.join(out_dir or '', model.output) + ('.bin' if fmt == 'bin' else '')
+            writer = RunWriter(output, doc_ids, model.tag, fmt)
+        ev = Evaluator(qrels, K_VALUES, index=rel_index) if qrels is not None else None
+        runs = {}
+        # 分阶段计时：search 为取下一个查询的结果（打分 + 排序），write 只是交给写线程
+        results = iter_retrieve(model.search, tokenize, session.queries, topk=topk, workers=q_workers)
+        try:
+            while True:
+                with stage(f'{name}/search'):
+                    item = next(results, None)
+                if item is None:
+                    break
+                qid, hits = item
+                if writer is not None:
+                    with stage(f'{name}/write'):
+                        writer.put(qid, hits)
+                with stage(f'{name}/evaluate'):
+                    runs[qid] = [(doc_ids[idx], score) for idx, score in hits]
+                    if ev is not None:
+                        ev.add(qid, runs[qid])
+        finally:
+            if writer is not None:
+                with stage(f'{name}/write_flush'):
+                    writer.close()
+        all_runs[name] = runs
+        if ev is not None:
+            with stage(f'{name}/evaluate'):
+                all_results[name] = ev.results()
+        if writer is not None:
+            print(f"✅ Generated {output}")
+        msg = model.report()
+        if msg:
+            print(msg)
+    return all_runs, all_results
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("--models", default="bm25p",
+                   help="comma separated, available: " + ",".join(MODELS))
+    p.add_argument("--corpus", default=CORPUS)
+    p.add_argument("--dev", default=DEV_TXT, help="dev.query.txt")
+    p.add_argument("--queries", default=QUERIES_JSON, help="queries.json")
+    p.add_argument("--qrels", default=QRELS, help="relevance file for on-the-fly evaluation")
+    p.add_argument("--topk", type=int, default=TOPK)
+    p.add_argument("--out-dir", default=None)
+    p.add_argument("--format", choices=["trec", "bin"], default="trec",
+                   help="run file format; bin = columnar binary (see run_format.py)")
+    p.add_argument("--workers", type=int, default=None, help="tokenizer processes (default: all CPUs)")
+    p.add_argument("--q-workers", type=int, default=None, help="query processes (default: all CPUs)")
+    p.add_argument("--index-ram-mb", type=float, default=None,
+                   help="build missing index caches with the external-memory indexer within this budget")
+    p.add_argument("--backend", choices=["python", "numpy", "impact"], default="python",
+                   help="impact = quantized impact-ordered index with budgets (see impact_index.py)")
+    p.add_argument("--impact-bits", type=int, default=8, help="impact backend: quantization bits")
+    p.add_argument("--max-postings", type=int, default=None,
+                   help="impact backend: stop each query after this many postings")
+    p.add_argument("--time-budget-ms", type=float, default=None,
+                   help="impact backend: stop each query after this many milliseconds")
+    p.add_argument("--pruning", action="store_true",
+                   help="WAND / Block-Max WAND instead of exhaustive scoring (pays off only for a small --topk)")
+    p.add_argument("--no-query-cache", action="store_true",
+                   help="tokenize queries afresh instead of using the persistent query cache")
+    p.add_argument("--no-run-file", action="store_true",
+                   help="only evaluate in memory, do not write run files")
+    add_profile_arguments(p)
+    args = p.parse_args(argv)
+
+    names = [n.strip() for n in args.models.split(',') if n.strip()]
+    unknown = [n for n in names if n not in MODELS]
+    if unknown:
+        p.error(f"unknown model(s): {','.join(unknown)}")
+    budget = {}
+    if args.backend == 'impact':
+        unsupported = [n for n in names if not MODELS[n].impact_ordered]
+        if unsupported:
+            p.error(f"--backend impact not supported by: {','.join(unsupported)}")
+        budget = dict(impact_bits=args.impact_bits, max_postings=args.max_postings,
+                      time_budget_ms=args.time_budget_ms)
+
+    # --profile 时各阶段（载入、分词、建模型、检索、写文件、评测）计时，未开启时没有额外开销
+    with profile_from_args(args):
+        qrels = load_relevance(args.qrels) if os.path.exists(args.qrels) else None
+        if args.no_run_file and qrels is None:
+            p.error(f"--no-run-file needs a relevance file, {args.qrels} not found")
+
+        session = Session(args.corpus, args.dev, args.queries, workers=args.workers,
+                          query_cache=None if args.no_query_cache else QUERY_CACHE,
+                          index_ram_mb=args.index_ram_mb)
+        all_runs, all_results = run_models(session, names, topk=args.topk, q_workers=args.q_workers,
+                                           out_dir=args.out_dir, fmt=args.format, qrels=qrels,
+                                           write=not args.no_run_file, backend=args.backend,
+                                           pruning=args.pruning, **budget)
+
+        # 当场评测：完整指标（与 evaluate_metrics.py 相同）+ micro‑recall@K
+        if qrels is not None:
+            rel_sets = {q: {d for d, r in g.items() if r > 0} for q, g in qrels.items()}
+            for name, runs in all_runs.items():
+                print(f"\n=== On-the-fly evaluation {name} ===")
+                print_results(all_results[name], K_VALUES, runid=name)
+                print("--- micro‑recall@K ---")
+                for K in K_VALUES:
+                    r = micro_recall_at_K(rel_sets, runs, K)
+                    print(f"recall@{K:<4d} all {r:.4f}")
+
+if __name__ == '__main__':
+    main()
@@ -1,130 +1,117 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json
-import jieba
 import math
-from collections import Counter, defaultdict
+import sys
+import heapq
+from array import array
+from inverted_index import InvertedIndex, posting_tf
+# 兼容旧的导入路径
+from common import tokenize_raw as tokenize, load_qrels, micro_recall_at_K
 
 # -------------- BM25 实现 --------------
 class BM25:
-    def __init__(self, docs, k1=1.5, b=0.75):
-        self.docs = docs
-        self.N = len(docs)
-        self.doc_len = [len(d) for d in docs]
-        self.avg = sum(self.doc_len) / self.N
-        self.tf = []
-        df = Counter()
-        for d in docs:
-            freqs = Counter(d)
-            self.tf.append(freqs)
-            for w in freqs:
-                df[w] += 1
+    """
+    docs 只在没有现成 index 时用来建倒排，之后不保留 token 列表，也不为每篇文档建 Counter；
+    逐篇打分时的词频在查询词的 posting 里二分查找
+    stats 给出时（分片索引，见 sharded_index）idf 与 avgdl 取自全集合的 N、总长度、df，
+    index 只是其中一片
+    """
+    def __init__(self, docs=None, k1=1.5, b=0.75, index=None, stats=None):
+        self.index = index if index is not None else InvertedIndex(docs)
+        self.N = self.index.N
+        self.doc_len = self.index.doc_len
+        self._last = (None, None)    # (q_tokens, index.term_postings(q_tokens))，见 score
+        if stats is None:
+            self.avg = sum(self.doc_len) / self.N
+            N, df = self.N, self.index.doc_freqs()
+        else:
+            self.avg = stats.avgdl
+            N, df = stats.N, {w: stats.df[w] for w in self.index.terms}
         self.idf = {
-            w: math.log(1 + (self.N - df_w + 0.5) / (df_w + 0.5))
+            w: math.log(1 + (N - df_w + 0.5) / (df_w + 0.5))
             for w, df_w in df.items()
         }
+        self.set_params(k1, b)
+
+    def set_params(self, k1, b):
+        """
+        换 k1、b：tf、idf、文档长度都与参数无关，只需重算归一化项
+        """
         self.k1, self.b = k1, b
+        # 每篇文档的长度归一化项 k1·(1 - b + b·dl/avg)
+        self.norm = array('d', (
+            self.k1 * (1 - self.b + self.b * dl / self.avg) for dl in self.doc_len
+        ))
 
     def score(self, q_tokens, idx):
-        freqs = self.tf[idx]
+        # WAND 会用同一个查询连续给很多文档打分，查询词的 posting 每个查询只取一次；
+        # 词频按文档二分查找，不把 posting 展开成 dict
+        if self._last[0] is not q_tokens:
+            self._last = (q_tokens, self.index.term_postings(q_tokens))
         dl = self.doc_len[idx]
         s = 0.0
-        for w in q_tokens:
-            if w not in freqs:
+        for w, p in zip(q_tokens, self._last[1]):
+            if p is None:
+                continue
+            f = posting_tf(p, idx)
+            if not f:
                 continue
-            f = freqs[w]
             num = self.idf[w] * f * (self.k1 + 1)
             den = f + self.k1 * (1 - self.b + self.b * dl / self.avg)
             s += num / den
         return s
 
-    def query(self, q_tokens, topk=1000):
-        scores = [(i, self.score(q_tokens, i)) for i in range(self.N)]
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return scores[:topk]
+    def score_docs(self, q_tokens, idxs):
+        """
+        只给 idxs 里的文档打分（两阶段重排）：词频从正排索引按 term id 二分查找，
+        每篇 O(|q|·log)，不展开查询词的 posting；得分与 score() 逐位一致
+        """
+        fwd, vocab = self.index.forward(), self.index.vocab
+        q = [(w, vocab[w]) for w in q_tokens if w in vocab]
+        out = []
+        for idx in idxs:
+            dl = self.doc_len[idx]
+            s = 0.0
+            for w, tid in q:
+                f = fwd.tf(idx, tid)
+                if not f:
+                    continue
+                num = self.idf[w] * f * (self.k1 + 1)
+                den = f + self.k1 * (1 - self.b + self.b * dl / self.avg)
+                s += num / den
+            out.append(s)
+        return out
 
-# ———— 评测函数 ————
-def load_qrels(path):
-    """
-    读取 relevance 文件 (<qid> 0 <docid> <rel>)，只保留 rel>0
-    返回 dict: qid -> set(docid)
-    """
-    qrels = defaultdict(set)
-    with open(path, encoding='utf-8') as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) != 4:
+    def query(self, q_tokens, topk=1000):
+        """
+        term-at-a-time：只累加出现过查询词的文档，堆取 top-k
+        得分与逐篇 score() 完全一致；命中不足 topk 时按文档序补 0 分文档
+        """
+        acc = {}
+        k1p1 = self.k1 + 1
+        norm = self.norm
+        for w in q_tokens:
+            p = self.index.postings(w)
+            if p is None:
                 continue
-            qid, _, docid, rel = parts
-            if int(rel) > 0:
-                qrels[qid].add(docid)
-    return qrels
-
-def micro_recall_at_K(qrels, runs, K):
-    """
-    micro‑recall@K = (∑_q |retrieved∩relevant|) / (∑_q |relevant|)
-    """
-    total_rel = sum(len(rset) for rset in qrels.values())
-    total_ret = 0
-    for qid, rel_docs in qrels.items():
-        retrieved = [d for d,_ in runs.get(qid, [])[:K]]
-        total_ret += sum(1 for d in retrieved if d in rel_docs)
-    return total_ret / total_rel if total_rel else 0.0
+            idf = self.idf[w]
+            for i, f in zip(*p):
+                acc[i] = acc.get(i, 0.0) + idf * f * k1p1 / (f + norm[i])
+        hits = heapq.nlargest(topk, acc.items(), key=lambda x: (x[1], -x[0]))
+        if len(hits) < topk:
+            for i in range(self.N):
+                if i not in acc:
+                    hits.append((i, 0.0))
+                    if len(hits) == topk:
+                        break
+        return hits
 
 # ———— 主流程 ————
-def main():
-    CORPUS       = 'STARD/data/corpus.jsonl'
-    DEV_TXT      = 'STARD/data/example/dev.query.txt'
-    QUERIES_JSON = 'STARD/data/queries.json'
-    QRELS        = 'relevance.jewelstar'
-    OUTPUT       = 'bm25p.run.jewelstar'
-    TOPK         = 1000
-    K_VALUES     = [5,10,15,20,30,100,200,500,1000]
-
-    # 1) 读入语料并分词
-    docs, doc_ids = [], []
-    with open(CORPUS, encoding='utf-8') as f:
-        for line in f:
-            obj = json.loads(line)
-            doc_ids.append(obj['name'])
-            docs.append(jieba.lcut(obj['content']))
-
-    # 2) 构建 BM25
-    bm25 = BM25(docs)
-
-    # 3) 读 dev 查询列表
-    dev_ids = set()
-    with open(DEV_TXT, encoding='utf-8') as f:
-        for L in f:
-            qid, _ = L.strip().split('\t', 1)
-            dev_ids.add(str(qid))
-
-    queries = []
-    with open(QUERIES_JSON, encoding='utf-8') as f:
-        for obj in json.load(f):
-            qid = str(obj.get('query_id'))
-            if qid in dev_ids:
-                queries.append((qid, obj['问题']))
-
-    # 4) 检索、写 run & 收集 runs
-    runs = {}
-    with open(OUTPUT, 'w', encoding='utf-8') as out:
-        for qid, text in queries:
-            q_tokens = jieba.lcut(text)
-            hits = bm25.query(q_tokens, topk=TOPK)
-            runs[qid] = [(doc_ids[idx], score) for idx, score in hits]
-            for rank, (idx, score) in enumerate(hits, start=1):
-                out.write(f"{qid} Q0 {doc_ids[idx]} {rank} {score:.6f} BM25\n")
-
-    print(f"✅ Generated {OUTPUT}")
-
-    # 5) 当场评测 micro‑recall@K
-    qrels = load_qrels(QRELS)
-    print("\n=== On-the-fly evaluation (micro‑recall@K) ===")
-    for K in K_VALUES:
-        r = micro_recall_at_K(qrels, runs, K)
-        print(f"recall@{K:<4d} all {r:.4f}")
+def main(argv=None):
+    # 等价于 python make_run.py --models bm25p；其余参数（如 --profile）原样传给 make_run
+    from make_run import main as make_run_main
+    make_run_main(['--models', 'bm25p'] + (sys.argv[1:] if argv is None else argv))
 
 if __name__ == '__main__':
     main()
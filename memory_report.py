@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文档模型内存对比：旧的 token 列表 + 每篇文档一个 Counter，对比直接从倒排索引打分的新模型
+
+    python memory_report.py --tokenizer raw
+
+旧表示（BM25 / QL 原先的做法，逐篇穷举打分，不建倒排）：
+  docs      每篇文档的 token 列表
+  tf        [Counter(d)]                 BM25 的逐文档词频
+  doc_len   list + idf dict              BM25 的文档长度与 idf
+  model     [(Counter(d), len(d))]       QL 的逐文档词频
+  bg_cf     Counter                      QL 的全语料词频
+新表示（BM25 与 QL 共用一份倒排）：
+  post_off / post_ids / post_tfs   倒排 posting 的三段 buffer
+  doc_len                          array('i')
+  vocab / terms                    词表 dict、term id -> term 的 list 及词串本身
+  idf / norm                       BM25 的 idf dict 与长度归一化 array('d')
+  p_bg                             QL 按 term id 的背景概率 array('d')
+  模型打分直接在倒排 posting 里二分查找词频，不再持有逐文档结构
+按需构建（不计入新表示的合计，单独列出）：
+  ForwardIndex   off / terms / tfs 三段 array，term id 与倒排共用；模型不构建，
+                 只在增量索引维护 df/cf、rerank.py 给候选打分时由 InvertedIndex.forward() 建一次
+Python 对象用 tracemalloc 统计构建时新分配的内存；倒排的 buffer 可能是 mmap（tracemalloc 看不到），
+按字节数计，词表按 sys.getsizeof 计。
+"""
+
+import argparse
+import gc
+import math
+import sys
+import tracemalloc
+from collections import Counter
+from array import array
+from common import load_corpus
+from inverted_index import ForwardIndex
+from make_ql_run import QueryLikelihood
+from make_run import CORPUS
+from make_run_jewelstar import BM25
+
+def _measure(build):
+    """
+    返回 (结果, 构建后仍占用的字节数)
+    """
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    gc.collect()
+    return obj, tracemalloc.get_traced_memory()[0] - before
+
+def _fmt(n):
+    if n < (1 << 20):
+        return f"{n / (1 << 10):10.1f} KiB"
+    return f"{n / (1 << 20):10.1f} MiB"
+
+def report(corpus):
+    index = corpus.index
+    rows = []
+    tracemalloc.start()
+    try:
+        # ———— 旧表示 ————
+        docs, n = _measure(corpus.docs)
+        rows.append(('old', 'token lists', n))
+        tf, n = _measure(lambda: [Counter(d) for d in docs])
+        rows.append(('old', 'BM25 per-doc Counter', n))
+
+        def bm25_stats():
+            df = Counter()
+            for c in tf:
+                df.update(c.keys())
+            N = len(docs)
+            return ([len(d) for d in docs],
+                    {w: math.log(1 + (N - f + 0.5) / (f + 0.5)) for w, f in df.items()})
+        stats, n = _measure(bm25_stats)
+        rows.append(('old', 'BM25 doc_len list + idf', n))
+        model, n = _measure(lambda: [(Counter(d), len(d)) for d in docs])
+        rows.append(('old', 'QL per-doc (Counter, len)', n))
+
+        def bg():
+            cf = Counter()
+            for c, _ in model:
+                cf.update(c)
+            return cf
+        bg_cf, n = _measure(bg)
+        rows.append(('old', 'QL background Counter', n))
+        del docs, tf, stats, model, bg_cf
+
+        # ———— 新表示 ————
+        rows.append(('new', 'postings (off/ids/tfs)',
+                     sum(memoryview(a).nbytes for a in (index.post_off, index.post_ids, index.post_tfs))))
+        rows.append(('new', 'doc_len array', memoryview(index.doc_len).nbytes))
+        rows.append(('new', 'vocab + terms', sys.getsizeof(index.vocab) + sys.getsizeof(index.terms)
+                     + sum(sys.getsizeof(w) for w in index.terms)))
+        bm25, n = _measure(lambda: BM25(index=index))
+        rows.append(('new', 'BM25 idf + norm array', n))
+        ql, n = _measure(lambda: QueryLikelihood(index=index))
+        rows.append(('new', 'QL background array', n))
+        fwd, n = _measure(lambda: ForwardIndex(index))
+        rows.append(('on demand', 'ForwardIndex (CSR)', n))
+        del fwd, bm25, ql
+    finally:
+        tracemalloc.stop()
+    return rows
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="memory footprint of the old and new document models")
+    p.add_argument("--corpus", default=CORPUS)
+    p.add_argument("--tokenizer", choices=["raw", "strip"], default="raw")
+    args = p.parse_args(argv)
+
+    corpus = load_corpus(args.corpus, args.tokenizer)
+    index = corpus.index
+    print(f"{index.N} docs, {len(index.terms)} terms, {len(index.post_ids)} postings, "
+          f"{sum(index.doc_len)} tokens")
+    rows = report(corpus)
+    total = {'old': 0, 'new': 0, 'on demand': 0}
+    for kind, name, n in rows:
+        print(f"{kind:<10}{name:<28}{_fmt(n)}")
+        total[kind] += n
+    # BM25 + QL 同时在内存中时：旧表示各有一份逐文档 Counter
+    print(f"old total{'':<29}{_fmt(total['old'])}")
+    print(f"new total{'':<29}{_fmt(total['new'])}")
+
+if __name__ == '__main__':
+    main()
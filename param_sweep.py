@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+参数扫描：BM25 的 k1/b、QL 的 μ
+
+    python param_sweep.py --model bm25p --k1 0.9 1.2 1.5 --b 0.4 0.75
+    python param_sweep.py --model ql --mu 500 1000 2000
+
+语料、索引、查询分词、qrels 都只准备一次；模型也只建一次，每个参数点用 set_params
+就地换参数（idf、df、cf、文档长度等与参数无关的统计量共用）。
+每个参数点跑完整批查询后直接把排序结果交给 evaluate_metrics.Evaluator，不写 run 文件。
+参数点分给多个进程（fork 继承已建好的模型），--backend numpy 时每个参数点
+只重算 posting 权重，整批查询一次稀疏矩阵乘。
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+from evaluate_metrics import Evaluator, index_relevance, load_relevance
+from make_run import CORPUS, DEV_TXT, QUERIES_JSON, QRELS, TOPK, K_VALUES, Session
+from retrieval_models import MODELS
+
+# fork 前设置，worker 继承
+_model = None
+_queries = None      # [(qid, q_tokens)]
+_doc_ids = None
+_qrels = None
+_index = None
+_topk = None
+
+def _run_point(params):
+    _model.set_params(**params)
+    ev = Evaluator(_qrels, K_VALUES, index=_index)
+    hits = _model.batch_search([q for _, q in _queries], topk=_topk)
+    for (qid, _), h in zip(_queries, hits):
+        ev.add(qid, [(_doc_ids[i], s) for i, s in h])
+    return params, ev.results()
+
+def sweep(model, queries, doc_ids, qrels, grid, topk=TOPK, workers=None):
+    """
+    queries: [(qid, q_tokens)]；grid: [dict 参数]
+    返回 [(参数, 指标)]，顺序与 grid 相同
+    """
+    global _model, _queries, _doc_ids, _qrels, _index, _topk
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(grid))
+    _model, _queries, _doc_ids, _qrels, _topk = model, queries, doc_ids, qrels, topk
+    _index = index_relevance(qrels)
+    try:
+        if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return [_run_point(p) for p in grid]
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            return pool.map(_run_point, grid, chunksize=1)
+    finally:
+        _model = _queries = _doc_ids = _qrels = _index = _topk = None
+
+def make_grid(values):
+    """
+    values: 参数名 -> 取值列表；返回笛卡尔积 [dict]
+    """
+    names = list(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(values[n] for n in names))]
+
+def main(argv=None):
+    sweepable = [n for n, cls in MODELS.items() if cls.sweep]
+    p = argparse.ArgumentParser(description="grid search over retrieval model parameters")
+    p.add_argument("--model", choices=sweepable, default="bm25p")
+    p.add_argument("--k1", type=float, nargs='+')
+    p.add_argument("--b", type=float, nargs='+')
+    p.add_argument("--mu", type=float, nargs='+')
+    p.add_argument("--corpus", default=CORPUS)
+    p.add_argument("--dev", default=DEV_TXT, help="dev.query.txt")
+    p.add_argument("--queries", default=QUERIES_JSON, help="queries.json")
+    p.add_argument("--qrels", default=QRELS, help="relevance file")
+    p.add_argument("--topk", type=int, default=TOPK)
+    p.add_argument("--backend", choices=["python", "numpy"], default="python")
+    p.add_argument("--workers", type=int, default=None,
+                   help="parameter points evaluated in parallel (default: all CPUs)")
+    p.add_argument("--sort-by", default="map", help="metric used to pick the best setting")
+    p.add_argument("--out", metavar="TSV", help="also write every metric of every setting")
+    args = p.parse_args(argv)
+
+    cls = MODELS[args.model]
+    values = {}
+    for name, default in cls.sweep.items():
+        given = getattr(args, name)
+        values[name] = given if given else default
+    for name in ('k1', 'b', 'mu'):
+        if getattr(args, name) and name not in cls.sweep:
+            p.error(f"model {args.model} has no parameter {name}")
+    grid = make_grid(values)
+    if args.sort_by not in Evaluator({}, K_VALUES).results():
+        p.error(f"unknown metric {args.sort_by}")
+
+    session = Session(args.corpus, args.dev, args.queries)
+    corpus = session.corpus(cls.tokenizer)
+    model = cls(corpus, backend=args.backend)
+    tokens = session.query_tokens(cls.tokenizer)
+    queries = [(qid, tokens[text]) for qid, text in session.queries]
+    qrels = load_relevance(args.qrels)
+
+    results = sweep(model, queries, corpus.doc_ids, qrels, grid, args.topk, args.workers)
+
+    cols = ['map', 'P_10', 'MRR', 'nDCG@10', 'recall@10', 'recall@100', 'recall@1000']
+    names = list(values)
+    print('\t'.join(names + cols))
+    for params, res in results:
+        print('\t'.join([f"{params[n]:g}" for n in names] + [f"{res[c]:.4f}" for c in cols]))
+    best, res = max(results, key=lambda x: x[1][args.sort_by])
+    print(f"\nbest {args.sort_by} = {res[args.sort_by]:.4f} at " +
+          ', '.join(f"{n}={best[n]:g}" for n in names))
+    if args.out:
+        keys = list(results[0][1])
+        with open(args.out, 'w', encoding='utf-8') as out:
+            out.write('\t'.join(names + keys) + '\n')
+            for params, r in results:
+                out.write('\t'.join([f"{params[n]:g}" for n in names] + [f"{r[k]}" for k in keys]) + '\n')
+        print(f"Wrote {args.out}")
+
+if __name__ == '__main__':
+    main()
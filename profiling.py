@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按阶段计时的轻量 profiling（只用标准库）
+
+    from profiling import profile, stage
+    with profile('profile.json', cprofile='run.prof', trace_malloc=True):
+        with stage('load'):
+            ...
+
+profile() 打开后，stage(name) 记录每个阶段的墙钟时间、CPU 时间（进程内）、
+新增的内存块数（sys.getallocatedblocks 的差值），trace_malloc=True 时再记录阶段前后
+tracemalloc 统计的内存净增量；同名阶段累加次数与耗时，嵌套阶段以 'a/b' 命名。
+结束时把汇总写成 JSON（并打印到 stderr），cprofile 给了文件名时另存 cProfile 的 pstats 数据。
+没有打开 profile() 时 stage() 只返回一个共享的空 context manager，@profiled 只多一次判断，
+几乎没有额外开销。fork 出的 worker 里的阶段不计入。
+"""
+
+import contextlib
+import json
+import sys
+import time
+from functools import wraps
+
+_active = None           # 当前的 Profiler，None 表示未开启
+_NULL = contextlib.nullcontext()
+
+class Profiler:
+    def __init__(self, trace_malloc=False):
+        self.trace_malloc = trace_malloc
+        self.stats = {}          # name -> [count, wall, cpu, blocks, bytes]
+        self.stack = []
+        self.start = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.stack:
+            name = self.stack[-1] + '/' + name
+        self.stack.append(name)
+        # 进入时登记，汇总按阶段开始的先后排列
+        s = self.stats.setdefault(name, [0, 0.0, 0.0, 0, 0])
+        if self.trace_malloc:
+            import tracemalloc
+            traced = tracemalloc.get_traced_memory()[0]
+        blocks = sys.getallocatedblocks()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            blocks = sys.getallocatedblocks() - blocks
+            s[0] += 1
+            s[1] += wall
+            s[2] += cpu
+            s[3] += blocks
+            if self.trace_malloc:
+                s[4] += tracemalloc.get_traced_memory()[0] - traced
+            self.stack.pop()
+
+    def summary(self):
+        out = {
+            'wall_s': time.perf_counter() - self.start,
+            'cpu_s': time.process_time() - self.start_cpu,
+            'stages': [],
+        }
+        for name, (count, wall, cpu, blocks, nbytes) in self.stats.items():
+            row = {'name': name, 'count': count, 'wall_s': wall, 'cpu_s': cpu, 'alloc_blocks': blocks}
+            if self.trace_malloc:
+                row['alloc_bytes'] = nbytes
+            out['stages'].append(row)
+        return out
+
+def stage(name):
+    """
+    with stage('name'): ...；未开启 profile 时什么都不做
+    """
+    if _active is None:
+        return _NULL
+    return _active.stage(name)
+
+def profiled(name):
+    """
+    装饰器：整个函数调用记为一个阶段
+    """
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            with _active.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def enabled():
+    return _active is not None
+
+@contextlib.contextmanager
+def profile(out=None, cprofile=None, trace_malloc=False, top=10):
+    """
+    开启阶段计时；out 为 JSON 汇总路径（None 时只打印），
+    cprofile 为 pstats 输出路径，trace_malloc 同时记录各阶段内存净增量、总峰值与分配最多的代码行
+    """
+    global _active
+    if trace_malloc:
+        import tracemalloc
+        tracemalloc.start()
+    prof = None
+    if cprofile:
+        import cProfile
+        prof = cProfile.Profile()
+    _active = Profiler(trace_malloc)
+    p = _active
+    if prof is not None:
+        prof.enable()
+    try:
+        yield p
+    finally:
+        if prof is not None:
+            prof.disable()
+            prof.dump_stats(cprofile)
+        _active = None
+        summary = p.summary()
+        if trace_malloc:
+            snap = tracemalloc.take_snapshot()
+            summary['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            summary['top_allocations'] = [
+                {'where': str(st.traceback[0]), 'bytes': st.size, 'blocks': st.count}
+                for st in snap.statistics('lineno')[:top]
+            ]
+        print_summary(summary, file=sys.stderr)
+        if out:
+            with open(out, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=1)
+            print(f"Wrote profile summary to {out}", file=sys.stderr)
+        if cprofile:
+            print(f"Wrote cProfile stats to {cprofile} (python -m pstats {cprofile})", file=sys.stderr)
+
+def print_summary(summary, file=sys.stdout):
+    print(f"\n--- profile: wall {summary['wall_s']:.3f}s, cpu {summary['cpu_s']:.3f}s ---", file=file)
+    print(f"{'stage':<36}{'count':>7}{'wall_s':>10}{'cpu_s':>10}{'blocks':>11}", file=file)
+    for s in summary['stages']:
+        print(f"{s['name']:<36}{s['count']:>7}{s['wall_s']:>10.3f}{s['cpu_s']:>10.3f}"
+              f"{s['alloc_blocks']:>11}", file=file)
+
+def peak_rss_mb():
+    """
+    本进程到目前为止的峰值 RSS（MB）
+    """
+    import resource
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位 KB，macOS 为字节
+    return r / (1 << 20) if sys.platform == 'darwin' else r / 1024
+
+def add_arguments(p):
+    """
+    给 argparse 解析器加上 --profile / --cprofile / --tracemalloc
+    """
+    p.add_argument("--profile", nargs='?', const='profile.json', default=None, metavar="JSON",
+                   help="time each stage and write a JSON summary (default: profile.json)")
+    p.add_argument("--cprofile", metavar="FILE", help="also dump cProfile stats to FILE (read with python -m pstats)")
+    p.add_argument("--tracemalloc", action="store_true",
+                   help="also record traced memory per stage and the top allocation sites")
+
+def from_args(args):
+    """
+    按 add_arguments 的参数返回 profile(...) 或空 context manager
+    """
+    if not (args.profile or args.cprofile or args.tracemalloc):
+        return _NULL
+    return profile(args.profile, args.cprofile, args.tracemalloc)
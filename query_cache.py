@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+持久化的查询分词缓存（LRU，条数有上限）
+
+同一批查询会在多个模型、多次参数扫描之间反复分词；分词结果按
+(分词配置, 查询文本) 存进 .index_cache/query_tokens.sqlite，下次直接取出。
+分词配置即 index_store.tokenizer_config（分词器、jieba 版本、停用词），任何一项变了都不会命中旧结果。
+超过 max_entries 条时按最近使用时间淘汰最旧的。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from index_store import INDEX_CACHE
+
+QUERY_CACHE = os.path.join(INDEX_CACHE, 'query_tokens.sqlite')
+QUERY_CACHE_SIZE = 100000
+_BATCH = 500          # 每条 SQL 的参数个数上限以内
+
+def _key(config, text):
+    h = hashlib.sha1(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    h.update(b'\0')
+    h.update(text.encode('utf-8'))
+    return h.hexdigest()
+
+class QueryTokenCache:
+    def __init__(self, path=QUERY_CACHE, max_entries=QUERY_CACHE_SIZE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute('CREATE TABLE IF NOT EXISTS tokens '
+                        '(key TEXT PRIMARY KEY, tokens TEXT NOT NULL, used INTEGER NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS tokens_used ON tokens (used)')
+        self.hits = self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def tokenize_all(self, tokenize, config, texts):
+        """
+        返回 dict: text -> tokens；未命中的用 tokenize 分词并写入缓存
+        """
+        keys = {t: _key(config, t) for t in dict.fromkeys(texts)}
+        by_key = {k: t for t, k in keys.items()}
+        out = {}
+        ks = list(by_key)
+        for i in range(0, len(ks), _BATCH):
+            part = ks[i:i + _BATCH]
+            rows = self.db.execute(
+                f"SELECT key, tokens FROM tokens WHERE key IN ({','.join('?' * len(part))})", part)
+            for k, toks in rows:
+                out[by_key[k]] = json.loads(toks)
+        self.hits += len(out)
+        hit_keys = [keys[t] for t in out]
+
+        with self.db:
+            clock = self.db.execute('SELECT COALESCE(MAX(used), 0) + 1 FROM tokens').fetchone()[0]
+            new = []
+            for t, k in keys.items():
+                if t not in out:
+                    out[t] = tokenize(t)
+                    new.append((k, json.dumps(out[t], ensure_ascii=False), clock))
+            self.misses += len(new)
+            self.db.executemany('INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)', new)
+            # 命中的条目刷新使用时间
+            for i in range(0, len(hit_keys), _BATCH):
+                part = hit_keys[i:i + _BATCH]
+                self.db.execute(
+                    f"UPDATE tokens SET used = ? WHERE key IN ({','.join('?' * len(part))})",
+                    [clock] + part)
+            n = self.db.execute('SELECT COUNT(*) FROM tokens').fetchone()[0]
+            if n > self.max_entries:
+                self.db.execute('DELETE FROM tokens WHERE key IN '
+                                '(SELECT key FROM tokens ORDER BY used LIMIT ?)',
+                                (n - self.max_entries,))
+        return out
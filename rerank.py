@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+两阶段检索：第一阶段候选集缓存 + 只在候选集上重排 + 多路结果融合（RRF / CombSUM）
+
+    python rerank.py --first bm25p --depth 100 --models ql,tfidf,bm25
+    python rerank.py --first bm25p,ql --depth 200 --fuse rrf,combsum
+    python rerank.py --first bm25.run.jewelstar --models bm25p,ql --fuse rrf
+
+--first 的每一项是一个模型名（用 make_run 跑一遍）或一个现成的 run 文件（TREC 文本或 .bin），
+每个查询的前 --depth 个结果存进 .index_cache/candidates/<key>.bin（run_format 的二进制格式），
+key 由来源（语料缓存 key + 模型名 + 查询集，或 run 文件的 sha1）和 depth 决定，之后直接读缓存。
+每个查询的候选集是各路第一阶段结果的并集；--models 里的模型只给候选文档打分
+（RetrievalModel.score_docs：手写 BM25 / QL 从正排索引二分取词频，代价 O(候选数·|q|·log)，
+标准 BM25 用 rank_bm25 自带的逐文档词频，TF-IDF 只取候选行做稀疏矩阵乘），
+得分与全量检索时逐位一致。--fuse 把第一阶段与重排的各路结果融合成一路：
+  rrf      Σ 1/(k + rank)，k 由 --rrf-k 给出（默认 60）
+  combsum  各路得分 min-max 归一化到 [0, 1] 后相加
+重排与融合在同一遍查询循环里完成；各路输出写 run 文件，并当场评测（有 qrels 时）。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from common import RunWriter, config_of
+from evaluate_metrics import Evaluator, index_relevance, load_relevance, load_run
+from index_store import INDEX_CACHE, cache_key, file_sha1
+from make_run import CORPUS, DEV_TXT, K_VALUES, QRELS, QUERIES_JSON, Session, run_models
+from query_cache import QUERY_CACHE
+from retrieval_models import MODELS
+from run_format import BinaryRun, write_run_bin
+
+CANDIDATE_CACHE = os.path.join(INDEX_CACHE, 'candidates')
+RRF_K = 60
+FUSION = ('rrf', 'combsum')
+
+# ———— 第一阶段候选集缓存 ————
+def candidate_path(session, source, depth, cache_dir=CANDIDATE_CACHE):
+    """
+    source 为模型名或 run 文件路径；模型结果依赖语料、分词配置和查询集，run 文件只依赖其内容
+    """
+    if source in MODELS:
+        config = config_of(MODELS[source].tokenizer)
+        key = ['model', source, cache_key(session.corpus_path, config), session.queries]
+    else:
+        key = ['run', file_sha1(source)]
+    h = hashlib.sha1(json.dumps(key + [depth], ensure_ascii=False).encode('utf-8'))
+    return os.path.join(cache_dir, h.hexdigest()[:20] + '.bin')
+
+def load_candidates(path, pos):
+    """
+    qid -> [(doc 下标, score)]；语料里没有的 docid 丢弃
+    """
+    return {qid: [(pos[d], s) for d, s in hits if d in pos] for qid, hits in BinaryRun(path).items()}
+
+def first_stage(session, source, depth, doc_ids, pos, q_workers=None, refresh=False,
+                cache_dir=CANDIDATE_CACHE):
+    """
+    返回 (qid -> 前 depth 个 [(doc 下标, score)], 是否命中缓存)；未命中时跑模型或读 run 文件后写入缓存
+    """
+    path = candidate_path(session, source, depth, cache_dir)
+    if os.path.exists(path) and not refresh:
+        return load_candidates(path, pos), True
+    if source in MODELS:
+        runs = run_models(session, [source], topk=depth, q_workers=q_workers, write=False)[0][source]
+        tag = MODELS[source].tag
+    else:
+        runs = load_run(source)
+        tag = os.path.basename(source)
+    results = [(qid, [(pos[d], s) for d, s in hits[:depth] if d in pos]) for qid, hits in runs.items()]
+    # 先写临时文件再改名；写完从缓存读回，命中与否得到的分数相同（可能存为 float32）
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = path + '.tmp%d' % os.getpid()
+    write_run_bin(tmp, results, doc_ids, tag)
+    os.replace(tmp, path)
+    return load_candidates(path, pos), False
+
+# ———— 融合 ————
+def rrf(lists, k=RRF_K):
+    """
+    Reciprocal Rank Fusion：Σ 1/(k + rank)，按 (得分降序, 文档序升序)
+    """
+    scores = {}
+    for hits in lists:
+        for rank, (idx, _) in enumerate(hits, start=1):
+            scores[idx] = scores.get(idx, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+def combsum(lists):
+    """
+    CombSUM：每路得分 min-max 归一化到 [0, 1] 后相加（一路里得分全相同时都记 1）
+    """
+    scores = {}
+    for hits in lists:
+        if not hits:
+            continue
+        lo = min(s for _, s in hits)
+        span = max(s for _, s in hits) - lo
+        for idx, s in hits:
+            scores[idx] = scores.get(idx, 0.0) + ((s - lo) / span if span else 1.0)
+    return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="cached first-stage candidates, reranking and run fusion")
+    p.add_argument("--first", required=True,
+                   help="comma separated first-stage sources: model names or run files")
+    p.add_argument("--depth", type=int, default=100, help="candidates per query from each source")
+    p.add_argument("--models", default="", help="comma separated models that rescore the candidates")
+    p.add_argument("--fuse", default="", help="comma separated fusion methods: " + ",".join(FUSION))
+    p.add_argument("--rrf-k", type=int, default=RRF_K)
+    p.add_argument("--topk", type=int, default=None, help="results kept per output (default: all candidates)")
+    p.add_argument("--corpus", default=CORPUS)
+    p.add_argument("--dev", default=DEV_TXT, help="dev.query.txt")
+    p.add_argument("--queries", default=QUERIES_JSON, help="queries.json")
+    p.add_argument("--qrels", default=QRELS, help="relevance file for on-the-fly evaluation")
+    p.add_argument("--out-dir", default=None)
+    p.add_argument("--format", choices=["trec", "bin"], default="trec")
+    p.add_argument("--workers", type=int, default=None, help="tokenizer processes (default: all CPUs)")
+    p.add_argument("--q-workers", type=int, default=None,
+                   help="query processes for first-stage models (default: all CPUs)")
+    p.add_argument("--refresh", action="store_true", help="recompute cached candidates")
+    p.add_argument("--no-query-cache", action="store_true")
+    p.add_argument("--no-run-file", action="store_true", help="only evaluate in memory")
+    args = p.parse_args(argv)
+
+    sources = [s.strip() for s in args.first.split(',') if s.strip()]
+    names = [n.strip() for n in args.models.split(',') if n.strip()]
+    methods = [m.strip() for m in args.fuse.split(',') if m.strip()]
+    bad = [s for s in sources if s not in MODELS and not os.path.exists(s)]
+    if bad:
+        p.error(f"neither a model nor a run file: {','.join(bad)}")
+    # 第一阶段各路以模型名或命令行上给的 run 文件路径区分，同名的两个 run 文件不会互相覆盖
+    dup = {s for s in sources if sources.count(s) > 1}
+    if dup:
+        p.error(f"first-stage source given more than once: {','.join(sorted(dup))}")
+    unknown = [n for n in names if n not in MODELS]
+    if unknown:
+        p.error(f"unknown model(s): {','.join(unknown)}")
+    unknown = [m for m in methods if m not in FUSION]
+    if unknown:
+        p.error(f"unknown fusion method(s): {','.join(unknown)}")
+    qrels = load_relevance(args.qrels) if os.path.exists(args.qrels) else None
+    if args.no_run_file and qrels is None:
+        p.error(f"--no-run-file needs a relevance file, {args.qrels} not found")
+
+    session = Session(args.corpus, args.dev, args.queries, workers=args.workers,
+                      query_cache=None if args.no_query_cache else QUERY_CACHE)
+    # 各分词方式的语料 doc id 顺序相同，取用到的第一种即可
+    toks = [MODELS[n].tokenizer for n in [s for s in sources if s in MODELS] + names]
+    doc_ids = session.corpus(toks[0] if toks else 'strip').doc_ids
+    pos = {d: i for i, d in enumerate(doc_ids)}
+
+    # ———— 第一阶段：读缓存或现算 ————
+    firsts = {}
+    for src in sources:
+        t = time.perf_counter()
+        firsts[src], hit = first_stage(session, src, args.depth, doc_ids, pos,
+                                       q_workers=args.q_workers, refresh=args.refresh)
+        how = 'cached' if hit else 'computed' if src in MODELS else 'loaded'
+        print(f"{src}: {how} top-{args.depth} candidates for "
+              f"{len(firsts[src])} queries in {time.perf_counter() - t:.2f}s")
+
+    models = {}
+    for name in names:
+        models[name] = session.build(name, pruning=False)
+        session.query_tokens(models[name].tokenizer)
+
+    # ———— 输出：第一阶段各路、重排各路、融合各路 ————
+    outputs = [(label, None) for label in firsts]
+    outputs += [(f"{n}.rerank", models[n].tag) for n in names]
+    outputs += [(f"{m}.fused", 'RRF' if m == 'rrf' else 'CombSUM') for m in methods]
+    rel_index = index_relevance(qrels) if qrels is not None else None
+    evs = {label: Evaluator(qrels, K_VALUES, index=rel_index) for label, _ in outputs} if qrels else {}
+    writers = {}
+    if not args.no_run_file:
+        ext = '.run.jewelstar' + ('.bin' if args.format == 'bin' else '')
+        for label, tag in outputs[len(firsts):]:
+            writers[label] = RunWriter(os.path.join(args.out_dir or '', label + ext), doc_ids, tag, args.format)
+
+    spent = {n: 0.0 for n in names}
+    num_cands = 0
+    try:
+        for qid, text in session.queries:
+            lists = [first.get(qid, []) for first in firsts.values()]
+            cands = list(dict.fromkeys(idx for hits in lists for idx, _ in hits))
+            num_cands += len(cands)
+            out = dict(zip(firsts, lists))
+            for name, model in models.items():
+                t = time.perf_counter()
+                hits = model.rescore(session.query_tokens(model.tokenizer)[text], cands, args.topk)
+                spent[name] += time.perf_counter() - t
+                out[f"{name}.rerank"] = hits
+            fused_in = list(out.values())
+            for m in methods:
+                hits = rrf(fused_in, args.rrf_k) if m == 'rrf' else combsum(fused_in)
+                out[f"{m}.fused"] = hits if args.topk is None else hits[:args.topk]
+            for label, hits in out.items():
+                if label in writers:
+                    writers[label].put(qid, hits)
+                if label in evs:
+                    evs[label].add(qid, [(doc_ids[idx], s) for idx, s in hits])
+    finally:
+        for w in writers.values():
+            w.close()
+
+    nq = len(session.queries)
+    print(f"{nq} queries, {num_cands / nq if nq else 0:.1f} candidates per query on average")
+    for name in names:
+        print(f"{name}: rescored candidates in {spent[name]:.3f}s ({1000 * spent[name] / max(nq, 1):.2f} ms/query)")
+    for label, w in writers.items():
+        print(f"✅ Generated {w.path}")
+    if evs:
+        from compare_runs import print_table
+        print()
+        print_table(list(evs), [ev.results() for ev in evs.values()], K_VALUES)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+检索模型插件
+
+每个模型是 RetrievalModel 的子类，用 @register 注册到 MODELS，make_run.py 按名字选用。
+模型在 __init__ 里从共享的 CorpusIndex（doc_ids / index / docs()）构建自己，
+对外只需提供 search(q_tokens, topk) -> [(doc 下标, score)]。
+要在 rerank.py 里给候选集重排，再实现 score_docs(q_tokens, idxs) -> 各候选的得分。
+加一个新模型 = 写一个子类并 @register，不需要改 make_run.py。
+可调参的模型再实现 set_params(**params) 并在 sweep 里给出默认网格，供 param_sweep.py 使用。
+各模型的第三方依赖在 __init__ 里才导入，没用到的模型不要求安装。
+python 后端默认穷举打分（BM25 为 term-at-a-time）；pruning=True 才用 WAND：纯 Python 的 WAND
+每篇候选的额外开销大，只在 top-k 很小、且穷举要逐篇打分的 QL 上快于穷举（见 README）。
+"""
+
+from dynamic_pruning import BM25Bounds, OkapiBounds, QLBounds, WandSearcher
+
+MODELS = {}
+
+def register(cls):
+    MODELS[cls.name] = cls
+    return cls
+
+class RetrievalModel:
+    name = None          # --models 里的名字
+    tag = None           # run 文件最后一列
+    output = None        # 默认 run 文件名
+    tokenizer = 'strip'  # common.TOKENIZERS 的 key
+    searcher = None      # 使用 WAND 时的 WandSearcher
+    matrix = None        # numpy 后端的打分矩阵
+    impact = None        # impact 后端的 ImpactSearcher
+    impact_ordered = False  # 能否用 impact 后端（量化 + 按 impact 排序，见 impact_index.py）
+    shardable = False    # 能否接收全局统计量（stats）按分片构建，见 sharded_index.py
+    sweep = {}           # 参数名 -> 默认扫描网格
+
+    def search(self, q_tokens, topk=1000):
+        raise NotImplementedError
+
+    def batch_search(self, queries, topk=1000):
+        """
+        一批查询（分词结果）-> 各自的 [(doc 下标, score)]；numpy 后端整批做一次稀疏矩阵乘
+        """
+        if self.matrix is not None:
+            return self.matrix.batch_query(queries, topk=topk)
+        return [self.search(q, topk=topk) for q in queries]
+
+    def score_docs(self, q_tokens, idxs):
+        """
+        只给 idxs 里的文档打分（两阶段重排，见 rerank.py），得分与 search 给出的相同
+        """
+        raise NotImplementedError
+
+    def rescore(self, q_tokens, idxs, topk=None):
+        """
+        候选文档重排 -> [(doc 下标, score)]，按 (得分降序, 文档序升序)，同分顺序与 search 一致
+        """
+        hits = sorted(zip(idxs, self.score_docs(q_tokens, idxs)), key=lambda x: (-x[1], x[0]))
+        return hits if topk is None else hits[:topk]
+
+    def prepare(self, queries):
+        """
+        检索前对整批查询（分词结果）做一次性的预计算，如 WAND 的词项上界
+        """
+        if self.searcher is not None:
+            self.searcher.prepare(w for q in queries for w in q)
+
+    def set_params(self, **params):
+        """
+        就地换参数，复用已建好的索引与语料统计量
+        """
+        raise NotImplementedError
+
+    def report(self):
+        """
+        检索结束后打印的附加信息（如 WAND 打分文档数），没有则返回 None
+        """
+        if self.impact is not None:
+            return self.impact.report()
+        if self.searcher is None:
+            return None
+        return (f"WAND fully scored {self.searcher.num_scored} docs "
+                f"(exhaustive: {self.searcher.scorer.index.N * self.searcher.num_queries})")
+
+def _rebuild_impact(old, scorer):
+    from impact_index import ImpactSearcher
+    return ImpactSearcher(scorer, old.bits, old.max_postings, old.time_budget_ms)
+
+@register
+class JewelBM25(RetrievalModel):
+    """
+    手写 BM25（make_run_jewelstar.BM25），不过滤停用词
+    """
+    name, tag, output, tokenizer = 'bm25p', 'BM25', 'bm25p.run.jewelstar', 'raw'
+    sweep = {'k1': [0.6, 0.9, 1.2, 1.5, 1.8, 2.1], 'b': [0.3, 0.45, 0.6, 0.75, 0.9]}
+    shardable = True
+    impact_ordered = True
+
+    def __init__(self, corpus, backend='python', pruning=False, k1=1.5, b=0.75, stats=None,
+                 impact_bits=8, max_postings=None, time_budget_ms=None):
+        from make_run_jewelstar import BM25
+        self.bm25 = BM25(k1=k1, b=b, index=corpus.index, stats=stats)
+        if backend == 'impact':
+            from impact_index import ImpactSearcher
+            self.impact = ImpactSearcher(BM25Bounds(self.bm25), impact_bits, max_postings, time_budget_ms)
+            self.search = self.impact.query
+        elif backend == 'numpy':
+            from vector_backend import BM25Matrix
+            self.matrix = BM25Matrix(corpus.index, self.bm25.idf, k1, b)
+            self.search = self.matrix.query
+        elif pruning:
+            self.searcher = WandSearcher(BM25Bounds(self.bm25))
+            self.search = self.searcher.query
+        else:
+            self.search = self.bm25.query
+
+    def score_docs(self, q_tokens, idxs):
+        return self.bm25.score_docs(q_tokens, idxs)
+
+    def set_params(self, k1=1.5, b=0.75):
+        self.bm25.set_params(k1, b)
+        if self.impact is not None:
+            # impact 随参数变化，按原来的位数与预算重新量化
+            self.impact = _rebuild_impact(self.impact, BM25Bounds(self.bm25))
+            self.search = self.impact.query
+        elif self.matrix is not None:
+            self.matrix.set_params(k1, b)
+        elif self.searcher is not None:
+            # 各词的得分上界随参数变化
+            self.searcher = WandSearcher(BM25Bounds(self.bm25))
+            self.search = self.searcher.query
+
+@register
+class OkapiBM25(RetrievalModel):
+    """
+    标准 BM25（rank_bm25.BM25Okapi）
+    """
+    name, tag, output = 'bm25', 'BM25', 'bm25.run.jewelstar'
+    sweep = JewelBM25.sweep
+
+    def __init__(self, corpus, backend='python', pruning=False, k1=1.5, b=0.75):
+        from rank_bm25 import BM25Okapi
+        self.bm25 = BM25Okapi(corpus.docs(), k1=k1, b=b)
+        self.index = corpus.index
+        if backend == 'numpy':
+            from vector_backend import BM25Matrix
+            self.matrix = BM25Matrix(corpus.index, self.bm25.idf, k1, b)
+            self.search = self.matrix.query
+        elif pruning:
+            self.searcher = WandSearcher(OkapiBounds(self.bm25, corpus.index))
+            self.search = self.searcher.query
+
+    def set_params(self, k1=1.5, b=0.75):
+        # BM25Okapi 的 idf 与 k1、b 无关，打分时才读 k1、b
+        self.bm25.k1, self.bm25.b = k1, b
+        if self.matrix is not None:
+            self.matrix.set_params(k1, b)
+        elif self.searcher is not None:
+            self.searcher = WandSearcher(OkapiBounds(self.bm25, self.index))
+            self.search = self.searcher.query
+
+    def score_docs(self, q_tokens, idxs):
+        # BM25Okapi 自带逐文档的词频 dict，逐篇打分与 get_scores 逐位一致
+        sc = OkapiBounds(self.bm25, self.index)
+        return [sc.score(q_tokens, i) for i in idxs]
+
+    def search(self, q_tokens, topk=1000):
+        scores = self.bm25.get_scores(q_tokens)
+        return sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:topk]
+
+@register
+class TfIdf(RetrievalModel):
+    """
+    sklearn TF-IDF 余弦相似度
+    """
+    name, tag, output = 'tfidf', 'TFIDF', 'tfidf.run.jewelstar'
+
+    def __init__(self, corpus, backend='python', pruning=False):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        texts = [" ".join(corpus.tokens(i)) for i in range(corpus.N)]
+        self.vectorizer = TfidfVectorizer(token_pattern=r"(?u)\b\w+\b")
+        self.tfidf_matrix = self.vectorizer.fit_transform(texts)  # (N_docs, V)
+
+    def search(self, q_tokens, topk=1000):
+        from vector_backend import topk_from_scores
+        q_vec = self.vectorizer.transform([" ".join(q_tokens)])   # (1, V)
+        # 余弦相似度 = docs · q_vec.T  （sklearn TF‑IDF 已经 L2 归一化）
+        sims = (self.tfidf_matrix @ q_vec.T).toarray().ravel()
+        return topk_from_scores(sims, topk)      # argpartition 取 top-k，同分按文档序
+
+    def score_docs(self, q_tokens, idxs):
+        # 只取候选文档的行做稀疏矩阵乘
+        q_vec = self.vectorizer.transform([" ".join(q_tokens)])
+        return (self.tfidf_matrix[list(idxs)] @ q_vec.T).toarray().ravel().tolist()
+
+    def batch_search(self, queries, topk=1000):
+        from vector_backend import topk_from_scores
+        Q = self.vectorizer.transform([" ".join(q) for q in queries])   # (B, V)
+        sims = (self.tfidf_matrix @ Q.T).toarray()                      # (N_docs, B)
+        return [topk_from_scores(sims[:, j], topk) for j in range(len(queries))]
+
+@register
+class QL(RetrievalModel):
+    """
+    Dirichlet 平滑 Query Likelihood（make_ql_run.QueryLikelihood）
+    """
+    name, tag, output = 'ql', 'QL', 'ql.run.jewelstar'
+    sweep = {'mu': [250, 500, 1000, 1500, 2000, 3000, 5000]}
+    shardable = True
+
+    impact_ordered = True
+
+    def __init__(self, corpus, backend='python', pruning=False, mu=2000, stats=None,
+                 impact_bits=8, max_postings=None, time_budget_ms=None):
+        from make_ql_run import QueryLikelihood
+        self.ql = QueryLikelihood(mu=mu, index=corpus.index, stats=stats)
+        self.index = corpus.index
+        if backend == 'impact':
+            from impact_index import ImpactSearcher
+            self.impact = ImpactSearcher(QLBounds(self.ql, corpus.index), impact_bits,
+                                         max_postings, time_budget_ms)
+            self.search = self.impact.query
+        elif backend == 'numpy':
+            from vector_backend import QLMatrix
+            self.matrix = QLMatrix(corpus.index, mu=mu)
+            self.search = self.matrix.query
+        elif pruning:
+            self.searcher = WandSearcher(QLBounds(self.ql, corpus.index))
+            self.search = self.searcher.query
+        else:
+            self.search = self.ql.query
+
+    def score_docs(self, q_tokens, idxs):
+        return self.ql.score_docs(q_tokens, idxs)
+
+    def set_params(self, mu=2000):
+        # 背景模型与 μ 无关，QueryLikelihood 打分时才读 μ
+        self.ql.mu = mu
+        if self.impact is not None:
+            self.impact = _rebuild_impact(self.impact, QLBounds(self.ql, self.index))
+            self.search = self.impact.query
+        elif self.matrix is not None:
+            self.matrix.set_params(mu)
+        elif self.searcher is not None:
+            self.searcher = WandSearcher(QLBounds(self.ql, self.index))
+            self.search = self.searcher.query
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+二进制列式 run 文件（.bin），以及与 TREC 文本格式的互转
+
+布局（原生字节序，各段 8 字节对齐）：
+  b'JRUNBIN1'                   magic
+  uint32 + JSON                 头：规模、score 类型、tag、各段偏移
+  qids      字符串表            int64 偏移[nq+1] + UTF-8
+  docids    字符串表            去重后的 docid（runner 写出时就是整个语料的 doc id 表）
+  q_off     int64[nq+1]         每个 query 的命中区间
+  doc_idx   int32[n]            docid 下标
+  scores    float32/float64[n]  所有 score 在 %.6f 下经 float32 往返不变时用 float32
+  ranks     int32[n]            可选：仅当 rank 不是 1..n 顺序时保存
+  score_text 字符串表           可选：score 文本不全是 %.6f 格式时，逐行保存原文（scores 为 float64）
+  tags      字符串表            可选：run 里有多个 tag 时的 tag 表
+  tag_idx   int32[n]            可选：同上，每行 tag 的下标
+只用标准库；定长段用 mmap 直接访问。
+
+互转无损：qid、docid、rank、tag 原样保存；score 文本都是 %.6f 格式（本仓库的 runner 都这样写）时
+按 %.6f 写回，否则写回保存的原文。文本 run 里同一 qid 的行不连续时按 qid 首次出现的顺序分组
+（组内保持原顺序），写回的文本是分组后的顺序。
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b'JRUNBIN1'
+VERSION = 2     # 2: 可选的 score_text / tags / tag_idx 段
+
+def is_binary_run(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def _strings_blob(strings):
+    off, blob = array('q', [0]), bytearray()
+    for s in strings:
+        blob += s.encode('utf-8')
+        off.append(len(blob))
+    return off.tobytes() + bytes(blob)
+
+def _pick_score_code(scores):
+    # float32 往返后 %.6f 不变就用 float32，否则保留 float64
+    f32 = array('f', scores)
+    for a, b in zip(scores, f32):
+        if f"{a:.6f}" != f"{b:.6f}":
+            return 'd'
+    return 'f'
+
+def _write(path, qids, docids, q_off, doc_idx, scores, ranks, tag, score_text=None, tags=None,
+           tag_idx=None):
+    # 保存了 score 原文时 scores 只给评测用，存 float64 与 float(原文) 逐位相同
+    code = 'd' if score_text is not None else _pick_score_code(scores)
+    sections = [
+        ('qids', _strings_blob(qids)),
+        ('docids', _strings_blob(docids)),
+        ('q_off', q_off.tobytes()),
+        ('doc_idx', doc_idx.tobytes()),
+        ('scores', array(code, scores).tobytes()),
+    ]
+    if ranks is not None:
+        sections.append(('ranks', ranks.tobytes()))
+    if score_text is not None:
+        sections.append(('score_text', _strings_blob(score_text)))
+    if tags is not None:
+        sections.append(('tags', _strings_blob(tags)))
+        sections.append(('tag_idx', tag_idx.tobytes()))
+    head = {
+        'version': VERSION,
+        'byteorder': sys.byteorder,
+        'tag': tag,
+        'num_q': len(qids),
+        'num_docids': len(docids),
+        'num_ret': len(doc_idx),
+        'score_type': code,
+        'num_tags': len(tags) if tags is not None else 1,
+        'sections': {},
+    }
+    # 头里记录各段偏移；偏移依赖头长度，先用占位算一次长度
+    def layout(head_len):
+        pos = len(MAGIC) + 4 + head_len
+        for name, data in sections:
+            pos += -pos % 8
+            head['sections'][name] = [pos, len(data)]
+            pos += len(data)
+    head_len = 0
+    while True:
+        layout(head_len)
+        blob = json.dumps(head, ensure_ascii=False).encode('utf-8')
+        if len(blob) == head_len:
+            break
+        head_len = len(blob)
+    with open(path, 'wb') as out:
+        out.write(MAGIC)
+        out.write(struct.pack('<I', head_len))
+        out.write(blob)
+        for name, data in sections:
+            out.write(b'\0' * (head['sections'][name][0] - out.tell()))
+            out.write(data)
+
+def write_run_bin(path, results, doc_ids, tag):
+    """
+    runner 写出：results 为 [(qid, [(doc 下标, score)])]，doc_ids 为整个语料的 id 表
+    """
+    qids, q_off, doc_idx, scores = [], array('q', [0]), array('i'), []
+    for qid, hits in results:
+        qids.append(qid)
+        for idx, score in hits:
+            doc_idx.append(idx)
+            scores.append(float(score))
+        q_off.append(len(doc_idx))
+    _write(path, qids, doc_ids, q_off, doc_idx, scores, None, tag)
+
+class BinaryRun:
+    """
+    mmap 打开的二进制 run；docid 表在打开时解码，定长段不做拷贝
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path}: not a binary run file")
+            head_len, = struct.unpack('<I', f.read(4))
+            self.head = json.loads(f.read(head_len).decode('utf-8'))
+            if self.head['byteorder'] != sys.byteorder:
+                raise ValueError(f"{path}: written on a {self.head['byteorder']}-endian machine")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.tag = self.head['tag']
+        self.qids = self._strings('qids', self.head['num_q'])
+        self.docids = self._strings('docids', self.head['num_docids'])
+        self.q_off = self._section('q_off', 'q')
+        self.doc_idx = self._section('doc_idx', 'i')
+        self.scores = self._section('scores', self.head['score_type'])
+        self.ranks = self._section('ranks', 'i') if 'ranks' in self.head['sections'] else None
+        if 'tags' in self.head['sections']:
+            self.tags = self._strings('tags', self.head['num_tags'])
+            self.tag_idx = self._section('tag_idx', 'i')
+        else:
+            self.tags, self.tag_idx = [self.tag], None
+
+    def _section(self, name, code):
+        pos, size = self.head['sections'][name]
+        return memoryview(self._mm)[pos:pos + size].cast(code)
+
+    def _strings(self, name, n):
+        pos, size = self.head['sections'][name]
+        mv = memoryview(self._mm)[pos:pos + size]
+        off = mv[:8 * (n + 1)].cast('q')
+        blob = mv[8 * (n + 1):]
+        return [bytes(blob[off[i]:off[i + 1]]).decode('utf-8') for i in range(n)]
+
+    def score_texts(self):
+        """
+        逐行的 score 原文；score 都是 %.6f 格式（没有单独保存）时返回 None
+        """
+        if 'score_text' not in self.head['sections']:
+            return None
+        return self._strings('score_text', self.head['num_ret'])
+
+    def __len__(self):
+        return len(self.qids)
+
+    def hits(self, i):
+        """
+        第 i 个 query 的 (doc 下标, score, rank) 列表，按文件中的顺序
+        """
+        a, b = self.q_off[i], self.q_off[i + 1]
+        ranks = self.ranks[a:b] if self.ranks is not None else range(1, b - a + 1)
+        return list(zip(self.doc_idx[a:b], self.scores[a:b], ranks))
+
+    def ranked(self, i):
+        """
+        第 i 个 query 按 rank 排好的 [(docid, score)]，与 evaluate_metrics.load_run 一致
+        """
+        hits = self.hits(i)
+        if self.ranks is not None:
+            hits.sort(key=lambda x: x[2])
+        docids = self.docids
+        return [(docids[d], s) for d, s, _ in hits]
+
+    def items(self):
+        for i, qid in enumerate(self.qids):
+            yield qid, self.ranked(i)
+
+# ———— 与 TREC 文本互转 ————
+def text_to_bin(src, dst):
+    """
+    TREC 文本 -> 二进制；同一 qid 的行不必连续，按 qid 首次出现的顺序分组
+    """
+    groups = {}     # qid -> (doc 下标, score, rank, score 原文, tag 下标)，组内为文件中的顺序
+    intern, docids = {}, []
+    tag_ix, tags = {}, []
+    fixed6 = True   # score 文本是否都是 %.6f 格式
+    with open(src, encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) < 6 or parts[1] != 'Q0':
+                continue
+            qid, docid, text, tag = parts[0], ' '.join(parts[2:-3]), parts[-2], parts[-1]
+            g = groups.get(qid)
+            if g is None:
+                g = groups[qid] = (array('i'), [], array('i'), [], array('i'))
+            d = intern.get(docid)
+            if d is None:
+                d = intern[docid] = len(docids)
+                docids.append(docid)
+            t = tag_ix.get(tag)
+            if t is None:
+                t = tag_ix[tag] = len(tags)
+                tags.append(tag)
+            score = float(text)
+            fixed6 = fixed6 and f"{score:.6f}" == text
+            g[0].append(d)
+            g[1].append(score)
+            g[2].append(int(parts[-3]))
+            g[3].append(text)
+            g[4].append(t)
+
+    q_off, doc_idx, scores, ranks = array('q', [0]), array('i'), [], array('i')
+    score_text, tag_idx = [], array('i')
+    implicit = True
+    for g in groups.values():
+        implicit = implicit and all(r == k for k, r in enumerate(g[2], start=1))
+        doc_idx.extend(g[0])
+        scores.extend(g[1])
+        ranks.extend(g[2])
+        score_text.extend(g[3])
+        tag_idx.extend(g[4])
+        q_off.append(len(doc_idx))
+    multi = len(tags) > 1
+    _write(dst, list(groups), docids, q_off, doc_idx, scores, None if implicit else ranks,
+           tags[0] if tags else '', None if fixed6 else score_text,
+           tags if multi else None, tag_idx if multi else None)
+
+def bin_to_text(src, dst):
+    run = BinaryRun(src)
+    docids, tags, tag_idx = run.docids, run.tags, run.tag_idx
+    texts = run.score_texts()
+    with open(dst, 'w', encoding='utf-8') as out:
+        for i, qid in enumerate(run.qids):
+            for j, (d, score, rank) in enumerate(run.hits(i), start=run.q_off[i]):
+                s = texts[j] if texts is not None else f"{score:.6f}"
+                tag = tags[tag_idx[j]] if tag_idx is not None else tags[0]
+                out.write(f"{qid} Q0 {docids[d]} {rank} {s} {tag}\n")
+
+if __name__ == "__main__":
+    import argparse
+    p = argparse.ArgumentParser(description="convert between TREC text runs and binary runs")
+    p.add_argument("direction", choices=["to-bin", "to-text"])
+    p.add_argument("src")
+    p.add_argument("dst")
+    args = p.parse_args()
+    if args.direction == "to-bin":
+        text_to_bin(args.src, args.dst)
+    else:
+        bin_to_text(args.src, args.dst)
+    print(f"Wrote {args.dst} ({os.path.getsize(args.dst)} bytes)")
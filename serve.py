@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+常驻的本地检索服务（asyncio，HTTP/1.1，只用标准库）
+
+    python serve.py --models bm25p,ql --backend numpy --port 8765
+    python serve.py --models tfidf --unix /tmp/jewelstar.sock
+
+语料、索引和模型只在启动时载入/构建一次，之后一直留在内存里。
+  POST /search   {"model": "bm25p", "q": "查询文本", "topk": 10}
+                 或直接给分词结果 {"model": "bm25p", "tokens": [...], "topk": 10}
+                 -> {"model", "hits": [[docid, score], ...], "batch_size", "latency_ms"}
+  GET  /stats    每个模型的排队/总延迟直方图、batch 大小分布、拒绝数
+  GET  /health
+每个模型一个有界队列 + 一个攒批协程：第一个请求到达后最多再等 --max-wait-ms，
+或攒满 --max-batch 个，整批交给模型的 batch_search（numpy 后端为一次稀疏矩阵乘），
+在该模型专用的线程里执行，事件循环不被打分阻塞。
+队列满时直接返回 503（带 Retry-After），不无限堆积请求。
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+MAX_BODY = 1 << 20
+# 延迟直方图的桶上界（毫秒），最后一个桶为 +inf
+LATENCY_BUCKETS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+class Histogram:
+    """
+    固定桶的直方图；分位数取所在桶的上界
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, v):
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.n += 1
+        self.total += v
+        self.max = max(self.max, v)
+
+    def quantile(self, q):
+        if not self.n:
+            return 0.0
+        need = q * self.n
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= need:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        labels = [f"<={b:g}" for b in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return {
+            'count': self.n,
+            'mean': self.total / self.n if self.n else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+class Overloaded(Exception):
+    pass
+
+class Batcher:
+    """
+    一个模型的请求队列与攒批执行
+    """
+    def __init__(self, model, tokenize, doc_ids, max_batch=32, max_wait_ms=2.0, queue_size=256):
+        self.model = model
+        self.tokenize = tokenize
+        self.doc_ids = doc_ids
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue(queue_size)
+        # 模型不是线程安全的（如 WAND 的计数、查询级缓存），每个模型只用一个线程
+        self.pool = ThreadPoolExecutor(1, thread_name_prefix=f"batch-{model.name}")
+        self.wait_hist = Histogram(LATENCY_BUCKETS_MS)
+        self.latency_hist = Histogram(LATENCY_BUCKETS_MS)
+        self.batch_hist = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.rejected = 0
+
+    async def submit(self, query, topk):
+        """
+        query 为文本或分词结果；返回 ([(docid, score)], batch 大小)
+        """
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((query, topk, fut, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise Overloaded(f"queue for {self.model.name} is full")
+        return await fut
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            start = time.perf_counter()
+            for *_, t in batch:
+                self.wait_hist.add(1000 * (start - t))
+            self.batch_hist.add(len(batch))
+            try:
+                results = await loop.run_in_executor(self.pool, self._search, batch)
+            except Exception as e:
+                # 整批出错时逐条重跑，只让出错的请求失败，同批的其他请求照常返回
+                if len(batch) == 1:
+                    results = [e]
+                else:
+                    results = await loop.run_in_executor(self.pool, self._search_each, batch)
+            end = time.perf_counter()
+            for (_, _, fut, t), hits in zip(batch, results):
+                self.latency_hist.add(1000 * (end - t))
+                if fut.done():              # 客户端已断开时 future 可能被取消
+                    continue
+                if isinstance(hits, Exception):
+                    fut.set_exception(hits)
+                else:
+                    fut.set_result((hits, len(batch)))
+
+    def _search(self, batch):
+        # 在模型线程里分词 + 打分；不同 topk 的请求按最大的 topk 一起算再截断
+        queries = [self.tokenize(q) if isinstance(q, str) else q for q, *_ in batch]
+        topk = max(k for _, k, *_ in batch)
+        hits = self.model.batch_search(queries, topk=topk)
+        doc_ids = self.doc_ids
+        return [[(doc_ids[i], float(s)) for i, s in h[:k]] for h, (_, k, *_) in zip(hits, batch)]
+
+    def _search_each(self, batch):
+        # 每个请求单独检索，出错的位置放异常
+        out = []
+        for item in batch:
+            try:
+                out.append(self._search([item])[0])
+            except Exception as e:
+                out.append(e)
+        return out
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'rejected': self.rejected,
+            'queue_wait_ms': self.wait_hist.snapshot(),
+            'latency_ms': self.latency_hist.snapshot(),
+            'batch_size': self.batch_hist.snapshot(),
+        }
+
+# ———— HTTP ————
+async def read_request(reader):
+    """
+    读一个 HTTP/1.1 请求；连接关闭时返回 None
+    """
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError("request header too large")
+    lines = head.decode('latin-1').split('\r\n')
+    method, target, version = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            k, v = line.split(':', 1)
+            headers[k.strip().lower()] = v.strip()
+    n = int(headers.get('content-length', 0))
+    if n > MAX_BODY:
+        raise ValueError("request body too large")
+    body = await reader.readexactly(n) if n else b''
+    return method, urlsplit(target).path, version, headers, body
+
+def write_response(writer, status, obj, keep_alive=True, extra=()):
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+    body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    head = [f"HTTP/1.1 {status} {reasons.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    head += [f"{k}: {v}" for k, v in extra]
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+
+class Server:
+    def __init__(self, batchers, max_topk=1000):
+        self.batchers = batchers
+        self.max_topk = max_topk
+        self.started = time.time()
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    req = await read_request(reader)
+                except ValueError as e:
+                    write_response(writer, 400, {'error': str(e)}, keep_alive=False)
+                    break
+                if req is None:
+                    break
+                method, path, version, headers, body = req
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version == 'HTTP/1.1')
+                status, obj, extra = await self.dispatch(method, path, body)
+                write_response(writer, status, obj, keep_alive, extra)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body):
+        """
+        返回 (状态码, JSON 对象, 额外的响应头)；任何意外的异常都变成 500，连接照常回应
+        """
+        try:
+            return await self._dispatch(method, path, body)
+        except Exception as e:
+            return 500, {'error': f"internal error: {e!r}"}, ()
+
+    async def _dispatch(self, method, path, body):
+        self.requests += 1
+        if path == '/health':
+            return 200, {'status': 'ok', 'models': list(self.batchers)}, ()
+        if path == '/stats':
+            return 200, {'uptime_s': time.time() - self.started, 'requests': self.requests,
+                         'models': {n: b.stats() for n, b in self.batchers.items()}}, ()
+        if path != '/search':
+            return 404, {'error': f"no such endpoint {path}"}, ()
+        if method != 'POST':
+            return 405, {'error': "use POST"}, ()
+        try:
+            req = json.loads(body or b'{}')
+            if not isinstance(req, dict):
+                raise TypeError("body must be a JSON object")
+            name = req.get('model') or next(iter(self.batchers))
+            query = req['tokens'] if 'tokens' in req else req['q']
+            topk = int(req.get('topk', 10))
+        except (ValueError, KeyError, TypeError, OverflowError) as e:
+            # OverflowError: topk 为 1e400 之类解析成 inf 的数
+            return 400, {'error': f"bad request: {e!r}"}, ()
+        # 坏请求在入队前挡掉，不进 batch
+        if not isinstance(name, str):
+            return 400, {'error': "model must be a string"}, ()
+        if 'tokens' in req:
+            if not (isinstance(query, list) and all(isinstance(w, str) for w in query)):
+                return 400, {'error': "tokens must be a list of strings"}, ()
+        elif not isinstance(query, str):
+            return 400, {'error': "q must be a string"}, ()
+        if name not in self.batchers:
+            return 400, {'error': f"model {name} is not loaded"}, ()
+        if not 0 < topk <= self.max_topk:
+            return 400, {'error': f"topk must be in 1..{self.max_topk}"}, ()
+        t = time.perf_counter()
+        try:
+            hits, batch_size = await self.batchers[name].submit(query, topk)
+        except Overloaded as e:
+            return 503, {'error': str(e)}, (('Retry-After', '1'),)
+        except Exception as e:
+            return 500, {'error': repr(e)}, ()
+        return 200, {'model': name, 'hits': hits, 'batch_size': batch_size,
+                     'latency_ms': 1000 * (time.perf_counter() - t)}, ()
+
+async def serve(batchers, host='127.0.0.1', port=8765, unix=None, max_topk=1000):
+    server = Server(batchers, max_topk)
+    tasks = [asyncio.create_task(b.run()) for b in batchers.values()]
+    if unix:
+        srv = await asyncio.start_unix_server(server.handle, path=unix)
+        where = unix
+    else:
+        srv = await asyncio.start_server(server.handle, host, port)
+        where = f"http://{host}:{port}"
+    print(f"Serving {', '.join(batchers)} on {where}", flush=True)
+    try:
+        async with srv:
+            await srv.serve_forever()
+    finally:
+        for t in tasks:
+            t.cancel()
+
+def main(argv=None):
+    from common import TOKENIZERS
+    from make_run import CORPUS, Session
+    from retrieval_models import MODELS
+    p = argparse.ArgumentParser(description="long-lived local retrieval server with micro-batching")
+    p.add_argument("--models", default="bm25p", help="comma separated, available: " + ",".join(MODELS))
+    p.add_argument("--corpus", default=CORPUS)
+    p.add_argument("--backend", choices=["python", "numpy"], default="python")
+    p.add_argument("--pruning", action="store_true", help="WAND instead of exhaustive scoring")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    p.add_argument("--max-batch", type=int, default=32, help="largest micro-batch per model")
+    p.add_argument("--max-wait-ms", type=float, default=2.0,
+                   help="how long the first request of a batch waits for company")
+    p.add_argument("--queue-size", type=int, default=256,
+                   help="pending requests per model before answering 503")
+    p.add_argument("--max-topk", type=int, default=1000)
+    args = p.parse_args(argv)
+
+    names = [n.strip() for n in args.models.split(',') if n.strip()]
+    unknown = [n for n in names if n not in MODELS]
+    if unknown:
+        p.error(f"unknown model(s): {','.join(unknown)}")
+
+    session = Session(args.corpus, dev_txt=None, query_cache=None)
+    batchers = {}
+
+    async def start():
+        # Batcher 的队列要在事件循环里创建
+        for name in names:
+            model = session.build(name, backend=args.backend, pruning=args.pruning)
+            tokenize = TOKENIZERS[model.tokenizer][0]
+            tokenize("预热")           # 启动时加载分词词典，第一个请求不必等
+            batchers[name] = Batcher(model, tokenize, session.corpus(model.tokenizer).doc_ids,
+                                     args.max_batch, args.max_wait_ms, args.queue_size)
+        await serve(batchers, args.host, args.port, args.unix, args.max_topk)
+
+    try:
+        asyncio.run(start())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
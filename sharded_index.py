@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按文档切分的分片索引：每个分片由单独的进程（代表一台节点）构建、载入和检索，
+协调者把查询发给所有分片（scatter），再归并各分片的 top-k（gather）
+
+    python sharded_index.py build --shards 4                       # 切分语料缓存，每片一个进程
+    python sharded_index.py run --shards 4 --models bm25p,ql --check
+    python sharded_index.py node .index_cache/shards/4/shard_001 --listen 0.0.0.0:9001 --authkey KEY
+    python sharded_index.py run --nodes host1:9001,host2:9001 --authkey KEY --models bm25p
+
+分片按文档顺序连续切分，第 i 片的文档在全集合中的下标为 offset + 片内下标。
+目录布局：.index_cache/shards/<片数>/shard_000/<分词方式>/ 为一个 index_store.CorpusIndex，
+meta.json 里另记 offset、全集合文档数和来源语料缓存的 key。
+
+全局统计量：协调者先从各分片收集 N、总长度、每个词的 df / cf，合并成一个
+incremental_index.CollectionStats 发回各分片，分片用它构建 BM25 / QueryLikelihood
+（idf、avgdl、背景概率都按全集合计算，本片没有的查询词也能取到全局 cf）。
+每篇文档的得分与不分片时逐位相同；各分片返回按 (得分降序, 全局下标升序) 排好的 top-k，
+协调者按同样的次序归并，结果与单个索引的 run 文件逐位一致。
+只有能接收全局统计量的模型（RetrievalModel.shardable：bm25p、ql）可以分片，
+打分用 python 后端（WAND 或穷举）：numpy 后端按片内 term id 的顺序累加，不保证逐位一致。
+节点与协调者之间用 multiprocessing.connection（TCP 或 Unix socket，authkey 校验，消息为 pickle），
+本机测试时每个分片起一个 spawn 进程代替一台机器。
+"""
+
+import argparse
+import heapq
+import json
+import os
+import shutil
+import sys
+import time
+import traceback
+from itertools import islice
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from incremental_index import CollectionStats
+from index_store import INDEX_CACHE, CorpusIndex, cache_key
+from retrieval_models import MODELS, RetrievalModel
+
+FORMAT_VERSION = 1
+SHARD_DIR = os.path.join(INDEX_CACHE, 'shards')
+
+# ———— 切分 ————
+def shard_bounds(N, n):
+    """
+    N 篇文档按顺序切成 n 段，返回 n+1 个边界
+    """
+    return [N * i // n for i in range(n + 1)]
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _build_shard(src, start, stop, path, meta):
+    # 在单独的进程里执行：mmap 打开完整的分词语料，只取 [start, stop) 建这一片
+    ci = CorpusIndex.load(src)
+    shard = CorpusIndex.build(ci.doc_ids[start:stop], [ci.tokens(i) for i in range(start, stop)])
+    tmp = path + '.tmp%d' % os.getpid()
+    shutil.rmtree(tmp, ignore_errors=True)
+    shard.save(tmp, meta)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+def build_shards(corpus_path, tokenizer, n, root=SHARD_DIR, workers=None):
+    """
+    把按 tokenizer 分词的语料（.index_cache 中的缓存，没有则先建）切成 n 片，
+    写到 root/<n>/shard_XXX/<tokenizer>/；已是最新的分片不重建。返回各分片目录 root/<n>/shard_XXX
+    """
+    from common import config_of, load_corpus
+    ci = load_corpus(corpus_path, tokenizer, workers=workers)
+    if not 0 < n <= ci.N:
+        raise ValueError(f"cannot split {ci.N} docs into {n} shards")
+    key = cache_key(corpus_path, config_of(tokenizer))
+    bounds = shard_bounds(ci.N, n)
+    dirs, jobs = [], []
+    for i in range(n):
+        d = os.path.join(root, str(n), 'shard_%03d' % i)
+        path = os.path.join(d, tokenizer)
+        meta = {
+            'version': FORMAT_VERSION,
+            'byteorder': sys.byteorder,
+            'source': key,
+            'tokenizer': tokenizer,
+            'shard': i,
+            'shards': n,
+            'offset': bounds[i],
+            'total': ci.N,
+            'N': bounds[i + 1] - bounds[i],
+        }
+        dirs.append(d)
+        if _read_meta(path) != meta:
+            os.makedirs(d, exist_ok=True)
+            jobs.append((os.path.join(INDEX_CACHE, key), bounds[i], bounds[i + 1], path, meta))
+    if jobs:
+        # 每片一个任务，各自只读自己那段文档
+        import multiprocessing
+        with multiprocessing.Pool(min(len(jobs), workers or len(jobs))) as pool:
+            pool.starmap(_build_shard, jobs, chunksize=1)
+        print(f"Built {len(jobs)} {tokenizer} shard(s) under {os.path.join(root, str(n))}")
+    return dirs
+
+# ———— 节点 ————
+class ShardNode:
+    """
+    一个节点：持有一片文档（每种分词方式一份 CorpusIndex）和在其上建好的模型
+    协调者的消息 (op, *args) 交给 handle_<op>(*args)，返回值原样发回
+    """
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        self.corpora = {}     # tokenizer -> (meta, CorpusIndex)
+        self.models = {}      # name -> (offset, RetrievalModel)
+
+    def corpus(self, tokenizer):
+        if tokenizer not in self.corpora:
+            path = os.path.join(self.shard_dir, tokenizer)
+            meta = _read_meta(path)
+            if meta is None or meta.get('version') != FORMAT_VERSION or meta.get('byteorder') != sys.byteorder:
+                raise ValueError(f"{path}: no usable {tokenizer} shard")
+            self.corpora[tokenizer] = (meta, CorpusIndex.load(path))
+        return self.corpora[tokenizer]
+
+    def handle_open(self, tokenizer):
+        """
+        本片的位置、doc id 与局部统计量（N、总长度、每个词的 df / cf）
+        """
+        meta, ci = self.corpus(tokenizer)
+        index = ci.index
+        off, tfs = index.post_off, index.post_tfs
+        return {
+            'offset': meta['offset'],
+            'total': meta['total'],
+            'source': meta['source'],
+            'doc_ids': ci.doc_ids,
+            'N': ci.N,
+            'total_len': sum(index.doc_len),
+            'df': index.doc_freqs(),
+            'cf': {w: sum(tfs[off[t]:off[t + 1]]) for t, w in enumerate(index.terms)},
+        }
+
+    def handle_build(self, name, stats, opts):
+        cls = MODELS[name]
+        meta, ci = self.corpus(cls.tokenizer)
+        self.models[name] = (meta['offset'], cls(ci, backend='python', stats=stats, **opts))
+        return ci.N
+
+    def handle_search(self, name, queries, topk):
+        offset, model = self.models[name]
+        return [[(offset + i, s) for i, s in hits] for hits in model.batch_search(queries, topk=topk)]
+
+    def handle_report(self, name):
+        """
+        (WAND 完整打分的文档数, 穷举时的文档数)；不剪枝时为 (0, 0)
+        """
+        searcher = self.models[name][1].searcher
+        if searcher is None:
+            return 0, 0
+        return searcher.num_scored, searcher.scorer.index.N * searcher.num_queries
+
+def serve_node(shard_dir, address, authkey, ready=None):
+    """
+    在 address 上等协调者连接，一次服务一个协调者；协调者发 shutdown 后退出
+    ready 为 Connection 时把实际监听地址发过去（端口为 0 时由系统分配）
+    """
+    node = ShardNode(shard_dir)
+    with Listener(address, authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+        else:
+            print(f"Serving {shard_dir} on {listener.address}", flush=True)
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError):
+                continue
+            with conn:
+                while True:
+                    try:
+                        op, *args = conn.recv()
+                    except EOFError:
+                        break
+                    if op == 'shutdown':
+                        return
+                    if op == 'close':
+                        break
+                    try:
+                        reply = ('ok', getattr(node, 'handle_' + op)(*args))
+                    except Exception:
+                        reply = ('error', traceback.format_exc())
+                    conn.send(reply)
+
+def spawn_nodes(shard_dirs, authkey, host='127.0.0.1'):
+    """
+    本机每个分片起一个 spawn 进程代替一台节点（不继承父进程的任何状态），
+    返回 (进程列表, 监听地址列表)
+    """
+    import multiprocessing
+    ctx = multiprocessing.get_context('spawn')
+    procs, pipes = [], []
+    for i, d in enumerate(shard_dirs):
+        recv, send = ctx.Pipe(duplex=False)
+        p = ctx.Process(target=serve_node, args=(d, (host, 0), authkey, send),
+                        name=f'shard-{i}', daemon=True)
+        p.start()
+        send.close()
+        procs.append(p)
+        pipes.append(recv)
+    addresses = []
+    for d, recv in zip(shard_dirs, pipes):
+        try:
+            addresses.append(recv.recv())
+        except EOFError:
+            raise RuntimeError(f"node for {d} exited before listening")
+    return procs, addresses
+
+def parse_address(s):
+    """
+    'host:port' -> (host, port)；不带端口的视为 Unix socket 路径
+    """
+    host, sep, port = s.rpartition(':')
+    return (host, int(port)) if sep else s
+
+# ———— 协调者 ————
+def merge_topk(lists, topk):
+    """
+    各分片按 (得分降序, 全局下标升序) 排好的 top-k 归并成全局 top-k，次序与单个索引相同
+    """
+    return list(islice(heapq.merge(*lists, key=lambda h: (-h[1], h[0])), topk))
+
+class Coordinator:
+    """
+    连接各分片节点：合并全局统计量、在各分片上建模型、scatter 查询并归并 top-k
+    """
+    def __init__(self, addresses, authkey):
+        self.conns = [Client(a, authkey=authkey) for a in addresses]
+        self.shards = {}      # tokenizer -> (全局 doc_ids, CollectionStats)
+
+    def _scatter(self, op, *args):
+        # 先全部发出再逐个收，各节点并行处理；收齐后再报错，连接上不留未读的回复
+        for c in self.conns:
+            c.send((op,) + args)
+        replies = [c.recv() for c in self.conns]
+        for i, (status, value) in enumerate(replies):
+            if status != 'ok':
+                raise RuntimeError(f"shard {i} failed on {op}:\n{value}")
+        return [value for _, value in replies]
+
+    def open(self, tokenizer):
+        """
+        载入各分片的 tokenizer 语料，检查分片恰好拼成一个语料，合并全局统计量；
+        返回 (全局 doc_ids, CollectionStats)
+        """
+        if tokenizer not in self.shards:
+            parts = sorted(self._scatter('open', tokenizer), key=lambda p: p['offset'])
+            doc_ids, stats = [], CollectionStats()
+            for p in parts:
+                if (p['offset'] != len(doc_ids) or p['total'] != parts[0]['total']
+                        or p['source'] != parts[0]['source']):
+                    raise ValueError("the shards do not partition one corpus")
+                doc_ids.extend(p['doc_ids'])
+                stats.N += p['N']
+                stats.total_len += p['total_len']
+                stats.df.update(p['df'])
+                stats.cf.update(p['cf'])
+            if len(doc_ids) != parts[0]['total']:
+                raise ValueError(f"the shards cover {len(doc_ids)} of {parts[0]['total']} docs")
+            self.shards[tokenizer] = (doc_ids, stats)
+        return self.shards[tokenizer]
+
+    def build(self, name, **opts):
+        """
+        在每个分片上用全局统计量构建模型，返回 ShardedModel
+        """
+        cls = MODELS[name]
+        if not cls.shardable:
+            raise ValueError(f"model {name} does not take global statistics and cannot be sharded")
+        doc_ids, stats = self.open(cls.tokenizer)
+        self._scatter('build', name, stats, opts)
+        return ShardedModel(self, cls, doc_ids)
+
+    def batch_search(self, name, queries, topk=1000, batch_size=64):
+        """
+        queries 为分词结果；每 batch_size 个查询发一次，返回各自的全局 top-k [(全局下标, score)]
+        """
+        out = []
+        for i in range(0, len(queries), batch_size):
+            per_shard = self._scatter('search', name, queries[i:i + batch_size], topk)
+            out.extend(merge_topk(hits, topk) for hits in zip(*per_shard))
+        return out
+
+    def report(self, name):
+        scored, exhaustive = map(sum, zip(*self._scatter('report', name)))
+        return scored, exhaustive
+
+    def close(self, shutdown=False):
+        """
+        断开连接；shutdown=True 时同时让节点退出
+        """
+        for c in self.conns:
+            try:
+                c.send(('shutdown' if shutdown else 'close',))
+            except OSError:
+                pass
+            c.close()
+        self.conns = []
+
+class ShardedModel(RetrievalModel):
+    """
+    分片上的模型：结果与不分片的同名模型相同，下标为全局文档下标（对应 doc_ids）
+    """
+    def __init__(self, coordinator, cls, doc_ids):
+        self.coordinator = coordinator
+        self.name, self.tag, self.output, self.tokenizer = cls.name, cls.tag, cls.output, cls.tokenizer
+        self.doc_ids = doc_ids
+
+    def search(self, q_tokens, topk=1000):
+        return self.batch_search([q_tokens], topk=topk)[0]
+
+    def batch_search(self, queries, topk=1000):
+        return self.coordinator.batch_search(self.name, list(queries), topk=topk)
+
+    def report(self):
+        scored, exhaustive = self.coordinator.report(self.name)
+        if not exhaustive:
+            return None
+        return (f"WAND fully scored {scored} docs on {len(self.coordinator.conns)} shards "
+                f"(exhaustive: {exhaustive})")
+
+# ———— 命令行 ————
+def run(args, names):
+    from common import write_run
+    from make_run import Session
+    from query_cache import QUERY_CACHE
+    session = Session(args.corpus, args.dev, args.queries, workers=args.workers,
+                      query_cache=QUERY_CACHE)
+    qids = [qid for qid, _ in session.queries]
+    procs = []
+    if args.nodes:
+        addresses = [parse_address(a) for a in args.nodes.split(',')]
+        authkey = args.authkey.encode('utf-8')
+    else:
+        authkey = os.urandom(16)
+        # 各分词方式的分片放在同一组 shard_XXX 目录下，一个节点进程服务一组
+        for tok in sorted({MODELS[n].tokenizer for n in names}):
+            dirs = build_shards(args.corpus, tok, args.shards, workers=args.workers)
+        procs, addresses = spawn_nodes(dirs, authkey)
+    coord = Coordinator(addresses, authkey)
+    ok = True
+    try:
+        for name in names:
+            t = time.perf_counter()
+            model = coord.build(name, pruning=args.pruning)
+            build_s = time.perf_counter() - t
+            tokens = session.query_tokens(model.tokenizer)
+            queries = [tokens[text] for _, text in session.queries]
+            t = time.perf_counter()
+            hits = model.batch_search(queries, topk=args.topk)
+            search_s = time.perf_counter() - t
+            output = os.path.join(args.out_dir or '', model.output)
+            write_run(output, list(zip(qids, hits)), model.doc_ids, model.tag)
+            print(f"✅ Generated {output} ({len(addresses)} shards, build {build_s:.2f}s, "
+                  f"search {search_s:.2f}s)")
+            msg = model.report()
+            if msg:
+                print(msg)
+            if args.check:
+                ref = session.build(name, pruning=args.pruning).batch_search(queries, topk=args.topk)
+                ref_ids = session.corpus(model.tokenizer).doc_ids
+                same = all([(ref_ids[i], s) for i, s in r] == [(model.doc_ids[i], s) for i, s in h]
+                           for r, h in zip(ref, hits))
+                print("identical to the single index" if same else "DIFFERS from the single index")
+                ok = ok and same
+    finally:
+        coord.close(shutdown=bool(procs))
+        for p in procs:
+            p.join()
+    return ok
+
+def main(argv=None):
+    from make_run import CORPUS, DEV_TXT, QUERIES_JSON, TOPK
+    p = argparse.ArgumentParser(description="document-partitioned shards with scatter-gather retrieval")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="split the tokenized corpus into shards, one process per shard")
+    b.add_argument("--shards", type=int, default=4)
+    b.add_argument("--tokenizers", default="raw,strip")
+    b.add_argument("--corpus", default=CORPUS)
+    b.add_argument("--workers", type=int, default=None)
+    n = sub.add_parser("node", help="serve one shard directory to a coordinator")
+    n.add_argument("shard_dir")
+    n.add_argument("--listen", default="127.0.0.1:9001", help="host:port or a Unix socket path")
+    n.add_argument("--authkey", required=True)
+    r = sub.add_parser("run", help="answer the dev queries through the shards and write run files")
+    r.add_argument("--models", default="bm25p")
+    r.add_argument("--shards", type=int, default=4, help="local shards, one node process each")
+    r.add_argument("--nodes", help="comma separated addresses of running nodes instead of local ones")
+    r.add_argument("--authkey", help="shared secret of the --nodes")
+    r.add_argument("--corpus", default=CORPUS)
+    r.add_argument("--dev", default=DEV_TXT)
+    r.add_argument("--queries", default=QUERIES_JSON)
+    r.add_argument("--topk", type=int, default=TOPK)
+    r.add_argument("--out-dir", default=None)
+    r.add_argument("--workers", type=int, default=None)
+    r.add_argument("--pruning", action="store_true", help="WAND instead of exhaustive scoring")
+    r.add_argument("--check", action="store_true",
+                   help="also search the single unsharded index and compare")
+    args = p.parse_args(argv)
+
+    if args.cmd == "build":
+        for tok in args.tokenizers.split(','):
+            for d in build_shards(args.corpus, tok, args.shards, workers=args.workers):
+                print(os.path.join(d, tok))
+    elif args.cmd == "node":
+        serve_node(args.shard_dir, parse_address(args.listen), args.authkey.encode('utf-8'))
+    else:
+        names = [m.strip() for m in args.models.split(',') if m.strip()]
+        bad = [m for m in names if m not in MODELS or not MODELS[m].shardable]
+        if bad:
+            p.error(f"cannot shard model(s): {','.join(bad)} "
+                    f"(shardable: {','.join(m for m, c in MODELS.items() if c.shardable)})")
+        if args.nodes and not args.authkey:
+            p.error("--nodes needs --authkey")
+        if not run(args, names):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+外存建索引（SPIMI）：流式读 corpus.jsonl，内存里只放当前块，超出预算就把块内 posting
+按 term id 排好序写成一个部分倒排文件，读完后 k 路归并成完整的索引
+
+    python spimi_index.py --tokenizer strip --ram-mb 64          # 写入 .index_cache，之后各脚本直接命中
+    python spimi_index.py --corpus big.jsonl --out big_index --ram-mb 256 --workers 8
+
+单遍处理：每篇文档分词后立即分配 term id（按首次出现的顺序，与 InvertedIndex 相同），
+把 (doc, tf) 追加到当前块里该 term 的 posting，token 的 term id 序列、文档长度、doc id 追加到块缓冲。
+块缓冲的估计大小超过 --ram-mb 时：posting 按 term id 写成 run_XXXX.bin，
+分词语料等按顺序追加到最终文件，然后清空。同一个 term 在前面的块里 doc id 都更小，
+归并时按 (term id, 块序) 拼接即有序；部分倒排文件超过 MERGE_FANIN 个时先分组归并。
+常驻内存的只有词表（term -> id）和各部分倒排文件的读缓冲。
+输出目录与 index_store.CorpusIndex.save 的格式、内容逐字节相同，可以直接 CorpusIndex.load；
+index_store.load_or_build(ram_mb=...)（make_run.py --index-ram-mb）用它代替在内存中建索引。
+"""
+
+import heapq
+import os
+import shutil
+import time
+from array import array
+from collections import Counter
+from inverted_index import write_strings
+from profiling import peak_rss_mb
+
+DEFAULT_RAM_MB = 256
+MERGE_FANIN = 64         # 一次最多同时归并的部分倒排文件数
+# 块缓冲大小的估计：每个 posting 两个 int32，每个 token 一个 int32，
+# 块里每个 term 另有 dict 项与两个 array 的固定开销
+POSTING_BYTES = 8
+TOKEN_BYTES = 4
+TERM_BYTES = 240
+
+class SpimiBuilder:
+    """
+    add() 逐篇加入分词后的文档，finish() 归并并写出索引目录 out
+    """
+    def __init__(self, out, ram_mb=DEFAULT_RAM_MB):
+        self.out = out
+        self.budget = int(ram_mb * (1 << 20))
+        self.tmp = os.path.join(out, 'spimi_tmp')
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        self.vocab = {}
+        self.terms = []
+        self.runs = []
+        self.N = self.num_tokens = self.num_postings = 0
+        # 按文档顺序追加的最终文件
+        self.files = {name: open(os.path.join(out, name + '.bin'), 'wb')
+                      for name in ('doc_len', 'doc_off', 'doc_terms', 'doc_ids')}
+        self.doc_ids_off = open(os.path.join(out, 'doc_ids.off'), 'wb')
+        self.files['doc_off'].write(array('q', [0]))
+        self.doc_ids_off.write(array('q', [0]))
+        self._ids_bytes = 0
+        self._new_block()
+
+    def _new_block(self):
+        self.block = {}                 # term id -> (doc ids, tfs)
+        self.doc_len = array('i')
+        self.doc_off = array('q')
+        self.doc_terms = array('i')
+        self.doc_ids = bytearray()
+        self.doc_ids_ends = array('q')
+        self.used = 0
+
+    def add(self, doc_id, tokens):
+        idx = self.N
+        self.N += 1
+        vocab, block = self.vocab, self.block
+        used = 0
+        for w, f in Counter(tokens).items():
+            tid = vocab.get(w)
+            if tid is None:
+                tid = len(self.terms)
+                vocab[w] = tid
+                self.terms.append(w)
+            p = block.get(tid)
+            if p is None:
+                p = block[tid] = (array('i'), array('i'))
+                used += TERM_BYTES
+            p[0].append(idx)
+            p[1].append(f)
+            used += POSTING_BYTES
+            self.num_postings += 1
+        self.doc_terms.extend(vocab[w] for w in tokens)
+        self.num_tokens += len(tokens)
+        self.doc_off.append(self.num_tokens)
+        self.doc_len.append(len(tokens))
+        b = doc_id.encode('utf-8')
+        self.doc_ids += b
+        self._ids_bytes += len(b)
+        self.doc_ids_ends.append(self._ids_bytes)
+        self.used += used + TOKEN_BYTES * len(tokens) + len(b) + 24
+        if self.used >= self.budget:
+            self._flush()
+
+    def _flush(self):
+        """
+        当前块的 posting 按 term id 写成一个部分倒排文件，文档缓冲追加到最终文件
+        """
+        if self.block:
+            path = os.path.join(self.tmp, 'run_%04d.bin' % len(self.runs))
+            _write_run(path, ((tid, *self.block[tid]) for tid in sorted(self.block)))
+            self.runs.append(path)
+        f = self.files
+        f['doc_len'].write(self.doc_len)
+        f['doc_off'].write(self.doc_off)
+        f['doc_terms'].write(self.doc_terms)
+        f['doc_ids'].write(self.doc_ids)
+        self.doc_ids_off.write(self.doc_ids_ends)
+        self._new_block()
+
+    def finish(self):
+        """
+        写出词表与倒排，返回 {'N', 'V', 'num_postings', 'num_tokens', 'blocks'}
+        """
+        self._flush()
+        for fh in list(self.files.values()) + [self.doc_ids_off]:
+            fh.close()
+        runs, level = self.runs, 0
+        # 文件太多时分组归并成更少的部分倒排文件
+        while len(runs) > MERGE_FANIN:
+            merged = []
+            for i in range(0, len(runs), MERGE_FANIN):
+                path = os.path.join(self.tmp, 'merge_%d_%04d.bin' % (level, len(merged)))
+                _write_run(path, _merge(runs[i:i + MERGE_FANIN]))
+                merged.append(path)
+            runs, level = merged, level + 1
+
+        V = len(self.terms)
+        off = array('q', [0])
+        with open(os.path.join(self.out, 'post_ids.bin'), 'wb') as f_ids, \
+                open(os.path.join(self.out, 'post_tfs.bin'), 'wb') as f_tfs:
+            n = 0
+            for tid, ids, tfs in _merge(runs):
+                assert tid == len(off) - 1, f"term id {tid} out of order"
+                f_ids.write(ids)
+                f_tfs.write(tfs)
+                n += len(ids)
+                off.append(n)
+        assert len(off) == V + 1, "some terms have no postings"
+        with open(os.path.join(self.out, 'post_off.bin'), 'wb') as f:
+            f.write(off)
+        write_strings(os.path.join(self.out, 'terms'), self.terms)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        return {'N': self.N, 'V': V, 'num_postings': self.num_postings,
+                'num_tokens': self.num_tokens, 'blocks': len(self.runs)}
+
+# ———— 部分倒排文件 ————
+# 按 term id 升序的记录：int32 term id、int32 posting 数 n、n 个 doc id、n 个 tf
+def _write_run(path, items):
+    with open(path, 'wb') as f:
+        for tid, ids, tfs in items:
+            f.write(array('i', (tid, len(ids))))
+            f.write(ids)
+            f.write(tfs)
+
+def _read_run(path, order):
+    with open(path, 'rb') as f:
+        while True:
+            head = f.read(8)
+            if not head:
+                return
+            tid, n = array('i', head)
+            ids, tfs = array('i'), array('i')
+            ids.frombytes(f.read(4 * n))
+            tfs.frombytes(f.read(4 * n))
+            yield tid, order, ids, tfs
+
+def _merge(paths):
+    """
+    k 路归并，产出 (term id, doc ids, tfs)；同一 term 在各文件里的 posting 按文件顺序拼接
+    """
+    cur = None
+    for tid, _, ids, tfs in heapq.merge(*(_read_run(p, i) for i, p in enumerate(paths))):
+        if cur is not None and cur[0] == tid:
+            cur[1].extend(ids)
+            cur[2].extend(tfs)
+            continue
+        if cur is not None:
+            yield cur
+        cur = (tid, ids, tfs)
+    if cur is not None:
+        yield cur
+
+def build_index(corpus_path, tokenize, out, ram_mb=DEFAULT_RAM_MB, workers=1, chunk_size=None):
+    """
+    流式读 corpus_path、分词（workers 个进程）并写出索引目录 out（不含 meta.json）；
+    返回规模与耗时：N、V、num_postings、num_tokens、blocks、seconds、docs_per_s、peak_rss_mb
+    """
+    from index_store import CHUNK_SIZE, iter_corpus
+    os.makedirs(out, exist_ok=True)
+    t = time.perf_counter()
+    builder = SpimiBuilder(out, ram_mb)
+    for doc_id, tokens in iter_corpus(corpus_path, tokenize, workers, chunk_size or CHUNK_SIZE):
+        builder.add(doc_id, tokens)
+    report = builder.finish()
+    report['seconds'] = time.perf_counter() - t
+    report['docs_per_s'] = report['N'] / report['seconds'] if report['seconds'] else 0.0
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+def main(argv=None):
+    import argparse
+    import json
+    import sys
+    from common import TOKENIZERS, config_of
+    from index_store import INDEX_CACHE, cache_key, index_meta
+    from make_run import CORPUS
+    p = argparse.ArgumentParser(description="memory-bounded single-pass (SPIMI) index construction")
+    p.add_argument("--corpus", default=CORPUS)
+    p.add_argument("--tokenizer", choices=list(TOKENIZERS), default="strip")
+    p.add_argument("--ram-mb", type=float, default=DEFAULT_RAM_MB,
+                   help="flush the in-memory block to disk beyond this size")
+    p.add_argument("--workers", type=int, default=1, help="tokenizer processes")
+    p.add_argument("--out", help="index directory (default: the .index_cache entry for this corpus)")
+    args = p.parse_args(argv)
+
+    config = config_of(args.tokenizer)
+    out = args.out or os.path.join(INDEX_CACHE, cache_key(args.corpus, config))
+    # 先写临时目录再改名，中途中断不会留下半成品
+    tmp = out.rstrip(os.sep) + '.tmp%d' % os.getpid()
+    shutil.rmtree(tmp, ignore_errors=True)
+    report = build_index(args.corpus, TOKENIZERS[args.tokenizer][0], tmp, args.ram_mb, args.workers)
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(index_meta(args.corpus, config, report), f, ensure_ascii=False, indent=1)
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    print(f"Indexed {report['N']} docs ({report['num_tokens']} tokens, {report['V']} terms, "
+          f"{report['num_postings']} postings) into {out}", file=sys.stderr)
+    print(f"{report['blocks']} block(s) at --ram-mb {args.ram_mb:g}, {report['seconds']:.2f}s, "
+          f"{report['docs_per_s']:.0f} docs/s, peak RSS {report['peak_rss_mb']:.0f} MB", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# 仓库根目录下的模块是平铺的脚本，没有打包；测试直接从根目录导入
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 依赖可选包的模型，缺包时跳过对应用例
+NEEDS = {'bm25': 'rank_bm25', 'tfidf': 'sklearn'}
+
+@pytest.fixture(scope='session')
+def corpus():
+    """
+    几百篇的合成语料（benchmark.make_corpus），不需要 STARD
+    """
+    from benchmark import make_corpus
+    from index_store import CorpusIndex
+    doc_ids, docs = make_corpus(300, doc_len=40, vocab=400, seed=3)
+    return CorpusIndex.build(doc_ids, docs)
+
+@pytest.fixture(scope='session')
+def queries(corpus):
+    from benchmark import make_queries
+    queries, _ = make_queries(corpus.doc_ids, corpus.docs(), 25, seed=3)
+    # 另加：不在词表里的词、重复的查询词、空查询
+    return [q for _, q in queries] + [['不存在的词'], ['t1', 't1', 't5'], []]
+
+@pytest.fixture
+def build(corpus):
+    """
+    build(name, **opts) -> 在合成语料上建的检索模型；缺可选依赖时跳过
+    """
+    from retrieval_models import MODELS
+
+    def _build(name, **opts):
+        if name in NEEDS:
+            pytest.importorskip(NEEDS[name])
+        return MODELS[name](corpus, **opts)
+    return _build
+
+@pytest.fixture(scope='session')
+def run_files(corpus, tmp_path_factory):
+    """
+    合成语料上的 qrels 与 bm25p 的 run：qrels（已载入）、qrels_path、
+    trec（TREC 文本）、shuffled（同一 run 打乱行序）、binary（二进制 run）
+    """
+    import random
+    from types import SimpleNamespace
+    from benchmark import make_queries
+    from common import write_run
+    from evaluate_metrics import load_relevance
+    from retrieval_models import MODELS
+    tmp = tmp_path_factory.mktemp('eval')
+    named, qrels = make_queries(corpus.doc_ids, corpus.docs(), 25, seed=3)
+    qrels_path = str(tmp / 'qrels')
+    with open(qrels_path, 'w', encoding='utf-8') as f:
+        for qid, rel in qrels.items():
+            for docid, r in rel.items():
+                f.write(f"{qid} 0 {docid} {r}\n")
+    model = MODELS['bm25p'](corpus)
+    results = [(qid, model.search(q, topk=50)) for qid, q in named]
+    # 再加一个没有相关文档的查询
+    results.append(('q_none', model.search(['t2'], topk=50)))
+    trec, shuffled, binary = str(tmp / 'run'), str(tmp / 'run.shuffled'), str(tmp / 'run.bin')
+    write_run(trec, results, corpus.doc_ids, 'TEST')
+    write_run(binary, results, corpus.doc_ids, 'TEST', fmt='bin')
+    with open(trec, encoding='utf-8') as f:
+        lines = f.readlines()
+    random.Random(0).shuffle(lines)
+    with open(shuffled, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    return SimpleNamespace(qrels=load_relevance(qrels_path), qrels_path=qrels_path,
+                           trec=trec, shuffled=shuffled, binary=binary)
+
+@pytest.fixture(scope='session')
+def corpus_jsonl(tmp_path_factory):
+    """
+    corpus.jsonl 格式（name / content）的小语料，内容是随机拼起来的中文句子，走真正的 jieba 分词
+    """
+    import json
+    import random
+    words = ['被告人', '盗窃', '财物', '价值', '人民币', '元', '，', '。', '合同', '纠纷', '原告',
+             '诉称', '借款', '利息', '的', '了', '法院', '认为', '判决', '如下', '2018年', '3月']
+    rng = random.Random(7)
+    path = tmp_path_factory.mktemp('corpus') / 'corpus.jsonl'
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(200):
+            content = ''.join(rng.choice(words) for _ in range(rng.randint(0, 30)))
+            f.write(json.dumps({'name': f'doc{i}', 'content': content}, ensure_ascii=False) + '\n')
+    return str(path)
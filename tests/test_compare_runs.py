@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""
+compare_runs：对照表与配对检验用同一套 per-query 得分
+"""
+
+import pytest
+
+from compare_runs import evaluate_runs, paired_scores, significance
+from make_run import K_VALUES
+
+@pytest.fixture(scope='module')
+def evaluated(run_files):
+    return evaluate_runs(run_files.qrels, [run_files.trec, run_files.binary], K_VALUES, workers=1)
+
+@pytest.mark.parametrize('metric, summary', [('map', 'map'), ('P_10', 'P_10'),
+                                             ('recip_rank', 'MRR'), ('ndcg_cut_10', 'nDCG@10')])
+def test_table_is_mean_of_tested_scores(run_files, evaluated, metric, summary):
+    # run 覆盖了 qrels 里的全部 query 时，检验用的均值与对照表一致
+    per_query = [pq for _, pq in evaluated]
+    qids, X = paired_scores(per_query, run_files.qrels, metric)
+    assert len(qids) == len(per_query[0])
+    for (res, _), row in zip(evaluated, X):
+        assert row.mean() == pytest.approx(res[summary], rel=1e-12)
+
+def test_missing_query_counts_as_zero(run_files, evaluated):
+    pq = dict(evaluated[0][1])
+    dropped = next(iter(pq))
+    del pq[dropped]
+    qids, X = paired_scores([evaluated[0][1], pq], run_files.qrels, 'map')
+    j = qids.index(dropped)
+    assert X[1, j] == 0.0
+    assert X[0, j] == evaluated[0][1][dropped]['map']
+
+def test_identical_runs_are_not_significant(run_files, evaluated):
+    pytest.importorskip('scipy')
+    qids, X = paired_scores([pq for _, pq in evaluated], run_files.qrels, 'map')
+    sig = significance(X[0], X[1], trials=200)
+    assert sig['t'] == 1.0
+    assert sig['rand'] == 1.0 and sig['boot'] == 1.0
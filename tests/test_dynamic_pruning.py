@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+"""
+WAND / Block-Max WAND 与穷举打分逐位一致
+"""
+
+import pytest
+
+@pytest.mark.parametrize('name', ['bm25p', 'ql', 'bm25'])
+def test_wand_matches_exhaustive(build, corpus, queries, name):
+    wand = build(name, pruning=True)
+    full = build(name)
+    assert wand.searcher is not None and full.searcher is None
+    for q in queries:
+        for k in (1, 10, corpus.N + 5):
+            assert wand.search(q, topk=k) == full.search(q, topk=k)
+
+@pytest.mark.parametrize('name', ['bm25p', 'ql'])
+def test_wand_empty_query_keeps_doc_order(build, corpus, name):
+    # QL 的 fill_order 按文档长度；空查询全部 0 分，应与穷举一样按文档序
+    wand = build(name, pruning=True)
+    assert wand.search([], topk=10) == [(i, 0.0) for i in range(10)]
+    assert wand.search([], topk=corpus.N) == build(name).search([], topk=corpus.N)
+
+def test_block_max_scores_fewer_docs(build, queries):
+    from dynamic_pruning import BM25Bounds, WandSearcher
+    bm25 = build('bm25p').bm25
+    plain = WandSearcher(BM25Bounds(bm25), block_max=False)
+    block = WandSearcher(BM25Bounds(bm25))
+    for q in queries:
+        assert block.query(q, topk=10) == plain.query(q, topk=10)
+    assert block.num_scored <= plain.num_scored < bm25.N * len(queries)
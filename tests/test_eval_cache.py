@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+评测结果缓存：命中时不重新解析 run，新的 K 只补算 recall，run / qrels 改动后不复用旧结果
+"""
+
+import json
+import os
+import shutil
+
+import pytest
+
+import eval_cache
+from eval_cache import cache_path, evaluate_cached
+from evaluate_metrics import evaluate_run, load_relevance
+from make_run import K_VALUES
+
+def _direct(qrels_path, run_path, Ks):
+    ev = evaluate_run(load_relevance(qrels_path), run_path, Ks)
+    return ev.results(), ev.per_query
+
+@pytest.fixture
+def files(run_files, tmp_path):
+    # 拷一份，改动文件的用例不影响其他测试
+    run, qrels = str(tmp_path / 'run'), str(tmp_path / 'qrels')
+    shutil.copy(run_files.trec, run)
+    shutil.copy(run_files.qrels_path, qrels)
+    return qrels, run, str(tmp_path / 'cache')
+
+def _no_parsing(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("cache hit should not parse the files")
+    monkeypatch.setattr(eval_cache, 'load_relevance', fail)
+    monkeypatch.setattr(eval_cache, 'evaluate_run', fail)
+
+@pytest.mark.parametrize('engine', ['python', 'numpy'])
+def test_hit_matches_direct_evaluation(files, monkeypatch, engine):
+    if engine == 'numpy':
+        pytest.importorskip('numpy')
+    qrels, run, cache = files
+    ref = _direct(qrels, run, K_VALUES)
+    assert evaluate_cached(qrels, run, K_VALUES, engine=engine, cache_dir=cache) == ref
+    assert os.path.exists(cache_path(run, qrels, cache))
+    _no_parsing(monkeypatch)
+    assert evaluate_cached(qrels, run, K_VALUES, cache_dir=cache) == ref
+
+def test_new_cutoff_only_adds_recall(files, monkeypatch):
+    qrels, run, cache = files
+    evaluate_cached(qrels, run, [10, 100], cache_dir=cache)
+    used = []
+    real = eval_cache.evaluate_run
+
+    def spy(*args, **kwargs):
+        used.append(kwargs.get('evaluator'))
+        return real(*args, **kwargs)
+    monkeypatch.setattr(eval_cache, 'evaluate_run', spy)
+    assert evaluate_cached(qrels, run, [10, 7, 100], cache_dir=cache) == _direct(qrels, run, [10, 7, 100])
+    assert used == [eval_cache.RecallEvaluator]
+    # 已缓存的 K 的任意子集都直接查表
+    ref = _direct(qrels, run, [7, 100])
+    _no_parsing(monkeypatch)
+    assert evaluate_cached(qrels, run, [7, 100], cache_dir=cache) == ref
+
+@pytest.mark.parametrize('which', ['run', 'qrels'])
+def test_changed_file_is_not_served_from_cache(files, which):
+    qrels, run, cache = files
+    evaluate_cached(qrels, run, K_VALUES, cache_dir=cache)
+    path = run if which == 'run' else qrels
+    with open(path, encoding='utf-8') as f:
+        lines = f.readlines()
+    # 去掉第一行：run 少一个命中 / qrels 少一个相关文档
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(lines[1:])
+    ref = _direct(qrels, run, K_VALUES)
+    got = evaluate_cached(qrels, run, K_VALUES, cache_dir=cache)
+    assert got == ref
+    assert len(os.listdir(cache)) == 2
+
+def test_entries_of_other_versions_are_ignored(files):
+    qrels, run, cache = files
+    evaluate_cached(qrels, run, K_VALUES, cache_dir=cache)
+    path = cache_path(run, qrels, cache)
+    with open(path, encoding='utf-8') as f:
+        entry = json.load(f)
+    # 伪造一个旧版本的条目：得分全部改成 -1
+    entry['version'] = eval_cache.FORMAT_VERSION - 1
+    for scores in entry['per_query'].values():
+        for qid in scores:
+            scores[qid] = -1.0
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(entry, f)
+    assert evaluate_cached(qrels, run, K_VALUES, cache_dir=cache) == _direct(qrels, run, K_VALUES)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+per-query 指标的定义，汇总行与 per-query 平均一致，流式评测与一次性载入一致
+"""
+
+import pytest
+
+from evaluate_metrics import Evaluator, evaluate_run, load_relevance, load_run, summarize
+from make_run import K_VALUES
+
+KS = [1, 2, 10]
+
+def _write(path, lines):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(''.join(line + '\n' for line in lines))
+    return str(path)
+
+@pytest.fixture
+def small(tmp_path):
+    """
+    q1: 3 条结果（不足 10 条），相关文档 d1、d3、d9（d9 未检出）
+    q2: 12 条结果，唯一的相关文档在第 11 名；q3: 没有相关文档
+    """
+    qrels = _write(tmp_path / 'qrels', ['q1 0 d1 1', 'q1 0 d3 2', 'q1 0 d9 1', 'q2 0 x11 1', 'q3 0 d1 0'])
+    run = [f"q1 Q0 {d} {r} {10 - r} T" for r, d in enumerate(['d2', 'd1', 'd3'], start=1)]
+    run += [f"q2 Q0 x{r} {r} {20 - r} T" for r in range(1, 13)]
+    run += ["q3 Q0 d1 1 1.0 T"]
+    return load_relevance(qrels), _write(tmp_path / 'run', run)
+
+def test_per_query_definitions(small):
+    qrels, run = small
+    ev = evaluate_run(qrels, run, KS)
+    q1, q2 = ev.per_query['q1'], ev.per_query['q2']
+    assert set(ev.per_query) == {'q1', 'q2'}
+    assert q1['map'] == pytest.approx((1/2 + 2/3) / 3)
+    assert q1['P_10'] == pytest.approx(0.2)          # 不足 10 条也除以 10
+    assert q1['recip_rank'] == 0.5
+    assert (q1['recall_1'], q1['recall_2'], q1['recall_10']) == (0.0, pytest.approx(1/3), pytest.approx(2/3))
+    # AP 计入第 10 名之后的相关命中
+    assert q2['map'] == pytest.approx(1/11)
+    assert q2['P_10'] == 0.0
+    assert q2['recip_rank'] == pytest.approx(1/11)
+    assert q2['recall_10'] == 0.0
+
+@pytest.mark.parametrize('name, metric', [('map', 'map'), ('P_10', 'P_10'), ('MRR', 'recip_rank'),
+                                          ('nDCG@10', 'ndcg_cut_10'), ('recall@2', 'recall_2'),
+                                          ('recall@10', 'recall_10')])
+def test_summary_is_mean_of_per_query(small, name, metric):
+    qrels, run = small
+    ev = evaluate_run(qrels, run, KS)
+    res = ev.results()
+    assert res['num_q'] == 3 and res['num_rel'] == 4 and res['num_rel_ret'] == 3
+    values = [pq[metric] for pq in ev.per_query.values()]
+    assert res[name] == sum(values) / len(values)
+
+def test_summary_does_not_depend_on_query_order(run_files):
+    runs = load_run(run_files.trec)
+    fwd, rev = Evaluator(run_files.qrels, K_VALUES), Evaluator(run_files.qrels, K_VALUES)
+    for qid, hits in runs.items():
+        fwd.add(qid, hits)
+    for qid, hits in reversed(list(runs.items())):
+        rev.add(qid, hits)
+    assert fwd.per_query == rev.per_query
+    a, b = fwd.results(), rev.results()
+    for k in a:
+        assert a[k] == pytest.approx(b[k], rel=1e-12)
+    assert summarize(fwd.per_query, K_VALUES)['map'] == a['map']
+
+def test_stream_eval_matches_in_memory(run_files):
+    # 打乱行序的文件走外排序；query 顺序与 load_run 相同（汇总值按 query 顺序求平均，舍入与顺序有关）
+    for path in (run_files.trec, run_files.shuffled):
+        ref = evaluate_run(run_files.qrels, path, K_VALUES)
+        ev = evaluate_run(run_files.qrels, path, K_VALUES, stream=True, chunk_lines=97)
+        assert ev.results() == ref.results()
+        assert ev.per_query == ref.per_query
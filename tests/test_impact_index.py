@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+"""
+impact 后端的预算与计数：max_postings 截断、complete 的含义、累计计数、QL 按 base 补齐未命中文档
+"""
+
+from collections import Counter
+
+import pytest
+
+def _total(searcher, q):
+    """
+    查询 q 的全部 posting 数
+    """
+    vocab = searcher.scorer.index.vocab
+    return sum(b - a for w in Counter(q) if w in vocab
+               for _, a, b in searcher.segments[vocab[w]])
+
+@pytest.mark.parametrize('name', ['bm25p', 'ql'])
+def test_max_postings_and_complete(build, queries, name):
+    searcher = build(name, backend='impact').impact
+    for q in queries:
+        total = _total(searcher, q)
+        hits, complete, done = searcher.query_budgeted(q, topk=10)
+        assert (complete, done) == (True, total)
+        for n in {0, 1, total // 2, max(total - 1, 0), total, total + 1}:
+            hits, complete, done = searcher.query_budgeted(q, topk=10, max_postings=n)
+            assert done == min(n, total)
+            # 全部 posting 处理过才算 complete；预算恰好等于 posting 数也算
+            assert complete == (n >= total)
+            assert len(hits) == 10
+
+def test_budget_from_constructor(build, queries):
+    model = build('bm25p', backend='impact', max_postings=3)
+    searcher = model.impact
+    q = max(queries, key=lambda q: _total(searcher, q))
+    assert searcher.query_budgeted(q, topk=10)[1:] == (False, 3)
+    # 查询时给的预算优先
+    total = _total(searcher, q)
+    assert searcher.query_budgeted(q, topk=10, max_postings=total)[1:] == (True, total)
+    assert model.search(q, topk=10) == searcher.query(q, topk=10, max_postings=3)
+
+def test_counters(build, queries):
+    searcher = build('bm25p', backend='impact').impact
+    n = complete = scored = 0
+    for i, q in enumerate(queries):
+        budget = 2 if i % 2 else None
+        _, ok, done = searcher.query_budgeted(q, topk=10, max_postings=budget)
+        n += 1
+        complete += ok
+        scored += done
+        assert (searcher.num_queries, searcher.num_complete, searcher.num_scored) == (n, complete, scored)
+    assert 0 < complete < n
+    assert f"{complete}/{n} queries" in searcher.report()
+
+def test_bm25_fills_zero_scores_in_doc_order(build, corpus):
+    searcher = build('bm25p', backend='impact').impact
+    hits = searcher.query(['t1'], topk=corpus.N)
+    assert sorted(d for d, _ in hits) == list(range(corpus.N))
+    zeros = [d for d, s in hits if s == 0.0]
+    assert zeros == sorted(zeros)
+    assert hits[-len(zeros):] == [(d, 0.0) for d in zeros]
+
+def test_ql_fill_by_base(build, corpus, queries):
+    searcher = build('ql', backend='impact').impact
+    exact = build('ql')
+    # 不在词表里的词：没有 posting，结果全部来自按 base 的补齐，与精确打分同序
+    q = ['不存在的词']
+    hits, complete, done = searcher.query_budgeted(q, topk=20)
+    assert (complete, done) == (True, 0)
+    ref = exact.search(q, topk=20)
+    assert [d for d, _ in hits] == [d for d, _ in ref]
+    for (_, s), (_, r) in zip(hits, ref):
+        assert s == pytest.approx(r, rel=1e-9)
+    for q in queries[:10]:
+        # 预算为 0 时也只剩补齐：base 最高（文档最短）的 topk 篇
+        hits = searcher.query(q, topk=15, max_postings=0)
+        assert [d for d, _ in hits] == list(searcher.scorer.fill_order[:15])
+        # topk 为全部文档时每篇恰好出现一次；不含查询词的文档得分等于精确得分
+        hits = searcher.query(q, topk=corpus.N)
+        assert sorted(d for d, _ in hits) == list(range(corpus.N))
+        ref = dict(exact.search(q, topk=corpus.N))
+        terms = set(q)
+        for d, s in hits:
+            if not terms & set(corpus.tokens(d)):
+                assert s == pytest.approx(ref[d], rel=1e-9)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+增量索引与“用存活文档从头建模型”逐位一致：增、删、更新、合并之后，以及从磁盘重新打开之后
+"""
+
+import random
+import threading
+
+import pytest
+
+from incremental_index import IncrementalIndex
+from make_ql_run import QueryLikelihood
+from make_run_jewelstar import BM25
+
+def _check(idx, truth, queries):
+    """
+    idx 的存活文档与 truth（doc id -> tokens，按加入顺序）相同，检索结果与全量重建相同
+    """
+    ids, docs = idx.live_docs()
+    assert ids == list(truth)
+    assert docs == list(truth.values())
+    if not docs:
+        for q in queries:
+            assert idx.bm25(q, 10) == [] and idx.ql(q, 10) == []
+        return
+    bm25, ql = BM25(docs), QueryLikelihood(docs)
+    for q in queries:
+        for k in (5, len(docs) + 3):
+            assert idx.bm25(q, k) == [(ids[i], s) for i, s in bm25.query(q, k)]
+            assert idx.ql(q, k) == [(ids[i], s) for i, s in ql.query(q, k)]
+
+@pytest.mark.parametrize('background', [True, False])
+def test_matches_full_rebuild(corpus, queries, tmp_path, background):
+    all_ids, all_docs = corpus.doc_ids, corpus.docs()
+    path = str(tmp_path / 'inc')
+    idx = IncrementalIndex(path, max_segments=3, merge_factor=2, background=background)
+    rng = random.Random(5)
+    truth, pos = {}, 0
+    for step in range(20):
+        if step % 3 != 2 and pos < len(all_ids):
+            n = rng.randint(1, 40)
+            ids, docs = all_ids[pos:pos + n], all_docs[pos:pos + n]
+            pos += n
+            if truth and step % 2:
+                # 更新：已有的 doc id 换成新内容
+                ids = ids + [rng.choice(list(truth))]
+                docs = docs + [all_docs[rng.randrange(len(all_docs))]]
+            idx.add(ids, docs)
+            for i, d in zip(ids, docs):
+                truth.pop(i, None)
+                truth[i] = d
+        else:
+            dels = rng.sample(list(truth), min(len(truth), rng.randint(1, 15)))
+            assert idx.delete(dels + ['不存在']) == len(dels)
+            for i in dels:
+                del truth[i]
+        _check(idx, truth, queries)
+    idx.wait()
+    _check(idx, truth, queries)
+
+    # 从磁盘重新打开：统计量由段累加再减去墓碑，与内存中增量维护的相同
+    reopened = IncrementalIndex(path)
+    st, ref = reopened.stats, idx.stats
+    assert (st.N, st.total_len, st.df, st.cf) == (ref.N, ref.total_len, ref.df, ref.cf)
+    _check(reopened, truth, queries)
+    reopened.merge()
+    assert len(reopened.segments) == 1
+    _check(reopened, truth, queries)
+    _check(IncrementalIndex(path), truth, queries)
+
+def test_everything_deleted(corpus, queries, tmp_path):
+    idx = IncrementalIndex(str(tmp_path / 'inc'), background=False)
+    _check(idx, {}, queries)
+    idx.add(corpus.doc_ids[:10], corpus.docs()[:10])
+    assert idx.delete(corpus.doc_ids[:10]) == 10
+    _check(idx, {}, queries)
+    idx.merge()
+    assert idx.segments == []
+    _check(IncrementalIndex(str(tmp_path / 'inc')), {}, queries)
+
+def test_explicit_merge_during_background_merge(corpus, queries, tmp_path):
+    all_ids, all_docs = corpus.doc_ids, corpus.docs()
+    idx = IncrementalIndex(str(tmp_path / 'inc'), max_segments=2, merge_factor=2)
+    errors = []
+
+    def merge_repeatedly():
+        try:
+            for _ in range(10):
+                idx.merge()
+        except BaseException as e:
+            errors.append(e)
+    t = threading.Thread(target=merge_repeatedly)
+    t.start()
+    # 每次 add 都会让段数超限，触发后台合并，与上面的显式合并交错
+    for a in range(0, len(all_ids), 10):
+        idx.add(all_ids[a:a + 10], all_docs[a:a + 10])
+    t.join()
+    idx.wait()
+    assert errors == []
+    _check(idx, dict(zip(all_ids, all_docs)), queries)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""
+语料读入与分词：多进程分词与串行结果相同；索引缓存在语料或分词配置变化时失效
+"""
+
+import json
+import os
+import shutil
+
+import pytest
+
+from common import TOKENIZERS, config_of
+from index_store import CorpusIndex, cache_key, iter_corpus, load_or_build, read_corpus
+
+@pytest.mark.parametrize('tokenizer', ['raw', 'strip'])
+def test_parallel_tokenization_matches_serial(corpus_jsonl, tokenizer):
+    fn = TOKENIZERS[tokenizer][0]
+    ref = read_corpus(corpus_jsonl, fn, workers=1)
+    assert len(ref[0]) == 200 and any(ref[1])
+    # 块比语料小得多、块数不是 worker 数的倍数，多块同时在途
+    for workers, chunk_size in ((2, 7), (3, 1), (2, 1000)):
+        assert read_corpus(corpus_jsonl, fn, workers, chunk_size) == ref
+        assert list(iter_corpus(corpus_jsonl, fn, workers, chunk_size)) == list(zip(*ref))
+
+# ———— 索引缓存 ————
+class Counting:
+    """
+    串行分词时记下调用次数，用来判断是否命中了缓存
+    """
+    def __init__(self, fn):
+        self.fn = fn
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return self.fn(text)
+
+def _same(a, b):
+    assert a.doc_ids == b.doc_ids
+    assert a.docs() == b.docs()
+
+def test_index_cache_hit(corpus_jsonl, tmp_path):
+    cache = str(tmp_path / 'cache')
+    config = config_of('strip')
+    tok = Counting(TOKENIZERS['strip'][0])
+    built = load_or_build(corpus_jsonl, tok, config, cache_dir=cache, workers=1)
+    assert tok.calls == 200
+    assert os.listdir(cache) == [cache_key(corpus_jsonl, config)]
+    loaded = load_or_build(corpus_jsonl, tok, config, cache_dir=cache, workers=1)
+    assert tok.calls == 200
+    _same(loaded, built)
+    _same(loaded, CorpusIndex.build(*read_corpus(corpus_jsonl, TOKENIZERS['strip'][0], workers=1)))
+
+def test_index_cache_invalidated_by_corpus(corpus_jsonl, tmp_path):
+    cache = str(tmp_path / 'cache')
+    path = str(tmp_path / 'corpus.jsonl')
+    shutil.copy(corpus_jsonl, path)
+    config = config_of('strip')
+    tok = Counting(TOKENIZERS['strip'][0])
+    load_or_build(path, tok, config, cache_dir=cache, workers=1)
+    # 只改一篇的内容：文件路径不变，内容的 sha1 变了
+    with open(path, encoding='utf-8') as f:
+        lines = f.readlines()
+    lines[5] = json.dumps({'name': 'doc5', 'content': '合同纠纷'}, ensure_ascii=False) + '\n'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    tok.calls = 0
+    ci = load_or_build(path, tok, config, cache_dir=cache, workers=1)
+    assert tok.calls == 200
+    assert ci.tokens(5) == TOKENIZERS['strip'][0]('合同纠纷')
+    assert len(os.listdir(cache)) == 2
+
+@pytest.mark.parametrize('changed', [{'name': 'other'}, {'jieba': '0.0'}, {'stopwords': ['的']}])
+def test_index_cache_invalidated_by_tokenizer(corpus_jsonl, tmp_path, changed):
+    cache = str(tmp_path / 'cache')
+    config = config_of('strip')
+    tok = Counting(TOKENIZERS['strip'][0])
+    load_or_build(corpus_jsonl, tok, config, cache_dir=cache, workers=1)
+    tok.calls = 0
+    load_or_build(corpus_jsonl, tok, dict(config, **changed), cache_dir=cache, workers=1)
+    assert tok.calls == 200
+
+def test_index_cache_rebuilt_on_version_mismatch(corpus_jsonl, tmp_path):
+    cache = str(tmp_path / 'cache')
+    config = config_of('raw')
+    tok = Counting(TOKENIZERS['raw'][0])
+    load_or_build(corpus_jsonl, tok, config, cache_dir=cache, workers=1)
+    meta_path = os.path.join(cache, cache_key(corpus_jsonl, config), 'meta.json')
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(meta, version=meta['version'] - 1), f)
+    tok.calls = 0
+    load_or_build(corpus_jsonl, tok, config, cache_dir=cache, workers=1)
+    assert tok.calls == 200
+    with open(meta_path, encoding='utf-8') as f:
+        assert json.load(f)['version'] == meta['version']
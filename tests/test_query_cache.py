@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+查询分词缓存：命中时不再分词、分词配置变了不命中、超过条数上限按最近使用淘汰
+"""
+
+import pytest
+
+from common import config_of
+from make_run import Session
+from query_cache import QueryTokenCache
+
+CONFIG = {'name': 'test', 'jieba': '0', 'stopwords': []}
+
+class Tokenizer:
+    """
+    记下被分词过的文本
+    """
+    def __init__(self):
+        self.seen = []
+
+    def __call__(self, text):
+        self.seen.append(text)
+        return text.split()
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'cache' / 'query_tokens.sqlite')
+
+def test_hit_and_miss(path):
+    texts = ['a b', 'c', 'a b', '中文 查询']
+    want = {t: t.split() for t in texts}
+    tok = Tokenizer()
+    with QueryTokenCache(path) as cache:
+        assert cache.tokenize_all(tok, CONFIG, texts) == want
+        assert (cache.hits, cache.misses) == (0, 3)
+    assert tok.seen == ['a b', 'c', '中文 查询']
+    # 重新打开：全部命中，不再分词
+    tok = Tokenizer()
+    with QueryTokenCache(path) as cache:
+        assert cache.tokenize_all(tok, CONFIG, texts + ['d']) == dict(want, d=['d'])
+        assert (cache.hits, cache.misses) == (3, 1)
+    assert tok.seen == ['d']
+
+@pytest.mark.parametrize('changed', [{'name': 'other'}, {'jieba': '1'}, {'stopwords': ['a']}])
+def test_config_change_misses(path, changed):
+    with QueryTokenCache(path) as cache:
+        cache.tokenize_all(str.split, CONFIG, ['a b'])
+        tok = Tokenizer()
+        assert cache.tokenize_all(tok, dict(CONFIG, **changed), ['a b']) == {'a b': ['a', 'b']}
+        assert tok.seen == ['a b']
+        # 原配置的条目仍在
+        tok = Tokenizer()
+        cache.tokenize_all(tok, CONFIG, ['a b'])
+        assert tok.seen == []
+
+def test_evicts_least_recently_used(path):
+    with QueryTokenCache(path, max_entries=2) as cache:
+        cache.tokenize_all(str.split, CONFIG, ['a'])
+        cache.tokenize_all(str.split, CONFIG, ['b'])
+        cache.tokenize_all(str.split, CONFIG, ['a'])     # a 比 b 新
+        cache.tokenize_all(str.split, CONFIG, ['c'])     # 淘汰 b
+        tok = Tokenizer()
+        cache.tokenize_all(tok, CONFIG, ['a', 'b', 'c'])
+        assert tok.seen == ['b']
+        assert cache.db.execute('SELECT COUNT(*) FROM tokens').fetchone()[0] == 2
+
+def test_session_uses_cache(path, tmp_path):
+    dev, qs = tmp_path / 'dev.txt', tmp_path / 'queries.json'
+    dev.write_text('1\tx\n2\tx\n', encoding='utf-8')
+    qs.write_text('[{"query_id": 1, "问题": "盗窃 罪"}, {"query_id": 2, "问题": "合同"}]', encoding='utf-8')
+    first = Session(dev_txt=str(dev), queries_json=str(qs), query_cache=path).query_tokens('raw')
+    with QueryTokenCache(path) as cache:
+        assert cache.tokenize_all(Tokenizer(), config_of('raw'), list(first)) == first
+        assert cache.misses == 0
+    assert Session(dev_txt=str(dev), queries_json=str(qs), query_cache=None).query_tokens('raw') == first
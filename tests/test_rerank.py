@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""
+候选集重排与全量检索一致；第一阶段候选集缓存；RRF / CombSUM 融合
+"""
+
+import random
+
+import pytest
+
+from evaluate_metrics import load_run
+from rerank import combsum, first_stage, rrf
+
+TOPK = 50
+
+@pytest.mark.parametrize('name', ['bm25p', 'ql', 'bm25', 'tfidf'])
+def test_rerank_matches_full_run(build, queries, name):
+    model = build(name, pruning=False)
+    for q in queries:
+        hits = model.search(q, topk=TOPK)
+        # 候选打乱顺序也不影响结果
+        cands = [d for d, _ in hits]
+        random.Random(len(q)).shuffle(cands)
+        assert model.rescore(q, cands) == hits
+
+def test_first_stage_from_run_file(corpus, run_files, tmp_path):
+    pos = {d: i for i, d in enumerate(corpus.doc_ids)}
+    cache = str(tmp_path / 'candidates')
+    want = {qid: [(pos[d], s) for d, s in hits[:20]] for qid, hits in load_run(run_files.trec).items()}
+    # run 文件没有会话依赖，session 用不到
+    got, hit = first_stage(None, run_files.trec, 20, corpus.doc_ids, pos, cache_dir=cache)
+    assert not hit and list(got) == list(want)
+    for qid, hits in want.items():
+        # 缓存里的分数存为 float32
+        assert [d for d, _ in got[qid]] == [d for d, _ in hits]
+        assert [s for _, s in got[qid]] == pytest.approx([s for _, s in hits], rel=1e-6)
+    # 命中缓存与未命中时得到的结果相同
+    assert first_stage(None, run_files.trec, 20, corpus.doc_ids, pos, cache_dir=cache) == (got, True)
+    # depth 不同是另一份缓存
+    got, hit = first_stage(None, run_files.trec, 5, corpus.doc_ids, pos, cache_dir=cache)
+    assert not hit and all(len(h) <= 5 for h in got.values())
+
+def test_fusion():
+    a = [(3, 9.0), (1, 5.0), (2, 1.0)]
+    b = [(1, 0.7), (4, 0.2)]
+    assert rrf([a, b], k=1) == [(1, 1 / 3 + 1 / 2), (3, 1 / 2), (4, 1 / 3), (2, 1 / 4)]
+    assert combsum([a, b]) == [(1, 0.5 + 1.0), (3, 1.0), (2, 0.0), (4, 0.0)]
+    # 一路里得分全相同时都记 1；空的一路忽略
+    assert combsum([[(5, 2.0), (6, 2.0)], []]) == [(5, 1.0), (6, 1.0)]
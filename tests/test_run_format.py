@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""
+二进制 run 与 TREC 文本互转无损，评测结果与文本 run 相同
+"""
+
+import filecmp
+
+import pytest
+
+from evaluate_metrics import evaluate_run, load_run
+from make_run import K_VALUES
+from run_format import BinaryRun, bin_to_text, is_binary_run, text_to_bin
+
+def _roundtrip(src, tmp_path):
+    binary, text = str(tmp_path / 'run.bin'), str(tmp_path / 'run.txt')
+    text_to_bin(src, binary)
+    assert is_binary_run(binary)
+    bin_to_text(binary, text)
+    return binary, text
+
+def test_runner_output_roundtrips_byte_for_byte(run_files, tmp_path):
+    binary, text = _roundtrip(run_files.trec, tmp_path)
+    assert filecmp.cmp(text, run_files.trec, shallow=False)
+    # runner 直接写出的二进制 run 转回文本也相同
+    bin_to_text(run_files.binary, str(tmp_path / 'direct.txt'))
+    assert filecmp.cmp(str(tmp_path / 'direct.txt'), run_files.trec, shallow=False)
+
+def test_arbitrary_scores_tags_and_order(tmp_path):
+    lines = ["q1 Q0 d1 1 12.3456789 A\n",
+             "q2 Q0 d2 1 0.0000004 B\n",
+             "q1 Q0 d3 2 -1e-07 A\n",          # q1 的行不连续
+             "q2 Q0 d1 3 7 B\n",               # rank 不是 1..n
+             "q3 Q0 doc with space 1 1.500000 A\n"]
+    src = tmp_path / 'odd.run'
+    src.write_text(''.join(lines), encoding='utf-8')
+    binary, text = _roundtrip(str(src), tmp_path)
+    # 按 qid 首次出现的顺序分组，组内保持原顺序，每行原样写回
+    grouped = [lines[0], lines[2], lines[1], lines[3], lines[4]]
+    assert open(text, encoding='utf-8').read() == ''.join(grouped)
+    run = BinaryRun(binary)
+    assert run.qids == ['q1', 'q2', 'q3']
+    assert run.tags == ['A', 'B']
+    assert dict(run.items()) == load_run(str(src))
+
+def test_fixed_point_scores_keep_compact_storage(run_files, tmp_path):
+    binary, _ = _roundtrip(run_files.trec, tmp_path)
+    run = BinaryRun(binary)
+    assert run.score_texts() is None and run.tag_idx is None
+
+def test_binary_run_evaluates_like_text(run_files, tmp_path):
+    binary, _ = _roundtrip(run_files.shuffled, tmp_path)
+    ref = evaluate_run(run_files.qrels, run_files.shuffled, K_VALUES)
+    for stream in (False, True):
+        ev = evaluate_run(run_files.qrels, binary, K_VALUES, stream=stream)
+        assert ev.results() == ref.results()
+        assert ev.per_query == ref.per_query
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+serve.py 的请求校验：坏请求在入队前返回 400，意外错误返回 500，连接不会无回应地断开
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from serve import Batcher, Server
+
+def _run(corpus, model, coro_fn):
+    """
+    在新事件循环里起一个只有 model 的 Server，执行 coro_fn(server)
+    """
+    async def main():
+        batcher = Batcher(model, str.split, corpus.doc_ids, max_wait_ms=0)
+        task = asyncio.create_task(batcher.run())
+        try:
+            return await coro_fn(Server({model.name: batcher}, max_topk=100))
+        finally:
+            task.cancel()
+    return asyncio.run(main())
+
+@pytest.fixture
+def model(build):
+    return build('bm25p')
+
+@pytest.mark.parametrize('req, msg', [
+    ([1, 2], "JSON object"),
+    ({'q': 't1', 'model': ['bm25p']}, "model must be a string"),
+    ({'q': 't1', 'topk': 1e400}, "OverflowError"),
+    ({'q': 't1', 'topk': 'many'}, "ValueError"),
+    ({'q': 't1', 'topk': 0}, "topk must be"),
+    ({'q': 't1', 'model': 'ql'}, "not loaded"),
+    ({'tokens': 't1'}, "list of strings"),
+    ({'q': ['t1']}, "q must be a string"),
+    ({}, "KeyError"),
+])
+def test_bad_requests_get_400(corpus, model, req, msg):
+    # 1e400 在 JSON 里合法，json.loads 解析成 inf
+    body = json.dumps(req).replace('Infinity', '1e400').encode('utf-8')
+    status, obj, _ = _run(corpus, model, lambda srv: srv.dispatch('POST', '/search', body))
+    assert status == 400
+    assert msg in obj['error']
+
+def test_search_matches_model(corpus, model):
+    body = json.dumps({'tokens': ['t1', 't5'], 'topk': 5}).encode('utf-8')
+    status, obj, _ = _run(corpus, model, lambda srv: srv.dispatch('POST', '/search', body))
+    assert status == 200
+    assert obj['hits'] == [(corpus.doc_ids[i], s) for i, s in model.search(['t1', 't5'], topk=5)]
+
+def test_unexpected_error_gets_500(corpus, model):
+    async def go(srv):
+        srv.max_topk = None             # 校验 topk 时抛 TypeError
+        return await srv.dispatch('POST', '/search', b'{"q": "t1"}')
+    status, obj, _ = _run(corpus, model, go)
+    assert status == 500
+    assert 'internal error' in obj['error']
+
+def test_bad_request_is_answered_over_http(corpus, model):
+    async def go(srv):
+        tcp = await asyncio.start_server(srv.handle, '127.0.0.1', 0)
+        port = tcp.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            out = []
+            for body in (b'{"model": ["x"], "q": "t1"}', b'{"q": "t1", "topk": 1e400}',
+                         b'{"q": "t1", "topk": 3}'):
+                writer.write(b"POST /search HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+                head = await reader.readuntil(b'\r\n\r\n')
+                n = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+                out.append((int(head.split(b' ')[1]), json.loads(await reader.readexactly(n))))
+            writer.close()
+            return out
+        finally:
+            tcp.close()
+    out = _run(corpus, model, go)
+    assert [s for s, _ in out] == [400, 400, 200]
+    assert len(out[2][1]['hits']) == 3
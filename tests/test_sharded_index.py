@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+"""
+分片检索（scatter-gather）的结果与单个索引相同
+"""
+
+import os
+import sys
+
+import sharded_index
+from index_store import CorpusIndex
+from retrieval_models import MODELS
+from sharded_index import Coordinator, shard_bounds, spawn_nodes
+
+def test_sharded_matches_single_index(corpus, queries, tmp_path):
+    n = 3
+    bounds = shard_bounds(corpus.N, n)
+    dirs = []
+    for i in range(n):
+        d = str(tmp_path / ('shard_%03d' % i))
+        a, b = bounds[i], bounds[i + 1]
+        part = CorpusIndex.build(corpus.doc_ids[a:b], [corpus.tokens(j) for j in range(a, b)])
+        for tokenizer in ('raw', 'strip'):
+            part.save(os.path.join(d, tokenizer), {
+                'version': sharded_index.FORMAT_VERSION, 'byteorder': sys.byteorder,
+                'source': 'test', 'tokenizer': tokenizer, 'shard': i, 'shards': n,
+                'offset': a, 'total': corpus.N, 'N': b - a})
+        dirs.append(d)
+    procs, addresses = spawn_nodes(dirs, b'test')
+    coord = Coordinator(addresses, b'test')
+    try:
+        for name in ('bm25p', 'ql'):
+            sharded = coord.build(name)
+            ref = MODELS[name](corpus)
+            assert sharded.doc_ids == corpus.doc_ids
+            for k in (10, corpus.N):
+                got = sharded.batch_search(queries, topk=k)
+                assert got == [ref.search(q, topk=k) for q in queries]
+    finally:
+        coord.close(shutdown=True)
+        for p in procs:
+            p.join(10)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+"""
+SPIMI 在内存预算下分块写出的索引与内存中建的索引逐字节相同
+"""
+
+import os
+
+from index_store import CorpusIndex
+from spimi_index import SpimiBuilder
+
+def test_spimi_matches_in_memory_bytes(corpus, tmp_path):
+    docs = corpus.docs()
+    mem, ext = str(tmp_path / 'mem'), str(tmp_path / 'spimi')
+    CorpusIndex.build(corpus.doc_ids, docs).save(mem, {})
+    os.makedirs(ext)
+    # 预算很小，逼出多个块和多轮归并
+    builder = SpimiBuilder(ext, ram_mb=0.01)
+    for doc_id, tokens in zip(corpus.doc_ids, docs):
+        builder.add(doc_id, tokens)
+    report = builder.finish()
+    assert report['blocks'] > 1
+    names = sorted(f for f in os.listdir(mem) if f != 'meta.json')
+    assert sorted(os.listdir(ext)) == names
+    for f in names:
+        with open(os.path.join(mem, f), 'rb') as a, open(os.path.join(ext, f), 'rb') as b:
+            assert a.read() == b.read(), f
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+"""
+numpy 后端与 python 后端的检索结果一致（得分差在 1e-9 以内）
+"""
+
+import pytest
+
+def _close(a, b):
+    """
+    同一组文档、每个名次的得分相差不超过 1e-9（恰好同分的文档可能互换位置）
+    """
+    assert len(a) == len(b)
+    assert {d for d, _ in a} == {d for d, _ in b}
+    for (_, x), (_, y) in zip(a, b):
+        assert x == pytest.approx(y, rel=1e-9, abs=1e-12)
+
+@pytest.mark.parametrize('name', ['bm25p', 'ql', 'bm25'])
+def test_numpy_backend_matches_python(build, corpus, queries, name):
+    pytest.importorskip('scipy')
+    vec = build(name, backend='numpy')
+    ref = build(name, pruning=False)
+    for q in queries:
+        _close(vec.search(q, topk=corpus.N), ref.search(q, topk=corpus.N))
+    for a, q in zip(vec.batch_search(queries, topk=corpus.N), queries):
+        _close(a, ref.search(q, topk=corpus.N))
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+"""
+numpy 评测引擎与默认引擎的结果一致（TREC 文本与二进制 run）
+"""
+
+import pytest
+
+from evaluate_metrics import evaluate_run, load_run
+from make_run import K_VALUES
+
+def test_numpy_eval_matches_python(run_files):
+    pytest.importorskip('numpy')
+    from run_format import BinaryRun
+    from vector_metrics import evaluator_np
+    qrels, trec, binary = run_files.qrels, run_files.trec, run_files.binary
+    ref = evaluate_run(qrels, trec, K_VALUES)
+    for runs in (load_run(trec), BinaryRun(binary)):
+        ev = evaluator_np(qrels, runs, K_VALUES)
+        assert ev.results() == ref.results()
+        assert ev.per_query == ref.per_query
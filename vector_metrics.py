@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+NumPy 向量化评测：与 evaluate_metrics.compute_all 结果逐位一致
+
+所有 query 的排序结果拼成一条 0/1 相关性向量（附每个 query 的起点），
+一次性求出全部相关命中的 query 内名次；P@10、recall@K 由名次数组直接计数，
+不再逐个检索结果比较 docid。
+AP 和每个 query 至多 10 项的 nDCG@10 仍按原顺序用 Python 浮点累加
+（AP 直接调用 evaluate_metrics.average_precision），保证与逐行实现的舍入完全相同；
+这部分的规模是 num_rel_ret，而不是 num_ret。汇总值同样由 per_query 求平均（summarize）。
+"""
+
+import math
+import numpy as np
+from evaluate_metrics import Evaluator, average_precision
+from run_format import BinaryRun
+
+def _gains_from_dict(qrels, runs):
+    """
+    runs: qid -> [(docid, score)]
+    返回 (qid 列表, 每个 query 的长度, 拼接后的 0/1 向量, 每个 query 的前 10 个 docid)
+    """
+    qids, lens, flags, top10 = [], [], [], []
+    for qid, retrieved in runs.items():
+        rel_docs = {d for d,r in qrels.get(qid,{}).items() if r>0}
+        qids.append(qid)
+        if not rel_docs:
+            lens.append(0)
+            top10.append(None)
+            continue
+        lens.append(len(retrieved))
+        flags.extend([d in rel_docs for d,_ in retrieved])
+        top10.append([d for d,_ in retrieved[:10]])
+    return qids, np.array(lens, dtype=np.int64), np.array(flags, dtype=bool), top10
+
+def _gains_from_binary(qrels, run):
+    """
+    二进制 run：按整数 docid 下标一次性 np.isin，不逐行比较字符串
+    """
+    nq = len(run.qids)
+    q_off = np.frombuffer(run.q_off, dtype=np.int64)
+    doc_idx = np.frombuffer(run.doc_idx, dtype=np.int32).astype(np.int64)
+    sizes = np.diff(q_off)
+    q_of_hit = np.repeat(np.arange(nq, dtype=np.int64), sizes)
+    if run.ranks is not None:
+        ranks = np.frombuffer(run.ranks, dtype=np.int32)
+        doc_idx = doc_idx[np.lexsort((ranks, q_of_hit))]
+
+    table = {d: i for i, d in enumerate(run.docids)}
+    D = max(len(table), 1)
+    rel_keys, has_rel = [], np.zeros(nq, dtype=bool)
+    for qi, qid in enumerate(run.qids):
+        for d, r in qrels.get(qid, {}).items():
+            if r > 0:
+                has_rel[qi] = True
+                if d in table:
+                    rel_keys.append(qi * D + table[d])
+    keep = has_rel[q_of_hit]
+    flags = np.isin(q_of_hit[keep] * D + doc_idx[keep], np.array(rel_keys, dtype=np.int64))
+    lens = np.where(has_rel, sizes, 0)
+
+    top10 = []
+    for qi in range(nq):
+        if not has_rel[qi]:
+            top10.append(None)
+            continue
+        a = q_off[qi]
+        top10.append([run.docids[i] for i in doc_idx[a:a + min(10, sizes[qi])]])
+    return list(run.qids), lens, flags, top10
+
+def compute_all_np(qrels, runs, Ks):
+    """
+    runs 为 evaluate_metrics.load_run 的 dict，或 run_format.BinaryRun
+    """
+    return evaluator_np(qrels, runs, Ks).results()
+
+def evaluator_np(qrels, runs, Ks):
+    """
+    返回填好的 evaluate_metrics.Evaluator（含 per_query）
+    """
+    if isinstance(runs, BinaryRun):
+        qids, lens, G, top10 = _gains_from_binary(qrels, runs)
+    else:
+        qids, lens, G, top10 = _gains_from_dict(qrels, runs)
+
+    ev = Evaluator(qrels, Ks)
+    ev.num_q = len(qids)
+    off = np.concatenate(([0], np.cumsum(lens)))
+
+    # 全部相关命中：全局下标、所属 query、query 内名次 (1 起)
+    pos = np.flatnonzero(G)
+    q_of = np.searchsorted(off, pos, side='right') - 1
+    idx = pos - off[q_of] + 1
+    q_start = np.searchsorted(pos, off[:-1])                    # 每个 query 的相关命中区间
+    q_end = np.searchsorted(pos, off[1:])
+
+    rel_count = {qid: sum(1 for r in qrels.get(qid,{}).values() if r>0) for qid in qids}
+    for qi, qid in enumerate(qids):
+        total_rel = rel_count[qid]
+        if total_rel == 0:
+            continue
+        a, b = int(q_start[qi]), int(q_end[qi])
+        ev.num_ret += int(lens[qi])
+        ev.num_rel += total_rel
+        ev.num_rel_ret += b - a
+        ranks = idx[a:b]
+
+        # nDCG@10
+        grades = qrels[qid]
+        idcg = 0.0
+        for i, rg in enumerate(sorted(grades.values(), reverse=True)[:10], start=1):
+            idcg += (2**rg - 1)/math.log2(i+1)
+        dcg = 0.0
+        for i, d in enumerate(top10[qi], start=1):
+            rg = grades.get(d,0)
+            dcg += (2**rg - 1)/math.log2(i+1)
+
+        pq = {
+            'map': average_precision(ranks.tolist(), total_rel),
+            'P_10': int(np.count_nonzero(ranks <= 10))/10,
+            'recip_rank': 1/int(ranks[0]) if b > a else 0.0,
+            'ndcg_cut_10': dcg/(idcg if idcg>0 else 1),
+        }
+        for K in Ks:
+            pq[f'recall_{K}'] = int(np.count_nonzero(ranks <= K))/total_rel
+        ev.per_query[qid] = pq
+
+    return ev